@@ -0,0 +1,299 @@
+"""
+Mergeable one-pass accumulators for streaming statistics.
+
+Each accumulator takes values one at a time with add() and keeps a small,
+fixed amount of state, so it can consume a generator of any length.
+Accumulators of the same kind can be combined with merge(): statistics
+gathered separately per chunk or per worker process, then merged, are
+the same as if every value had been added to a single accumulator (up to
+float rounding for the moments; see QuantileSketch for its error bound).
+"""
+
+import math
+
+
+class RunningStats:
+    """
+    Count, total, mean, variance, min and max in one pass (Welford).
+
+    The mean is the exact running total divided by the count. The
+    variance uses Welford's update, which stays accurate where the naive
+    sum-of-squares formula loses precision on large values.
+
+    Example:
+        stats = RunningStats()
+        for calories in stream:
+            stats.add(calories)
+        stats.mean, stats.stdev
+    """
+
+    __slots__ = ('count', 'total', 'minimum', 'maximum', '_mean', '_m2')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.minimum = None
+        self.maximum = None
+        self._mean = 0.0
+        self._m2 = 0.0
+
+    def add(self, value):
+        """Add one value."""
+        self.count += 1
+        self.total += value
+        delta = value - self._mean
+        self._mean += delta / self.count
+        self._m2 += delta * (value - self._mean)
+        if self.minimum is None or value < self.minimum:
+            self.minimum = value
+        if self.maximum is None or value > self.maximum:
+            self.maximum = value
+
+    def remove(self, value):
+        """
+        Take back a value added earlier, e.g. when a day is revised.
+
+        The count, total, mean and variance are restored exactly as if
+        the value had never been added. The minimum and maximum can't be
+        recovered, so they are cleared to None.
+        """
+        self.count -= 1
+        self.total -= value
+        self.minimum = self.maximum = None
+        if self.count == 0:
+            self._mean = self._m2 = 0.0
+            return
+        delta = value - self._mean
+        self._mean -= delta / self.count
+        self._m2 -= delta * (value - self._mean)
+
+    def merge(self, other):
+        """Fold another RunningStats into this one (Chan et al.). Returns self."""
+        if other.count == 0:
+            return self
+        if self.count == 0:
+            for name in self.__slots__:
+                setattr(self, name, getattr(other, name))
+            return self
+        count = self.count + other.count
+        delta = other._mean - self._mean
+        self._m2 += other._m2 + delta * delta * self.count * other.count / count
+        self._mean += delta * other.count / count
+        self.count = count
+        self.total += other.total
+        # Unknown (None) after a remove() on either side stays unknown
+        if self.minimum is not None and other.minimum is not None:
+            self.minimum = min(self.minimum, other.minimum)
+            self.maximum = max(self.maximum, other.maximum)
+        else:
+            self.minimum = self.maximum = None
+        return self
+
+    def to_dict(self):
+        """The accumulator's state as a JSON-serializable dict."""
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, state):
+        """Rebuild an accumulator saved with to_dict()."""
+        accumulator = cls()
+        for name in cls.__slots__:
+            setattr(accumulator, name, state[name])
+        return accumulator
+
+    @property
+    def mean(self):
+        """Mean of the values, or None if there are none."""
+        return self.total / self.count if self.count else None
+
+    @property
+    def variance(self):
+        """Sample variance, or None with fewer than two values."""
+        return self._m2 / (self.count - 1) if self.count > 1 else None
+
+    @property
+    def stdev(self):
+        """Sample standard deviation, or None with fewer than two values."""
+        variance = self.variance
+        return None if variance is None else math.sqrt(variance)
+
+
+class RunningCovariance:
+    """
+    Pearson correlation of (x, y) pairs in one pass, via the co-moment.
+
+    Keeps the count, both means, both second moments and the co-moment
+    sum((x - mean_x) * (y - mean_y)), all updated Welford-style.
+    """
+
+    __slots__ = ('count', '_mean_x', '_mean_y', '_m2_x', '_m2_y', '_co_moment')
+
+    def __init__(self):
+        self.count = 0
+        self._mean_x = self._mean_y = 0.0
+        self._m2_x = self._m2_y = self._co_moment = 0.0
+
+    def add(self, x, y):
+        """Add one (x, y) pair."""
+        self.count += 1
+        delta_x = x - self._mean_x
+        self._mean_x += delta_x / self.count
+        delta_y = y - self._mean_y
+        self._mean_y += delta_y / self.count
+        self._m2_x += delta_x * (x - self._mean_x)
+        self._m2_y += delta_y * (y - self._mean_y)
+        self._co_moment += delta_x * (y - self._mean_y)
+
+    def remove(self, x, y):
+        """Take back a pair added earlier (Welford's update in reverse)."""
+        self.count -= 1
+        if self.count == 0:
+            self._mean_x = self._mean_y = 0.0
+            self._m2_x = self._m2_y = self._co_moment = 0.0
+            return
+        delta_x = x - self._mean_x
+        delta_y = y - self._mean_y
+        self._mean_x -= delta_x / self.count
+        self._mean_y -= delta_y / self.count
+        self._m2_x -= delta_x * (x - self._mean_x)
+        self._m2_y -= delta_y * (y - self._mean_y)
+        self._co_moment -= (x - self._mean_x) * delta_y
+
+    def merge(self, other):
+        """Fold another RunningCovariance into this one. Returns self."""
+        if other.count == 0:
+            return self
+        if self.count == 0:
+            for name in self.__slots__:
+                setattr(self, name, getattr(other, name))
+            return self
+        count = self.count + other.count
+        delta_x = other._mean_x - self._mean_x
+        delta_y = other._mean_y - self._mean_y
+        weight = self.count * other.count / count
+        self._m2_x += other._m2_x + delta_x * delta_x * weight
+        self._m2_y += other._m2_y + delta_y * delta_y * weight
+        self._co_moment += other._co_moment + delta_x * delta_y * weight
+        self._mean_x += delta_x * other.count / count
+        self._mean_y += delta_y * other.count / count
+        self.count = count
+        return self
+
+    def to_dict(self):
+        """The accumulator's state as a JSON-serializable dict."""
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, state):
+        """Rebuild an accumulator saved with to_dict()."""
+        accumulator = cls()
+        for name in cls.__slots__:
+            setattr(accumulator, name, state[name])
+        return accumulator
+
+    @property
+    def covariance(self):
+        """Sample covariance, or None with fewer than two pairs."""
+        return self._co_moment / (self.count - 1) if self.count > 1 else None
+
+    @property
+    def correlation(self):
+        """Pearson correlation, or None if undefined (as pearson_correlation())."""
+        if self.count < 2 or self._m2_x <= 0 or self._m2_y <= 0:
+            return None
+        return self._co_moment / math.sqrt(self._m2_x * self._m2_y)
+
+
+class QuantileSketch:
+    """
+    Mergeable streaming quantile sketch (a simplified KLL sketch).
+
+    Values are kept in levels of buffers; an item at level h stands for
+    2**h original values. When a level's buffer is full it is sorted and
+    every other item is promoted to the next level, halving its size.
+    Higher levels get larger buffers, so total memory is O(k) however
+    many values are added.
+
+    Up to k values nothing is compacted and quantiles are exact. Beyond
+    that the rank error is roughly 1/k of the count (about 0.5% for the
+    default k=200). Compaction alternates between keeping the odd and the
+    even items, so results are deterministic.
+
+    Merging concatenates the buffers level by level and compacts, which
+    gives a sketch of the combined stream with the same error bound.
+    """
+
+    __slots__ = ('k', 'count', 'levels', '_offset')
+
+    def __init__(self, k=200):
+        self.k = k
+        self.count = 0
+        self.levels = [[]]
+        self._offset = 0
+
+    def add(self, value):
+        """Add one value."""
+        self.levels[0].append(value)
+        self.count += 1
+        if len(self.levels[0]) >= self._capacity(0):
+            self._compact()
+
+    def merge(self, other):
+        """Fold another QuantileSketch into this one. Returns self."""
+        while len(self.levels) < len(other.levels):
+            self.levels.append([])
+        for level, items in enumerate(other.levels):
+            self.levels[level].extend(items)
+        self.count += other.count
+        self._compact()
+        return self
+
+    def to_dict(self):
+        """The sketch's state as a JSON-serializable dict."""
+        return {'k': self.k, 'count': self.count, 'levels': self.levels, 'offset': self._offset}
+
+    @classmethod
+    def from_dict(cls, state):
+        """Rebuild a sketch saved with to_dict()."""
+        sketch = cls(state['k'])
+        sketch.count = state['count']
+        sketch.levels = [list(items) for items in state['levels']]
+        sketch._offset = state['offset']
+        return sketch
+
+    def _capacity(self, level):
+        # The top level holds k items; each level below 2/3 as many
+        depth = len(self.levels) - level - 1
+        return max(2, int(self.k * (2 / 3) ** depth))
+
+    def _compact(self):
+        level = 0
+        while level < len(self.levels):
+            items = self.levels[level]
+            if len(items) >= self._capacity(level):
+                if level + 1 == len(self.levels):
+                    self.levels.append([])
+                items.sort()
+                # With an odd count, one item stays behind at this level
+                keep = items.pop() if len(items) % 2 else None
+                self.levels[level + 1].extend(items[self._offset::2])
+                self._offset ^= 1
+                self.levels[level] = [] if keep is None else [keep]
+            level += 1
+
+    def quantile(self, q):
+        """
+        Value at quantile q (0..1): the smallest value with at least a
+        q share of all values at or below it. None if empty.
+        """
+        if not self.count:
+            return None
+        weighted = sorted((value, 1 << level) for level, items in enumerate(self.levels) for value in items)
+        total = sum(weight for _, weight in weighted)
+        target = q * total
+        seen = 0
+        for value, weight in weighted:
+            seen += weight
+            if seen >= target:
+                return value
+        return weighted[-1][0]
@@ -1,45 +1,434 @@
-def calculate_correlations(merged_data):
+from bisect import bisect_left
+from collections import deque
+from datetime import date
+from itertools import accumulate
+import math
+
+from accumulators import QuantileSketch, RunningCovariance, RunningStats
+
+
+# Sleep-hour cutoffs for threshold sweeps: 4.0 to 9.0 in 0.25 steps
+DEFAULT_THRESHOLDS = [4.0 + 0.25 * i for i in range(21)]
+
+# Daily series that rolling_averages() smooths, and its window lengths in days
+ROLLING_FIELDS = ('sleep_hours', 'total_calories', 'workout_time')
+DEFAULT_WINDOWS = (7, 30)
+
+
+def calculate_correlations(merged_data, low_sleep_threshold=6.0):
     """
     Calculate the main metric for the challenge:
     Average calories burned on days where sleep < 6 hours
     
+    The cutoff can be changed with low_sleep_threshold. merged_data can
+    be any iterable of merged days, including a generator: it is read
+    once, by a SummaryAccumulator. For raw numbers over many cutoffs at
+    once, use threshold_sweep() instead.
     """
-    results = {}
+    summary = SummaryAccumulator(low_sleep_threshold)
+    summary.update(merged_data)
+    return summary.results()
+
+
+class SummaryAccumulator:
+    """
+    One-pass, mergeable summary of merged days.
     
-    # Filter to only days that have both sleep and workout data
-    complete_days = []
-    for day in merged_data:
-        if day['sleep_hours'] is not None and day['total_calories'] > 0:
-            complete_days.append(day)
+    Only days that have both sleep and workout data count, as in
+    calculate_correlations(). Each add() updates running statistics of
+    calories on low-sleep and normal-sleep days, the sleep/calorie
+    co-moment and a calorie quantile sketch. Nothing is stored per day.
+    
+    Summaries built separately, e.g. one per chunk of days or per
+    worker, can be combined with merge(); the result is the same as one
+    accumulator fed every day.
+    
+    A day can also be taken back with remove(), so a summary can follow
+    days that change (see watch.py). The quantile sketch can't forget
+    values, so that needs quantiles=False, which leaves out the median
+    and p90.
+    
+    Example:
+        summary = SummaryAccumulator()
+        summary.update(iter_merge_columns(sleep, workouts))
+        summary.results()     # calculate_correlations() output
+        summary.statistics()  # raw numbers
+    """
+    
+    def __init__(self, low_sleep_threshold=6.0, quantiles=True):
+        self.low_sleep_threshold = low_sleep_threshold
+        # Every day added, including ones without both kinds of data
+        self.days_seen = 0
+        self.low_sleep = RunningStats()
+        self.normal_sleep = RunningStats()
+        self.sleep_calories = RunningCovariance()
+        self.calories = QuantileSketch() if quantiles else None
+    
+    def add(self, day):
+        """Add one merged day."""
+        self.days_seen += 1
+        hours = day['sleep_hours']
+        calories = day['total_calories']
+        if hours is None or calories <= 0:
+            return
+        if hours < self.low_sleep_threshold:
+            self.low_sleep.add(calories)
+        else:
+            self.normal_sleep.add(calories)
+        self.sleep_calories.add(hours, calories)
+        if self.calories is not None:
+            self.calories.add(calories)
+    
+    def remove(self, day):
+        """
+        Take back a day added earlier (with the same values).
+        
+        Raises:
+            ValueError: If the summary keeps a quantile sketch
+        """
+        if self.calories is not None:
+            raise ValueError("Quantile sketches can't remove values; use SummaryAccumulator(quantiles=False)")
+        self.days_seen -= 1
+        hours = day['sleep_hours']
+        calories = day['total_calories']
+        if hours is None or calories <= 0:
+            return
+        if hours < self.low_sleep_threshold:
+            self.low_sleep.remove(calories)
+        else:
+            self.normal_sleep.remove(calories)
+        self.sleep_calories.remove(hours, calories)
+    
+    def update(self, days):
+        """Add every day from an iterable. Returns self."""
+        for day in days:
+            self.add(day)
+        return self
+    
+    def merge(self, other):
+        """
+        Fold in another summary with the same threshold. Returns self.
+        
+        Raises:
+            ValueError: If the thresholds differ
+        """
+        if other.low_sleep_threshold != self.low_sleep_threshold:
+            raise ValueError("Can't merge summaries with different low-sleep thresholds")
+        self.days_seen += other.days_seen
+        self.low_sleep.merge(other.low_sleep)
+        self.normal_sleep.merge(other.normal_sleep)
+        self.sleep_calories.merge(other.sleep_calories)
+        if self.calories is not None and other.calories is not None:
+            self.calories.merge(other.calories)
+        else:
+            self.calories = None
+        return self
     
-    # Separate days with low sleep (< 6 hours)
-    low_sleep_days = []
-    for day in complete_days:
-        if day['sleep_hours'] < 6.0:
-            low_sleep_days.append(day)
+    def to_dict(self):
+        """The summary's state as a JSON-serializable dict (see rollup.py)."""
+        return {
+            'low_sleep_threshold': self.low_sleep_threshold,
+            'days_seen': self.days_seen,
+            'low_sleep': self.low_sleep.to_dict(),
+            'normal_sleep': self.normal_sleep.to_dict(),
+            'sleep_calories': self.sleep_calories.to_dict(),
+            'calories': None if self.calories is None else self.calories.to_dict(),
+        }
+    
+    @classmethod
+    def from_dict(cls, state):
+        """Rebuild a summary saved with to_dict()."""
+        summary = cls(state['low_sleep_threshold'], quantiles=state['calories'] is not None)
+        summary.days_seen = state['days_seen']
+        summary.low_sleep = RunningStats.from_dict(state['low_sleep'])
+        summary.normal_sleep = RunningStats.from_dict(state['normal_sleep'])
+        summary.sleep_calories = RunningCovariance.from_dict(state['sleep_calories'])
+        if state['calories'] is not None:
+            summary.calories = QuantileSketch.from_dict(state['calories'])
+        return summary
+    
+    def results(self):
+        """The calculate_correlations() dict for the days added so far."""
+        return correlation_results(self.low_sleep.count, self.low_sleep.mean,
+                                   self.normal_sleep.count, self.normal_sleep.mean, self.low_sleep_threshold)
+    
+    def statistics(self):
+        """
+        Raw numbers for the days added so far.
+        
+        Returns:
+            dict: 'day_count', 'mean_calories', 'stdev_calories',
+                'median_calories', 'p90_calories' (from the sketch, None
+                without one), 'pearson'
+                (sleep hours vs calories), and count/mean for low and
+                normal sleep days; values are None when undefined
+        """
+        all_days = RunningStats().merge(self.low_sleep).merge(self.normal_sleep)
+        return {
+            'day_count': all_days.count,
+            'mean_calories': all_days.mean,
+            'stdev_calories': all_days.stdev,
+            'median_calories': None if self.calories is None else self.calories.quantile(0.5),
+            'p90_calories': None if self.calories is None else self.calories.quantile(0.9),
+            'pearson': self.sleep_calories.correlation,
+            'low_sleep_day_count': self.low_sleep.count,
+            'mean_calories_on_low_sleep_days': self.low_sleep.mean,
+            'normal_sleep_day_count': self.normal_sleep.count,
+            'mean_calories_on_normal_sleep_days': self.normal_sleep.mean,
+        }
+
+
+def correlation_results(low_sleep_count, low_sleep_mean, normal_sleep_count, normal_sleep_mean,
+                        low_sleep_threshold=6.0):
+    """
+    Format the calculate_correlations() dict from per-group day counts
+    and mean calories, however they were computed (e.g. by SQL, see
+    sqlite_store.py).
+    """
+    results = {}
+    cutoff = f"{low_sleep_threshold:g}"
     
     # Calculate average calories for low sleep days
-    if low_sleep_days:
-        avg_calories = sum(d['total_calories'] for d in low_sleep_days) / len(low_sleep_days)
-        results['avg_calories_on_low_sleep_days'] = f"{avg_calories:.2f} calories"
-        results['low_sleep_day_count'] = len(low_sleep_days)
+    if low_sleep_count:
+        results['avg_calories_on_low_sleep_days'] = f"{low_sleep_mean:.2f} calories"
+        results['low_sleep_day_count'] = low_sleep_count
     else:
-        results['avg_calories_on_low_sleep_days'] = "No days with < 6 hours sleep"
+        results['avg_calories_on_low_sleep_days'] = f"No days with < {cutoff} hours sleep"
         results['low_sleep_day_count'] = 0
     
-    # Separate days with normal sleep (>= 6 hours) for comparison
-    normal_sleep_days = [
-        day for day in complete_days 
-        if day['sleep_hours'] >= 6.0
-    ]
-    
-    # Calculate average calories for normal sleep days
-    if normal_sleep_days:
-        avg_calories = sum(d['total_calories'] for d in normal_sleep_days) / len(normal_sleep_days)
-        results['avg_calories_on_normal_sleep_days'] = f"{avg_calories:.2f} calories"
-        results['normal_sleep_day_count'] = len(normal_sleep_days)
+    # Calculate average calories for normal sleep days, for comparison
+    if normal_sleep_count:
+        results['avg_calories_on_normal_sleep_days'] = f"{normal_sleep_mean:.2f} calories"
+        results['normal_sleep_day_count'] = normal_sleep_count
     else:
-        results['avg_calories_on_normal_sleep_days'] = "No days with >= 6 hours sleep"
+        results['avg_calories_on_normal_sleep_days'] = f"No days with >= {cutoff} hours sleep"
         results['normal_sleep_day_count'] = 0
     
-    return results
\ No newline at end of file
+    return results
+
+
+def sleep_calorie_arrays(merged_data):
+    """
+    Extract parallel sleep-hour and calorie lists from merged days.
+    
+    Only days that have both sleep and workout data are kept, the same
+    filter calculate_correlations() uses.
+    
+    Returns:
+        tuple: (sleep_hours, calories) lists of equal length
+    """
+    sleep_hours = []
+    calories = []
+    for day in merged_data:
+        if day['sleep_hours'] is not None and day['total_calories'] > 0:
+            sleep_hours.append(day['sleep_hours'])
+            calories.append(day['total_calories'])
+    return sleep_hours, calories
+
+
+def threshold_sweep(sleep_hours, calories, thresholds):
+    """
+    Average calories below and at-or-above each sleep-hour threshold.
+    
+    Days are sorted by sleep hours once and calories are turned into
+    prefix and suffix sums, so each threshold is a single bisect:
+    O(n log n + t log n) instead of one pass over the days per threshold.
+    
+    Args:
+        sleep_hours (sequence): Sleep hours per day
+        calories (sequence): Calories burned on the same days
+        thresholds (iterable): Sleep-hour cutoffs; a day is low sleep
+            when sleep_hours < threshold
+    
+    Returns:
+        list: One dict per threshold with 'threshold',
+            'low_sleep_day_count', 'avg_calories_on_low_sleep_days',
+            'normal_sleep_day_count' and 'avg_calories_on_normal_sleep_days'
+            (averages are None when there are no such days)
+    """
+    order = sorted(range(len(sleep_hours)), key=sleep_hours.__getitem__)
+    sorted_hours = [sleep_hours[i] for i in order]
+    sorted_calories = [calories[i] for i in order]
+    
+    # prefix[k] = calories of the k lowest-sleep days, suffix[k] = the rest
+    prefix = [0, *accumulate(sorted_calories)]
+    suffix = [*accumulate(reversed(sorted_calories), initial=0)][::-1]
+    total_days = len(sorted_hours)
+    
+    sweep = []
+    for threshold in thresholds:
+        low = bisect_left(sorted_hours, threshold)
+        normal = total_days - low
+        sweep.append({
+            'threshold': threshold,
+            'low_sleep_day_count': low,
+            'avg_calories_on_low_sleep_days': prefix[low] / low if low else None,
+            'normal_sleep_day_count': normal,
+            'avg_calories_on_normal_sleep_days': suffix[low] / normal if normal else None,
+        })
+    return sweep
+
+
+def pearson_correlation(x, y):
+    """Pearson correlation of two equal-length sequences, or None if undefined."""
+    n = len(x)
+    if n < 2:
+        return None
+    mean_x = sum(x) / n
+    mean_y = sum(y) / n
+    cov = sum((a - mean_x) * (b - mean_y) for a, b in zip(x, y))
+    var_x = sum((a - mean_x) ** 2 for a in x)
+    var_y = sum((b - mean_y) ** 2 for b in y)
+    if var_x == 0 or var_y == 0:
+        return None
+    return cov / math.sqrt(var_x * var_y)
+
+
+def spearman_correlation(x, y):
+    """Spearman rank correlation (ties get their average rank), or None."""
+    return pearson_correlation(_ranks(x), _ranks(y))
+
+
+def _ranks(values):
+    """1-based ranks of values, with tied values sharing their average rank."""
+    order = sorted(range(len(values)), key=values.__getitem__)
+    ranks = [0.0] * len(values)
+    start = 0
+    while start < len(order):
+        end = start
+        while end + 1 < len(order) and values[order[end + 1]] == values[order[start]]:
+            end += 1
+        rank = (start + end) / 2 + 1
+        for i in range(start, end + 1):
+            ranks[order[i]] = rank
+        start = end + 1
+    return ranks
+
+
+def sleep_calorie_analysis(sleep_hours, calories, thresholds=DEFAULT_THRESHOLDS):
+    """
+    Everything a sleep-vs-calories chart needs, as raw numbers, in one call.
+    
+    Args:
+        sleep_hours (sequence): Sleep hours per day
+        calories (sequence): Calories burned on the same days
+        thresholds (iterable): Sleep-hour cutoffs for the sweep
+    
+    Returns:
+        dict: 'day_count', 'pearson', 'spearman' and 'sweep' (the
+            threshold_sweep() result)
+    """
+    return {
+        'day_count': len(sleep_hours),
+        'pearson': pearson_correlation(sleep_hours, calories),
+        'spearman': spearman_correlation(sleep_hours, calories),
+        'sweep': threshold_sweep(sleep_hours, calories, thresholds),
+    }
+
+
+def rolling_averages(merged_data, windows=DEFAULT_WINDOWS, fields=ROLLING_FIELDS):
+    """
+    Rolling averages of daily values over calendar-day windows.
+    
+    A 7-day window for a day covers that day and the 6 calendar days
+    before it. Missing days (dates absent from merged_data, i.e. no
+    sleep or workout data was exported) are skipped rather than counted
+    as zeros, and so is a day whose value is None (no sleep record).
+    Each average is over the days in the window that have a value.
+    
+    Every (field, window) pair keeps a running sum and a queue of the
+    values inside the window. Each day is added once and dropped once,
+    so the whole series takes O(days) time whatever the window lengths.
+    
+    Args:
+        merged_data (list): merge_datasets() output, sorted by date
+        windows (iterable): Window lengths in days
+        fields (iterable): Daily values to average
+    
+    Returns:
+        list: One dict per day with 'date', 'days_<w>d' (days with data in
+            the window) and '<field>_<w>d' (the average, or None when no
+            day in the window has a value)
+    
+    Raises:
+        ValueError: If a window is shorter than one day
+    """
+    windows = list(windows)
+    for window in windows:
+        if window < 1:
+            raise ValueError(f"Rolling windows must be at least 1 day long, not {window}")
+    fields = list(fields)
+    # Per window: the ordinals of the days inside it, and per field the
+    # (ordinal, value) pairs inside it plus their running sum
+    days = {window: deque() for window in windows}
+    values = {(field, window): deque() for field in fields for window in windows}
+    sums = dict.fromkeys(values, 0)
+    
+    rolling = []
+    for day in merged_data:
+        today = date.fromisoformat(day['date']).toordinal()
+        row = {'date': day['date']}
+        for window in windows:
+            oldest = today - window + 1
+            queue = days[window]
+            queue.append(today)
+            while queue[0] < oldest:
+                queue.popleft()
+            row[f'days_{window}d'] = len(queue)
+            
+            for field in fields:
+                key = (field, window)
+                queue = values[key]
+                if day[field] is not None:
+                    queue.append((today, day[field]))
+                    sums[key] += day[field]
+                while queue and queue[0][0] < oldest:
+                    sums[key] -= queue.popleft()[1]
+                if not queue:
+                    # Drop any float rounding left over by the subtractions
+                    sums[key] = 0
+                row[f'{field}_{window}d'] = sums[key] / len(queue) if queue else None
+        rolling.append(row)
+    return rolling
+
+
+def low_sleep_streaks(merged_data, low_sleep_threshold=6.0):
+    """
+    Runs of consecutive calendar days with less than low_sleep_threshold hours of sleep.
+    
+    A missing day, or a day without a sleep record, ends a streak: it
+    isn't known to be a low-sleep day. Linear in the number of days.
+    
+    Args:
+        merged_data (list): merge_datasets() output, sorted by date
+        low_sleep_threshold (float): A day is low sleep when
+            sleep_hours < low_sleep_threshold
+    
+    Returns:
+        list: One dict per streak, in date order, with 'start' and 'end'
+            (ISO dates) and 'length' in days
+    """
+    streaks = []
+    start = previous = None
+    for day in merged_data:
+        hours = day['sleep_hours']
+        today = date.fromisoformat(day['date']).toordinal()
+        if hours is None or hours >= low_sleep_threshold:
+            continue
+        if previous is not None and today == previous + 1:
+            previous = today
+            continue
+        if start is not None:
+            streaks.append(_streak(start, previous))
+        start = previous = today
+    if start is not None:
+        streaks.append(_streak(start, previous))
+    return streaks
+
+
+def _streak(start, end):
+    return {
+        'start': date.fromordinal(start).isoformat(),
+        'end': date.fromordinal(end).isoformat(),
+        'length': end - start + 1,
+    }
@@ -0,0 +1,136 @@
+"""
+Multi-user batch processing.
+
+Runs the full load -> normalize -> merge -> analyze pipeline for many
+users from one manifest, spreading users across a process pool so a
+nightly run pays interpreter startup once instead of once per user.
+"""
+
+import csv
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from analyzer import calculate_correlations
+from loader import iter_json_records
+from merger import merge_datasets
+from normalizer import normalize_to_columns
+
+
+# Columns every manifest entry must have
+MANIFEST_FIELDS = ('user_id', 'sleep_file', 'workouts_file', 'timezone')
+
+# Column order for CSV output
+RESULT_FIELDS = (
+    'user_id', 'status', 'error', 'day_count',
+    'avg_calories_on_low_sleep_days', 'low_sleep_day_count',
+    'avg_calories_on_normal_sleep_days', 'normal_sleep_day_count',
+)
+
+
+def read_manifest(path):
+    """
+    Read a batch manifest.
+
+    A .csv file needs a header row with the MANIFEST_FIELDS columns; any
+    other file is read as a JSON array or NDJSON of objects with those keys.
+
+    Returns:
+        list: One dict per user
+
+    Raises:
+        ValueError: If an entry is missing one of the required fields
+    """
+    if path.lower().endswith('.csv'):
+        with open(path, newline='') as f:
+            entries = list(csv.DictReader(f))
+    else:
+        entries = list(iter_json_records(path))
+
+    for line, entry in enumerate(entries, start=1):
+        missing = [field for field in MANIFEST_FIELDS if not entry.get(field)]
+        if missing:
+            raise ValueError(f"Manifest entry {line} is missing: {', '.join(missing)}")
+    return entries
+
+
+def process_user(entry):
+    """
+    Run the pipeline for one manifest entry.
+
+    Never raises: any failure is reported in the returned row, so one
+    bad user can't take down the rest of the batch.
+
+    Returns:
+        dict: 'user_id' and 'status' ('ok' or 'error'), plus either the
+            calculate_correlations() metrics and 'day_count', or 'error'
+    """
+    try:
+        sleep = normalize_to_columns(iter_json_records(entry['sleep_file']), 'UTC')
+        workouts = normalize_to_columns(iter_json_records(entry['workouts_file']), entry['timezone'])
+        merged = merge_datasets(sleep, workouts)
+        result = {'user_id': entry['user_id'], 'status': 'ok', 'day_count': len(merged)}
+        result.update(calculate_correlations(merged))
+        return result
+    except Exception as e:
+        return {'user_id': entry['user_id'], 'status': 'error', 'error': f"{type(e).__name__}: {e}"}
+
+
+def run_batch(entries, workers=None, chunk_size=8):
+    """
+    Process manifest entries across a process pool.
+
+    Entries are sent to workers in chunks of chunk_size to cut down on
+    inter-process round trips. Results come back in manifest order as
+    they finish, so they can be written out incrementally.
+
+    Args:
+        entries (iterable): Manifest entries (see read_manifest())
+        workers (int): Number of worker processes; defaults to the CPU
+            count, and 1 runs everything in this process
+        chunk_size (int): Entries per dispatched chunk
+
+    Yields:
+        dict: One process_user() result per entry
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        yield from map(process_user, entries)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        yield from executor.map(process_user, entries, chunksize=chunk_size)
+
+
+def write_results(results, path, output_format=None):
+    """
+    Write batch results to an NDJSON or CSV file, one row per user.
+
+    Args:
+        results (iterable): process_user() results
+        path (str): Output file path
+        output_format (str): 'ndjson' or 'csv'; inferred from the file
+            extension when omitted
+
+    Returns:
+        tuple: (number of users written, number of failures)
+    """
+    if output_format is None:
+        output_format = 'csv' if path.lower().endswith('.csv') else 'ndjson'
+
+    total = failed = 0
+    with open(path, 'w', newline='') as f:
+        if output_format == 'csv':
+            writer = csv.DictWriter(f, fieldnames=RESULT_FIELDS)
+            writer.writeheader()
+            write = writer.writerow
+        else:
+            def write(row):
+                f.write(json.dumps(row) + '\n')
+
+        for result in results:
+            write(result)
+            total += 1
+            failed += result['status'] == 'error'
+
+    return total, failed
@@ -0,0 +1,479 @@
+"""
+Synthetic data generator and pipeline benchmark.
+
+Generates realistic sleep/workout exports of any size and times each
+pipeline stage (load, normalize, merge, analyze) separately, reporting
+throughput, peak memory and how each stage scales with input size.
+Normalization memory is measured per output mode as well (full copies,
+in place, projected records, columns). Results can be saved as JSON and
+compared against a stored baseline:
+
+    python -m benchmark run --sizes 1000,10000,100000 --output bench.json
+    python -m benchmark run --sizes 1000,10000 --baseline bench.json
+
+CLI cold start is tracked too: `python -m benchmark startup` imports the
+CLI in a fresh interpreter under `-X importtime` and checks it against
+STARTUP_BUDGET_SECONDS.
+"""
+
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from typing import Annotated
+
+import typer
+from tabulate import tabulate
+
+from analyzer import calculate_correlations
+from loader import load_json_data
+from merger import WORKOUT_FIELDS, merge_datasets
+from normalizer import normalize_to_columns, normalize_to_utc
+
+
+# Timestamp layouts seen in real exports. The first one of each list is
+# used for most records; the rest are mixed in to exercise the fallbacks.
+SLEEP_FORMATS = [
+    lambda dt: dt.strftime('%Y-%m-%dT%H:%M:%SZ'),
+    lambda dt: dt.strftime('%Y-%m-%d %H:%M:%S UTC'),
+    lambda dt: dt.strftime('%b %d, %Y %H:%M:%S'),
+]
+WORKOUT_FORMATS = [
+    lambda dt: dt.strftime('%Y-%m-%d %H:%M:%S PST'),
+    lambda dt: f"{dt.month}/{dt.day}/{dt.year} {dt:%H:%M:%S} PST",
+    lambda dt: f"{dt:%B} {dt.day} {dt.year} {dt:%H:%M:%S}",
+]
+WORKOUT_TYPES = ['run', 'gym', 'swim', 'yoga', 'bike']
+SLEEP_QUALITIES = ['poor', 'fair', 'good', 'excellent']
+
+DEFAULT_START = datetime(2015, 1, 1)
+TEN_YEARS = timedelta(days=3652)
+
+# Allowed slowdown against a baseline before a stage is flagged
+DEFAULT_TOLERANCE = 0.25
+
+# Cold-start budget for `import cli`. Loading every dependency up front
+# took about 0.15s here and typer alone about 0.07s, so this leaves room
+# for slower machines while still catching an eager heavy import.
+STARTUP_BUDGET_SECONDS = 0.25
+
+# Modules only some commands need; `import cli` must not load them
+LAZY_MODULES = ('dateutil', 'pytz', 'tabulate', 'concurrent.futures.process',
+                'analyzer', 'batch', 'cache', 'groupby', 'loader', 'merger', 'normalizer', 'rollup', 'server', 'sqlite_store',
+                'store', 'watch')
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+
+app = typer.Typer(help="Synthetic data generator and pipeline benchmark")
+
+
+def generate_sleep(count, start=DEFAULT_START, span=TEN_YEARS, mixed_fraction=0.05, seed=0):
+    """
+    Generate synthetic sleep records, evenly spread over a time span.
+
+    Args:
+        count (int): Number of records
+        start (datetime): Naive UTC time of the first record
+        span (timedelta): Time covered by all records
+        mixed_fraction (float): Share of records using a different
+            timestamp format than the main one
+        seed (int): Random seed, so runs are repeatable
+
+    Yields:
+        dict: Records shaped like data/sleep.json
+    """
+    rng = random.Random(seed)
+    step = span / max(count, 1)
+    for i in range(count):
+        dt = start + step * i + timedelta(minutes=rng.randint(0, 90))
+        hours = round(rng.triangular(3.5, 10.0, 7.0), 2)
+        yield {
+            'date': _pick_format(SLEEP_FORMATS, rng, mixed_fraction)(dt),
+            'hours': hours,
+            'quality': SLEEP_QUALITIES[min(int(hours) - 3, 7) // 2],
+        }
+
+
+def generate_workouts(count, start=DEFAULT_START, span=TEN_YEARS, mixed_fraction=0.05,
+                      late_night_fraction=0.1, seed=1):
+    """
+    Generate synthetic workout records in local time, over a time span.
+
+    Ten years of data crosses every DST change in that period, and a
+    share of workouts is moved to 22:00-23:59 local time so they land on
+    the next day in UTC (the day-boundary edge case).
+
+    Args:
+        count (int): Number of records
+        start (datetime): Naive local time of the first record
+        span (timedelta): Time covered by all records
+        mixed_fraction (float): Share of records using a different
+            timestamp format than the main one
+        late_night_fraction (float): Share of late-night workouts
+        seed (int): Random seed, so runs are repeatable
+
+    Yields:
+        dict: Records shaped like data/workouts.json
+    """
+    rng = random.Random(seed)
+    step = span / max(count, 1)
+    for i in range(count):
+        dt = start + step * i
+        if rng.random() < late_night_fraction:
+            dt = dt.replace(hour=rng.randint(22, 23), minute=rng.randint(0, 59))
+        duration = rng.randint(10, 90)
+        yield {
+            'timestamp': _pick_format(WORKOUT_FORMATS, rng, mixed_fraction)(dt),
+            'type': rng.choice(WORKOUT_TYPES),
+            'calories': duration * rng.randint(4, 12),
+            'duration': duration,
+        }
+
+
+def _pick_format(formats, rng, mixed_fraction):
+    if rng.random() < mixed_fraction:
+        return rng.choice(formats[1:])
+    return formats[0]
+
+
+def write_export(records, path, output_format='json'):
+    """
+    Stream records to a JSON array or NDJSON file without building a list.
+
+    Returns:
+        int: Number of records written
+    """
+    count = 0
+    with open(path, 'w') as f:
+        if output_format == 'ndjson':
+            for record in records:
+                f.write(json.dumps(record) + '\n')
+                count += 1
+        else:
+            f.write('[\n')
+            for record in records:
+                f.write((',\n' if count else '') + json.dumps(record))
+                count += 1
+            f.write('\n]\n')
+    return count
+
+
+# Pipeline stages in order: (name, function of the previous stage's output)
+def _stages(sleep_path, workouts_path, local_time_zone):
+    return [
+        ('load_json_data', lambda _: (load_json_data(sleep_path), load_json_data(workouts_path))),
+        ('normalize_to_utc', lambda data: (normalize_to_utc(data[0], 'UTC'),
+                                           normalize_to_utc(data[1], local_time_zone))),
+        ('merge_datasets', lambda data: merge_datasets(data[0], data[1])),
+        ('calculate_correlations', lambda merged: calculate_correlations(merged)),
+    ]
+
+
+def time_stages(sleep_path, workouts_path, local_time_zone, record_count):
+    """
+    Time each pipeline stage on one pair of files.
+
+    Every stage is run twice: once for wall time, then again under
+    tracemalloc for peak memory (tracing slows Python down, so it would
+    skew the timings).
+
+    Returns:
+        dict: Stage name -> {'seconds', 'records_per_sec', 'peak_bytes'}
+    """
+    stages = _stages(sleep_path, workouts_path, local_time_zone)
+    results = {}
+
+    data = None
+    for name, run in stages:
+        started = time.perf_counter()
+        output = run(data)
+        seconds = time.perf_counter() - started
+        results[name] = {
+            'seconds': seconds,
+            'records_per_sec': record_count / seconds if seconds else None,
+        }
+        data = output
+
+    data = None
+    for name, run in stages:
+        tracemalloc.start()
+        try:
+            output = run(data)
+            results[name]['peak_bytes'] = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        data = output
+
+    return results
+
+
+# Ways normalization can hold its output, for measure_normalize_memory()
+NORMALIZE_MODES = {
+    'copy': lambda data, tz: normalize_to_utc(data, tz),
+    'in_place': lambda data, tz: normalize_to_utc(data, tz, in_place=True),
+    'projected': lambda data, tz: normalize_to_utc(data, tz, fields=WORKOUT_FIELDS),
+    'columns': lambda data, tz: normalize_to_columns(data, tz),
+}
+
+
+def measure_normalize_memory(workouts_path, local_time_zone, record_count):
+    """
+    Memory used by each NORMALIZE_MODES way of normalizing one file.
+
+    The raw records are loaded before tracing starts, so only what
+    normalization allocates is counted: 'retained_bytes' is what the
+    output still holds afterwards, 'peak_bytes' the most held at once.
+
+    Returns:
+        dict: Mode -> {'retained_bytes', 'peak_bytes', 'bytes_per_record'}
+    """
+    results = {}
+    for mode, normalize in NORMALIZE_MODES.items():
+        data = load_json_data(workouts_path)
+        tracemalloc.start()
+        try:
+            output = normalize(data, local_time_zone)
+            retained, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        del output
+        results[mode] = {
+            'retained_bytes': retained,
+            'peak_bytes': peak,
+            'bytes_per_record': retained / record_count if record_count else None,
+        }
+    return results
+
+
+def run_benchmark(sizes, local_time_zone='America/Los_Angeles', workdir=None, mixed_fraction=0.05):
+    """
+    Generate inputs of each size and time every stage on them.
+
+    Each size is the number of workout records; a tenth as many sleep
+    records are generated over the same period.
+
+    Returns:
+        dict: Environment info, per-size stage results and normalization
+            memory by mode, and for each stage the scaling exponent (1.0
+            means linear)
+    """
+    results = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'timezone': local_time_zone,
+        'sizes': {},
+        'normalize_memory': {},
+    }
+
+    with tempfile.TemporaryDirectory(dir=workdir) as tmp:
+        for size in sizes:
+            sleep_path = os.path.join(tmp, f'sleep_{size}.json')
+            workouts_path = os.path.join(tmp, f'workouts_{size}.json')
+            write_export(generate_sleep(max(size // 10, 1), mixed_fraction=mixed_fraction), sleep_path)
+            write_export(generate_workouts(size, mixed_fraction=mixed_fraction), workouts_path)
+
+            results['sizes'][str(size)] = time_stages(sleep_path, workouts_path, local_time_zone, size)
+            results['normalize_memory'][str(size)] = measure_normalize_memory(workouts_path, local_time_zone, size)
+            os.remove(sleep_path)
+            os.remove(workouts_path)
+
+    results['scaling'] = scaling_exponents(results['sizes'])
+    results['startup'] = measure_startup()
+    return results
+
+
+def import_times(module='cli'):
+    """
+    Import a module in a fresh interpreter under `python -X importtime`.
+
+    Returns:
+        dict: Every module that got imported -> cumulative import time
+            in microseconds (including the module itself)
+    """
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                             cwd=_HERE, capture_output=True, text=True, check=True)
+    times = {}
+    for line in process.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line.split('|')
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def measure_startup(module='cli', runs=3):
+    """
+    Measure how long importing the CLI takes from a cold interpreter.
+
+    Takes the best of several runs, since the first one also pays for
+    reading files into the OS cache.
+
+    Returns:
+        dict: 'import_seconds', 'budget_seconds', the LAZY_MODULES that
+            were imported anyway ('eager'), and the slowest imports
+    """
+    samples = [import_times(module) for _ in range(runs)]
+    best = min(samples, key=lambda times: times[module])
+    slowest = sorted(((name, us) for name, us in best.items() if name != module),
+                     key=lambda item: item[1], reverse=True)[:10]
+    return {
+        'import_seconds': best[module] / 1e6,
+        'budget_seconds': STARTUP_BUDGET_SECONDS,
+        'eager': [name for name in LAZY_MODULES if name in best],
+        'slowest': [[name, us / 1e6] for name, us in slowest],
+    }
+
+
+def scaling_exponents(size_results):
+    """
+    Fit seconds ~ size ** k for each stage (least squares in log-log space).
+
+    Returns:
+        dict: Stage name -> k, or None with fewer than two sizes
+    """
+    sizes = sorted(size_results, key=int)
+    exponents = {}
+    for stage in size_results[sizes[0]] if sizes else []:
+        points = [(math.log(int(size)), math.log(size_results[size][stage]['seconds']))
+                  for size in sizes if size_results[size][stage]['seconds'] > 0]
+        if len(points) < 2:
+            exponents[stage] = None
+            continue
+        mean_x = sum(x for x, _ in points) / len(points)
+        mean_y = sum(y for _, y in points) / len(points)
+        var_x = sum((x - mean_x) ** 2 for x, _ in points)
+        cov = sum((x - mean_x) * (y - mean_y) for x, y in points)
+        exponents[stage] = cov / var_x if var_x else None
+    return exponents
+
+
+def compare_to_baseline(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    Compare stage timings with a baseline run, for sizes both runs have.
+
+    Returns:
+        list: One dict per (size, stage) with 'size', 'stage', 'ratio'
+            (current / baseline seconds) and 'regressed' (ratio above
+            1 + tolerance)
+    """
+    rows = []
+    for size, stages in results['sizes'].items():
+        baseline_stages = baseline.get('sizes', {}).get(size)
+        if not baseline_stages:
+            continue
+        for stage, current in stages.items():
+            before = baseline_stages.get(stage)
+            if not before or not before['seconds']:
+                continue
+            ratio = current['seconds'] / before['seconds']
+            rows.append({'size': int(size), 'stage': stage, 'ratio': ratio,
+                         'regressed': ratio > 1 + tolerance})
+
+    if results.get('startup') and baseline.get('startup'):
+        ratio = results['startup']['import_seconds'] / baseline['startup']['import_seconds']
+        rows.append({'size': None, 'stage': 'cli startup', 'ratio': ratio,
+                     'regressed': ratio > 1 + tolerance})
+    return rows
+
+
+def format_report(results, comparison=None):
+    """Render benchmark results (and an optional comparison) as text tables."""
+    rows = []
+    for size, stages in results['sizes'].items():
+        for stage, numbers in stages.items():
+            rows.append([int(size), stage, f"{numbers['seconds']:.4f}",
+                         f"{numbers['records_per_sec'] or 0:,.0f}",
+                         f"{numbers['peak_bytes'] / 1e6:.1f}"])
+    text = tabulate(rows, headers=['Records', 'Stage', 'Seconds', 'Records/sec', 'Peak MB'], tablefmt='grid')
+
+    scaling = [[stage, 'n/a' if k is None else f"{k:.2f}"] for stage, k in results['scaling'].items()]
+    text += '\n' + tabulate(scaling, headers=['Stage', 'Scaling exponent'], tablefmt='grid')
+
+    memory = [[int(size), mode, f"{numbers['retained_bytes'] / 1e6:.1f}", f"{numbers['peak_bytes'] / 1e6:.1f}",
+               f"{numbers['bytes_per_record'] or 0:,.0f}"]
+              for size, modes in results.get('normalize_memory', {}).items() for mode, numbers in modes.items()]
+    if memory:
+        text += '\n' + tabulate(memory, headers=['Records', 'Normalize output', 'Retained MB', 'Peak MB',
+                                                 'Bytes/record'], tablefmt='grid')
+
+    if results.get('startup'):
+        text += '\n' + format_startup(results['startup'])
+
+    if comparison:
+        compared = [['' if row['size'] is None else row['size'], row['stage'], f"{row['ratio']:.2f}x",
+                     'REGRESSED' if row['regressed'] else 'ok'] for row in comparison]
+        text += '\n' + tabulate(compared, headers=['Records', 'Stage', 'vs baseline', 'Status'], tablefmt='grid')
+    return text
+
+
+@app.command()
+def run(
+    sizes: Annotated[str, typer.Option(help="Comma-separated workout record counts")] = "1000,10000,100000",
+    local_time_zone: Annotated[str, typer.Option(help="IANA timezone for workout data")] = "America/Los_Angeles",
+    output: Annotated[str, typer.Option(help="Save results to this JSON file")] = None,
+    baseline: Annotated[str, typer.Option(help="Compare against results saved earlier")] = None,
+    tolerance: Annotated[float, typer.Option(help="Allowed slowdown vs baseline (0.25 = 25%)")] = DEFAULT_TOLERANCE,
+):
+    """Benchmark every pipeline stage on generated data of each size."""
+    results = run_benchmark([int(size) for size in sizes.split(',')], local_time_zone)
+
+    comparison = None
+    if baseline:
+        with open(baseline) as f:
+            comparison = compare_to_baseline(results, json.load(f), tolerance)
+    print(format_report(results, comparison))
+
+    if output:
+        with open(output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if comparison and any(row['regressed'] for row in comparison):
+        raise typer.Exit(code=1)
+
+
+def format_startup(startup):
+    """Render a measure_startup() result as text."""
+    text = (f"CLI import: {startup['import_seconds']:.3f}s "
+            f"(budget {startup['budget_seconds']:.3f}s)")
+    if startup['eager']:
+        text += f"\nImported eagerly: {', '.join(startup['eager'])}"
+    rows = [[name, f"{seconds:.4f}"] for name, seconds in startup['slowest']]
+    return text + '\n' + tabulate(rows, headers=['Slowest imports', 'Seconds'], tablefmt='grid')
+
+
+@app.command()
+def startup(
+    runs: Annotated[int, typer.Option(help="Fresh interpreters to try; the fastest counts")] = 3,
+):
+    """Measure CLI cold-start import time against the startup budget."""
+    result = measure_startup(runs=runs)
+    print(format_startup(result))
+    if result['import_seconds'] > result['budget_seconds'] or result['eager']:
+        raise typer.Exit(code=1)
+
+
+@app.command()
+def generate(
+    count: Annotated[int, typer.Argument(help="Number of workout records")],
+    output_dir: Annotated[str, typer.Option(help="Directory for the generated files")] = ".",
+    output_format: Annotated[str, typer.Option("--format", help="json or ndjson")] = "json",
+):
+    """Write synthetic sleep and workout exports to disk."""
+    extension = 'ndjson' if output_format == 'ndjson' else 'json'
+    sleep_path = os.path.join(output_dir, f'sleep_{count}.{extension}')
+    workouts_path = os.path.join(output_dir, f'workouts_{count}.{extension}')
+    write_export(generate_sleep(max(count // 10, 1)), sleep_path, output_format)
+    write_export(generate_workouts(count), workouts_path, output_format)
+    print(f"Wrote {sleep_path} and {workouts_path}")
+
+
+if __name__ == '__main__':
+    app()
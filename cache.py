@@ -0,0 +1,149 @@
+import hashlib
+import json
+import os
+import pickle
+from functools import lru_cache
+
+
+# Set this to keep the cache somewhere other than ~/.cache/health-tracker
+CACHE_DIR_ENV = 'HEALTH_TRACKER_CACHE_DIR'
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# Modules whose code determines what ends up in the cache
+PIPELINE_MODULES = ('loader', 'timestamps', 'tzcache', 'dataset', 'normalizer', 'merger')
+
+_SUFFIX = '.pickle'
+
+
+def default_cache_dir():
+    """Return the cache directory from the environment, or the default."""
+    return os.environ.get(CACHE_DIR_ENV) or os.path.join(
+        os.path.expanduser('~'), '.cache', 'health-tracker'
+    )
+
+
+@lru_cache(maxsize=None)
+def code_version():
+    """Hash of the pipeline modules' source, so code changes invalidate the cache."""
+    digest = hashlib.sha256()
+    here = os.path.dirname(os.path.abspath(__file__))
+    for name in PIPELINE_MODULES:
+        with open(os.path.join(here, f'{name}.py'), 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+
+class ResultCache:
+    """
+    On-disk cache of normalized and merged results.
+
+    Entries are keyed by each input file's path, size and modification
+    time, the local timezone and the pipeline code version, so any change
+    to the inputs or the code is a miss. Values are pickled (the columnar
+    datasets pickle as raw array bytes, which loads much faster than
+    reparsing JSON).
+
+    The directory is bounded by max_bytes: reading an entry marks it as
+    recently used, and the least recently used entries are deleted when
+    a new entry pushes the total over the limit.
+
+    Example:
+        cache = ResultCache()
+        key = cache.key(['data/sleep.json', 'data/workouts.json'], 'America/Los_Angeles')
+        result = cache.load(key)
+        if result is None:
+            result = expensive_pipeline()
+            cache.store(key, result)
+    """
+
+    def __init__(self, directory=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory or default_cache_dir()
+        self.max_bytes = max_bytes
+
+    def key(self, paths, local_time_zone):
+        """
+        Build the cache key for a set of input files and a timezone.
+
+        Raises:
+            FileNotFoundError: If one of the input files doesn't exist
+        """
+        files = []
+        for path in paths:
+            stat = os.stat(path)
+            files.append([os.path.abspath(path), stat.st_size, stat.st_mtime_ns])
+        description = json.dumps([files, local_time_zone, code_version()])
+        return hashlib.sha256(description.encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + _SUFFIX)
+
+    def load(self, key):
+        """Return the cached value for key, or None on a miss."""
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                value = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception:
+            # Truncated or unreadable entry: drop it and recompute
+            self._remove(path)
+            return None
+
+        # Mark as recently used for LRU eviction
+        os.utime(path)
+        return value
+
+    def store(self, key, value):
+        """Write value under key, then evict old entries if over max_bytes."""
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(key)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        # Atomic, so a concurrent reader never sees a half-written entry
+        os.replace(tmp_path, path)
+        self._evict(keep=path)
+
+    def clear(self):
+        """Delete every cache entry. Returns the number of entries removed."""
+        removed = 0
+        for path, _, _ in self._entries():
+            if self._remove(path):
+                removed += 1
+        return removed
+
+    def _entries(self):
+        """List (path, size, last_used) for every entry."""
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        entries = []
+        for name in names:
+            if name.endswith(_SUFFIX):
+                path = os.path.join(self.directory, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((path, stat.st_size, stat.st_mtime_ns))
+        return entries
+
+    def _evict(self, keep=None):
+        # Remove least recently used entries until under the size limit
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+        for path, size, _ in entries:
+            if total <= self.max_bytes:
+                break
+            if path != keep and self._remove(path):
+                total -= size
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+            return True
+        except FileNotFoundError:
+            return False
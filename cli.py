@@ -5,13 +5,18 @@ Command-line interface for analyzing personal health data.
 Loads sleep and workout data, normalizes timestamps, and provides analysis commands.
 """
 
+import sys
 import typer
-from typing import Annotated
-from tabulate import tabulate
-from analyzer import calculate_correlations
-from loader import load_json_data
-from merger import merge_datasets
-from normalizer import normalize_to_utc
+from contextlib import contextmanager, nullcontext
+from datetime import date, datetime
+from typing import TYPE_CHECKING, Annotated
+
+# Everything else is imported inside the commands that use it, so --help
+# and small queries don't pay for dateutil, pytz, tabulate or a process
+# pool they never touch (see `python -m benchmark startup`)
+if TYPE_CHECKING:
+    from cache import ResultCache
+    from profiling import StageProfiler
 
 # Initialize CLI app
 app = typer.Typer(
@@ -23,23 +28,341 @@ app = typer.Typer(
 SleepFile = Annotated[str, typer.Option(help="Path to sleep data JSON file")]
 WorkoutsFile = Annotated[str, typer.Option(help="Path to workouts data JSON file")]
 LocalTimeZone = Annotated[str, typer.Option(help="IANA timezone for workout data")]
+NoCache = Annotated[bool, typer.Option("--no-cache", help="Ignore and don't update the on-disk result cache")]
+Profile = Annotated[bool, typer.Option("--profile", help="Print per-stage timings to stderr")]
+CProfileOutput = Annotated[str, typer.Option(help="Write cProfile stats for the whole command to this file")]
+DateFrom = Annotated[datetime, typer.Option("--from", formats=["%Y-%m-%d"], help="First local date to include")]
+DateTo = Annotated[datetime, typer.Option("--to", formats=["%Y-%m-%d"], help="Last local date to include")]
+# Normalization worker processes; 0 means one per CPU
+Workers = Annotated[int, typer.Option(min=0, help="Worker processes for normalizing large files (0 = one per CPU)")]
+ChunkSize = Annotated[int, typer.Option(min=1, help="Records per chunk when normalizing with several workers")]
+OutputFormat = Annotated[str, typer.Option("--format", help="Output format: table, ndjson or csv")]
+PageSize = Annotated[int, typer.Option(help="Rows per table, each sized on its own (0 = one table)")]
+StoreDir = Annotated[str, typer.Option("--store", help="Read from a store directory or SQLite .db file written by ingest instead of JSON")]
+User = Annotated[str, typer.Option(help="User whose records to use; only a SQLite store holds several")]
+
+# Subcommands for managing the on-disk result cache
+cache_app = typer.Typer(help="Manage the on-disk result cache")
+app.add_typer(cache_app, name="cache")
 
 
 def load_and_merge_data(
     sleep_json_file: str,
     workouts_json_file: str,
-    local_time_zone: str
+    local_time_zone: str,
+    cache: 'ResultCache' = None,
+    profiler: 'StageProfiler' = None,
+    date_from: date = None,
+    date_to: date = None,
+    workers: int = 1,
+    chunk_size: int = 50_000
+) -> list:
+    """
+    Load, normalize, and merge health data from JSON or NDJSON files.
+    
+    Records are streamed from disk straight into compact columnar
+    datasets (about 40 bytes per record), sorted by local date, and
+    merged on integer local-date keys. The two files are loaded at the
+    same time (see _normalize_sources()).
+    
+    If a cache is given and the input files, timezone and code are
+    unchanged since the last run, the stored result is returned without
+    parsing anything. If a profiler is given, every stage is timed.
+    
+    date_from/date_to limit the result to a range of local dates
+    (inclusive). The range is found by binary search on the date-sorted
+    datasets, so with a warm cache only the matching days are merged.
+    
+    With workers other than 1, each file is normalized in chunks of
+    chunk_size records across a process pool (same result, see
+    normalizer.normalize_parallel()).
+    """
+    from merger import merge_datasets
+    
+    norm_sleep, norm_workouts, merged = load_normalized(
+        sleep_json_file, workouts_json_file, local_time_zone, cache, profiler, workers, chunk_size
+    )
+    
+    if date_from is None and date_to is None:
+        return merged
+    
+    with _stage(profiler, 'date range') as stage:
+        sleep_range = norm_sleep.date_range(date_from, date_to)
+        workouts_range = norm_workouts.date_range(date_from, date_to)
+        merged = merge_datasets(sleep_range, workouts_range)
+        stage['records'] = len(sleep_range) + len(workouts_range)
+    return merged
+
+
+def load_normalized(
+    sleep_json_file: str,
+    workouts_json_file: str,
+    local_time_zone: str,
+    cache: 'ResultCache' = None,
+    profiler: 'StageProfiler' = None,
+    workers: int = 1,
+    chunk_size: int = 50_000
+) -> tuple:
+    """
+    Normalized sleep and workout datasets, sorted by date, and their merge.
+    
+    The cached part of load_and_merge_data(), for commands that work on
+    the records themselves rather than the merged days.
+    
+    Returns:
+        tuple: (sleep NormalizedDataset, workouts NormalizedDataset,
+            merged days)
+    """
+    from merger import merge_datasets
+    
+    key = None
+    cached = None
+    if cache is not None:
+        with _stage(profiler, 'cache lookup') as stage:
+            try:
+                key = cache.key([sleep_json_file, workouts_json_file], local_time_zone)
+            except FileNotFoundError:
+                pass  # the loader reports missing files below
+            else:
+                cached = cache.load(key)
+            stage['extra']['hit'] = cached is not None
+    
+    if cached is not None:
+        norm_sleep, norm_workouts, merged = cached['sleep'], cached['workouts'], cached['merged']
+    else:
+        with _stage(profiler, 'load sources') as stage:
+            norm_sleep, norm_workouts = _normalize_sources(
+                [(sleep_json_file, 'UTC', 'sleep'), (workouts_json_file, local_time_zone, 'workouts')],
+                profiler, workers, chunk_size,
+            )
+            stage['records'] = len(norm_sleep) + len(norm_workouts)
+        
+        # Sorting once here makes the datasets their own date index
+        with _stage(profiler, 'sort by date') as stage:
+            norm_sleep = norm_sleep.sorted_by_date()
+            norm_workouts = norm_workouts.sorted_by_date()
+            stage['records'] = len(norm_sleep) + len(norm_workouts)
+        
+        with _stage(profiler, 'merge') as stage:
+            merged = merge_datasets(norm_sleep, norm_workouts)
+            stage['records'] = len(norm_sleep) + len(norm_workouts)
+        
+        if key is not None:
+            with _stage(profiler, 'cache store'):
+                try:
+                    cache.store(key, {'sleep': norm_sleep, 'workouts': norm_workouts, 'merged': merged})
+                except OSError:
+                    pass  # an unwritable cache directory shouldn't fail the command
+    
+    return norm_sleep, norm_workouts, merged
+
+
+def load_and_merge_store(
+    store_dir: str,
+    local_time_zone: str,
+    profiler: 'StageProfiler' = None,
+    date_from: date = None,
+    date_to: date = None,
+    lazy: bool = False,
+    user: str = 'default'
 ) -> list:
     """
-    Load, normalize, and merge health data from JSON files.
+    Load and merge health data from a store directory written by ingest.
+    
+    The store files are memory-mapped, so nothing is parsed and only the
+    blocks and rows in the date range are read.
+    
+    With lazy=True an iterator is returned instead of a list, and each
+    day is merged only when it is asked for, so the first row is
+    available straight away however much data the store holds.
+    
+    A SQLite store (a .db file) merges the user's days in SQL instead,
+    so only one row per day is read back.
     """
-    sleep = load_json_data(sleep_json_file)
-    workouts = load_json_data(workouts_json_file)
+    from merger import iter_merge_columns, merge_datasets
+    from sqlite_store import is_sqlite_store, merge_days
+    from store import load_store
+    
+    if is_sqlite_store(store_dir):
+        with _stage(profiler, 'merge in sqlite') as stage:
+            try:
+                merged = merge_days(store_dir, local_time_zone, user, date_from, date_to)
+            except (FileNotFoundError, ValueError) as e:
+                print(f"Error: {e}")
+                raise
+            if not lazy:
+                merged = list(merged)
+                stage['records'] = len(merged)
+        return merged
+    
+    with _stage(profiler, 'load store') as stage:
+        try:
+            norm_sleep, norm_workouts = load_store(store_dir, local_time_zone, date_from, date_to)
+        except (FileNotFoundError, ValueError) as e:
+            print(f"Error: {e}")
+            raise
+        stage['records'] = len(norm_sleep) + len(norm_workouts)
     
-    norm_sleep = normalize_to_utc(sleep, 'UTC')
-    norm_workouts = normalize_to_utc(workouts, local_time_zone)
+    if lazy:
+        return iter_merge_columns(norm_sleep, norm_workouts)
     
-    return merge_datasets(norm_sleep, norm_workouts)
+    with _stage(profiler, 'merge') as stage:
+        merged = merge_datasets(norm_sleep, norm_workouts)
+        stage['records'] = len(norm_sleep) + len(norm_workouts)
+    return merged
+
+
+def _load(sleep_json_file, workouts_json_file, local_time_zone, store_dir, no_cache, profiler,
+          date_from, date_to, workers, chunk_size, lazy=False, user='default'):
+    """Merged days from the store when --store is given, otherwise from the JSON files."""
+    if store_dir:
+        return load_and_merge_store(store_dir, local_time_zone, profiler,
+                                    _as_date(date_from), _as_date(date_to), lazy, user)
+    from cache import ResultCache
+    cache = None if no_cache else ResultCache()
+    return load_and_merge_data(sleep_json_file, workouts_json_file, local_time_zone, cache, profiler,
+                               _as_date(date_from), _as_date(date_to), workers, chunk_size)
+
+
+def _check_user(store_dir, user):
+    """Exit with an error if --user is given for anything but a SQLite store, which would ignore it."""
+    from sqlite_store import DEFAULT_USER, is_sqlite_store
+    if user != DEFAULT_USER and not (store_dir and is_sqlite_store(store_dir)):
+        print(f"Error: --user {user} needs a SQLite store (--store path.db); "
+              "store directories and JSON files hold one user's records")
+        raise typer.Exit(code=1)
+
+
+def _normalize_sources(sources, profiler=None, workers=1, chunk_size=50_000):
+    """
+    Load and normalize several independent files concurrently.
+    
+    Each (path, source_tz, name) source gets its own thread, so time
+    spent waiting on the disk or network for one file overlaps with the
+    others and wall time approaches that of the slowest source. Parsing
+    itself still shares the GIL; use workers for CPU-bound speedups.
+    
+    With workers != 1 the sources run one after another instead, each
+    using the whole process pool: starting pools from several threads
+    would fork a multi-threaded process, which can deadlock the workers.
+    
+    Every source runs to completion, so all broken files are reported,
+    not just the first. Afterwards the first failure (in source order)
+    is re-raised unchanged.
+    
+    Returns:
+        list: One NormalizedDataset per source, in the same order
+    """
+    from concurrent.futures import Future, ThreadPoolExecutor
+    from functools import partial
+    from json import JSONDecodeError
+    from profiling import StageProfiler
+    
+    # Each thread times itself separately, so the stage table lists
+    # sources in order instead of however the threads interleaved
+    source_profilers = [None if profiler is None else StageProfiler() for _ in sources]
+    jobs = [partial(_normalize_file, path, source_tz, name, source_profiler, workers, chunk_size)
+            for (path, source_tz, name), source_profiler in zip(sources, source_profilers)]
+    if workers == 1:
+        with ThreadPoolExecutor(max_workers=len(sources)) as executor:
+            futures = [executor.submit(job) for job in jobs]
+    else:
+        futures = [Future() for _ in jobs]
+        for job, future in zip(jobs, futures):
+            try:
+                future.set_result(job())
+            except Exception as e:
+                future.set_exception(e)
+    
+    if profiler is not None:
+        for source_profiler in source_profilers:
+            for stage in source_profiler.stages:
+                profiler.record(stage['name'], stage['seconds'], stage['records'], **stage['extra'])
+    
+    errors = []
+    for (path, _, name), future in zip(sources, futures):
+        error = future.exception()
+        if error is None:
+            continue
+        # The loader already reports missing files and invalid JSON
+        if not isinstance(error, (FileNotFoundError, JSONDecodeError)):
+            print(f"Error: Could not load {name} data from {path}: {type(error).__name__}: {error}")
+        errors.append(error)
+    if errors:
+        raise errors[0]
+    return [future.result() for future in futures]
+
+
+def _normalize_file(path, source_tz, name, profiler, workers=1, chunk_size=50_000):
+    """Stream one file into a NormalizedDataset, timing each step if profiling."""
+    from loader import iter_json_records
+    from normalizer import normalize_parallel, normalize_to_columns
+    from timestamps import TimestampParser
+    
+    if workers != 1:
+        # Per-step timings only exist in-process, so time it as one stage
+        parser = TimestampParser()
+        with _stage(profiler, f'normalize {name}') as stage:
+            dataset = normalize_parallel(iter_json_records(path), source_tz, workers, chunk_size, parser)
+            stage['records'] = len(dataset)
+            stage['extra'].update(fast_path=parser.hits, fallback=parser.misses)
+        return dataset
+    
+    if profiler is None:
+        return normalize_to_columns(iter_json_records(path), source_tz)
+    
+    parser = TimestampParser()
+    timings = {}
+    dataset = normalize_to_columns(iter_json_records(path), source_tz, parser, timings)
+    count = len(dataset)
+    profiler.record(f'load {name}', timings['read'], count)
+    profiler.record(f'parse {name} timestamps', timings['parse'], count,
+                    fast_path=parser.hits, fallback=parser.misses)
+    profiler.record(f'convert {name} timezones', timings['convert'], count)
+    return dataset
+
+
+def _stage(profiler, name):
+    """profiler.stage(name), or a do-nothing stand-in when not profiling."""
+    if profiler is None:
+        return nullcontext({'records': None, 'extra': {}})
+    return profiler.stage(name)
+
+
+def _as_date(value: datetime) -> date:
+    """Date part of a --from/--to option, or None if it wasn't given."""
+    return None if value is None else value.date()
+
+
+@contextmanager
+def profiling_session(profile: bool, cprofile_output: str):
+    """
+    Set up profiling for one command.
+    
+    Yields a StageProfiler when --profile or --cprofile-output is set
+    (None otherwise). On exit the stage table is printed to stderr and
+    the cProfile stats are written for pstats/snakeviz.
+    """
+    if not profile and not cprofile_output:
+        yield None
+        return
+    
+    import cProfile
+    from profiling import STAGE_TABLE_HEADERS, StageProfiler
+    from tabulate import tabulate
+    
+    profiler = StageProfiler()
+    cprofiler = cProfile.Profile() if cprofile_output else None
+    if cprofiler is not None:
+        cprofiler.enable()
+    try:
+        yield profiler
+    finally:
+        if cprofiler is not None:
+            cprofiler.disable()
+            cprofiler.dump_stats(cprofile_output)
+        if profile:
+            print(tabulate(profiler.table(), headers=STAGE_TABLE_HEADERS, tablefmt="grid"), file=sys.stderr)
 
 
 @app.command()
@@ -47,10 +370,33 @@ def showbyday(
     sleep_json_file: SleepFile = "data/sleep.json",
     workouts_json_file: WorkoutsFile = "data/workouts.json",
     local_time_zone: LocalTimeZone = "America/Los_Angeles",
+    no_cache: NoCache = False,
+    profile: Profile = False,
+    cprofile_output: CProfileOutput = None,
+    date_from: DateFrom = None,
+    date_to: DateTo = None,
+    store_dir: StoreDir = None,
+    user: User = 'default',
+    workers: Workers = 1,
+    chunk_size: ChunkSize = 50_000,
+    output_format: OutputFormat = "table",
+    page_size: PageSize = 0,
 ):
-    """Display merged health data in a day-by-day tabular format."""
-    merged = load_and_merge_data(sleep_json_file, workouts_json_file, local_time_zone)
-    print(tabulate(merged, headers="keys", tablefmt="grid"))
+    """Display merged health data day by day, as a table, NDJSON or CSV."""
+    from writers import OUTPUT_FORMATS, write_rows
+    
+    _check_user(store_dir, user)
+    if output_format not in OUTPUT_FORMATS:
+        print(f"Error: Unknown format {output_format!r}; use one of: {', '.join(OUTPUT_FORMATS)}")
+        raise typer.Exit(code=1)
+    
+    with profiling_session(profile, cprofile_output) as profiler:
+        # Rows are written as they are produced; from a store they are
+        # even merged one day at a time
+        rows = _load(sleep_json_file, workouts_json_file, local_time_zone, store_dir, no_cache, profiler,
+                     date_from, date_to, workers, chunk_size, lazy=True, user=user)
+        with _stage(profiler, 'render') as stage:
+            stage['records'] = write_rows(rows, output_format, page_size=page_size)
 
 
 @app.command()
@@ -58,12 +404,351 @@ def showSummary(
     sleep_json_file: SleepFile = "data/sleep.json",
     workouts_json_file: WorkoutsFile = "data/workouts.json",
     local_time_zone: LocalTimeZone = "America/Los_Angeles",
+    no_cache: NoCache = False,
+    profile: Profile = False,
+    cprofile_output: CProfileOutput = None,
+    date_from: DateFrom = None,
+    date_to: DateTo = None,
+    store_dir: StoreDir = None,
+    user: User = 'default',
+    workers: Workers = 1,
+    chunk_size: ChunkSize = 50_000,
+    detailed: Annotated[bool, typer.Option("--detailed", help="Also show calorie spread, median, p90 and correlation")] = False,
 ):
     """Display summary statistics and correlations between sleep and activity."""
-    merged = load_and_merge_data(sleep_json_file, workouts_json_file, local_time_zone)
-    results = calculate_correlations(merged)
-    table_data = list(results.items())
-    print(tabulate(table_data, headers=["Metric", "Value"], tablefmt="grid"))
+    from analyzer import SummaryAccumulator
+    from sqlite_store import is_sqlite_store
+    from tabulate import tabulate
+    
+    _check_user(store_dir, user)
+    sqlite = bool(store_dir) and is_sqlite_store(store_dir)
+    with profiling_session(profile, cprofile_output) as profiler:
+        if sqlite and not detailed:
+            # The low/normal sleep groups are aggregated in SQL
+            from sqlite_store import summarize
+            with _stage(profiler, 'summarize in sqlite') as stage:
+                try:
+                    results = summarize(store_dir, local_time_zone, user, _as_date(date_from), _as_date(date_to))
+                except (FileNotFoundError, ValueError) as e:
+                    print(f"Error: {e}")
+                    raise typer.Exit(code=1)
+                stage['records'] = results['low_sleep_day_count'] + results['normal_sleep_day_count']
+        elif store_dir and not sqlite:
+            # Whole weeks, months and years come from the store's rollups
+            from rollup import summarize_store
+            with _stage(profiler, 'summarize store') as stage:
+                try:
+                    summary = summarize_store(store_dir, local_time_zone, _as_date(date_from), _as_date(date_to))
+                except (FileNotFoundError, ValueError) as e:
+                    print(f"Error: {e}")
+                    raise typer.Exit(code=1)
+                stage['records'] = summary.days_seen
+            results = summary.results()
+        else:
+            # The summary is built in one pass, so rows needn't be listed
+            merged = _load(sleep_json_file, workouts_json_file, local_time_zone, store_dir, no_cache, profiler,
+                           date_from, date_to, workers, chunk_size, lazy=True, user=user)
+            with _stage(profiler, 'calculate_correlations') as stage:
+                summary = SummaryAccumulator().update(merged)
+                stage['records'] = summary.days_seen
+            results = summary.results()
+        with _stage(profiler, 'render'):
+            table_data = list(results.items())
+            if detailed:
+                # The low/normal sleep numbers are already in the table
+                statistics = summary.statistics()
+                table_data += [(name, 'n/a' if statistics[name] is None else round(statistics[name], 2))
+                               for name in ('day_count', 'mean_calories', 'stdev_calories',
+                                            'median_calories', 'p90_calories', 'pearson')]
+            print(tabulate(table_data, headers=["Metric", "Value"], tablefmt="grid"))
+
+
+def _check_windows(value):
+    """Reject --windows values that aren't comma-separated positive day counts."""
+    try:
+        windows = [int(window) for window in value.split(',')]
+    except ValueError:
+        raise typer.BadParameter(f"{value!r} isn't a comma-separated list of whole days")
+    if any(window < 1 for window in windows):
+        raise typer.BadParameter("Rolling windows must be at least 1 day long")
+    return value
+
+
+@app.command()
+def showtrends(
+    sleep_json_file: SleepFile = "data/sleep.json",
+    workouts_json_file: WorkoutsFile = "data/workouts.json",
+    local_time_zone: LocalTimeZone = "America/Los_Angeles",
+    no_cache: NoCache = False,
+    profile: Profile = False,
+    cprofile_output: CProfileOutput = None,
+    date_from: DateFrom = None,
+    date_to: DateTo = None,
+    store_dir: StoreDir = None,
+    user: User = 'default',
+    workers: Workers = 1,
+    chunk_size: ChunkSize = 50_000,
+    windows: Annotated[str, typer.Option(callback=_check_windows,
+                                         help="Comma-separated rolling window lengths in days")] = "7,30",
+    low_sleep_threshold: Annotated[float, typer.Option(help="Sleep hours below which a day is low sleep")] = 6.0,
+):
+    """Display rolling averages and low-sleep streaks day by day."""
+    from datetime import timedelta
+    from analyzer import low_sleep_streaks, rolling_averages
+    from tabulate import tabulate
+    
+    _check_user(store_dir, user)
+    window_lengths = [int(window) for window in windows.split(',')]
+    # Load enough days before --from that its first windows are full
+    load_from = None if date_from is None else date_from - timedelta(days=max(window_lengths) - 1)
+    with profiling_session(profile, cprofile_output) as profiler:
+        merged = _load(sleep_json_file, workouts_json_file, local_time_zone, store_dir, no_cache, profiler,
+                       load_from, date_to, workers, chunk_size, user=user)
+        with _stage(profiler, 'rolling averages') as stage:
+            rolling = rolling_averages(merged, window_lengths)
+            streaks = low_sleep_streaks(merged, low_sleep_threshold)
+            stage['records'] = len(merged)
+        
+        first_day = '' if date_from is None else date_from.date().isoformat()
+        with _stage(profiler, 'render'):
+            print(tabulate([row for row in rolling if row['date'] >= first_day], headers="keys",
+                           tablefmt="grid", floatfmt=".2f", missingval="-"))
+            streaks = [streak for streak in streaks if streak['end'] >= first_day]
+            print(tabulate(streaks, headers={'start': 'Low-sleep streak start', 'end': 'End', 'length': 'Days'},
+                           tablefmt="grid"))
+            if streaks:
+                longest = max(streaks, key=lambda streak: streak['length'])
+                print(f"Longest low-sleep streak: {longest['length']} day(s), "
+                      f"{longest['start']} to {longest['end']}")
+
+
+@app.command()
+def groupby(
+    sleep_json_file: SleepFile = "data/sleep.json",
+    workouts_json_file: WorkoutsFile = "data/workouts.json",
+    local_time_zone: LocalTimeZone = "America/Los_Angeles",
+    no_cache: NoCache = False,
+    profile: Profile = False,
+    cprofile_output: CProfileOutput = None,
+    date_from: DateFrom = None,
+    date_to: DateTo = None,
+    store_dir: StoreDir = None,
+    user: User = 'default',
+    workers: Workers = 1,
+    chunk_size: ChunkSize = 50_000,
+    by: Annotated[str, typer.Option(help="Comma-separated keys: date, week, month, type, quality")] = "week,type",
+    agg: Annotated[str, typer.Option(help="Comma-separated field:op (sum, count, mean, min, max), or count")] = "calories:sum,duration:sum,count",
+    source: Annotated[str, typer.Option(help="Records to group: workouts or sleep")] = "workouts",
+    low_sleep_only: Annotated[bool, typer.Option("--low-sleep-only", help="Only count days with less sleep than the threshold")] = False,
+    low_sleep_threshold: Annotated[float, typer.Option(help="Sleep hours below which a day is low sleep")] = 6.0,
+    output_format: OutputFormat = "table",
+    page_size: PageSize = 0,
+):
+    """Group workout or sleep records by date, week, month, type or sleep quality and aggregate them."""
+    from groupby import group_by, parse_aggregations
+    from writers import OUTPUT_FORMATS, write_rows
+    
+    _check_user(store_dir, user)
+    if source not in ('workouts', 'sleep'):
+        print(f"Error: Unknown source {source!r}; use workouts or sleep")
+        raise typer.Exit(code=1)
+    if output_format not in OUTPUT_FORMATS:
+        print(f"Error: Unknown format {output_format!r}; use one of: {', '.join(OUTPUT_FORMATS)}")
+        raise typer.Exit(code=1)
+    try:
+        keys = [key.strip() for key in by.split(',') if key.strip()]
+        aggregations = parse_aggregations(agg)
+    except ValueError as e:
+        print(f"Error: {e}")
+        raise typer.Exit(code=1)
+    
+    with profiling_session(profile, cprofile_output) as profiler:
+        if store_dir:
+            from sqlite_store import is_sqlite_store, load_datasets
+            from store import load_store
+            with _stage(profiler, 'load store'):
+                try:
+                    if is_sqlite_store(store_dir):
+                        norm_sleep, norm_workouts = load_datasets(store_dir, local_time_zone, user,
+                                                                  _as_date(date_from), _as_date(date_to))
+                    else:
+                        norm_sleep, norm_workouts = load_store(store_dir, local_time_zone,
+                                                               _as_date(date_from), _as_date(date_to))
+                except (FileNotFoundError, ValueError) as e:
+                    print(f"Error: {e}")
+                    raise typer.Exit(code=1)
+        else:
+            from cache import ResultCache
+            norm_sleep, norm_workouts, _ = load_normalized(
+                sleep_json_file, workouts_json_file, local_time_zone,
+                None if no_cache else ResultCache(), profiler, workers, chunk_size,
+            )
+            if date_from is not None or date_to is not None:
+                norm_sleep = norm_sleep.date_range(_as_date(date_from), _as_date(date_to))
+                norm_workouts = norm_workouts.date_range(_as_date(date_from), _as_date(date_to))
+    
+        # Workouts see the sleep of their day (for 'quality' and the
+        # low-sleep filter); sleep records carry their own
+        records, sleep = (norm_workouts, norm_sleep) if source == 'workouts' else (norm_sleep, None)
+        with _stage(profiler, 'group by') as stage:
+            try:
+                rows = group_by(records, keys, aggregations, sleep,
+                                low_sleep_threshold if low_sleep_only else None)
+            except ValueError as e:
+                print(f"Error: {e}")
+                raise typer.Exit(code=1)
+            stage['records'] = len(records)
+        with _stage(profiler, 'render'):
+            write_rows(rows, output_format, page_size=page_size)
+
+
+@app.command()
+def batch(
+    manifest: Annotated[str, typer.Argument(help="CSV or JSON/NDJSON file with user_id, sleep_file, workouts_file, timezone")],
+    output: Annotated[str, typer.Option(help="Results file (.csv for CSV, otherwise NDJSON)")] = "batch_results.ndjson",
+    workers: Annotated[int, typer.Option(min=0, help="Worker processes (default: number of CPUs)")] = None,
+    chunk_size: Annotated[int, typer.Option(min=1, help="Users sent to a worker at a time")] = 8,
+):
+    """Run the analysis for many users from a manifest in a process pool."""
+    from batch import read_manifest, run_batch, write_results
+    
+    try:
+        entries = read_manifest(manifest)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}")
+        raise typer.Exit(code=1)
+    total, failed = write_results(run_batch(entries, workers, chunk_size), output)
+    print(f"Processed {total} user(s), {failed} failed. Results written to {output}")
+
+
+@app.command()
+def ingest(
+    store_dir: Annotated[str, typer.Option("--store", help="Store directory, or SQLite .db file, to write")],
+    sleep_json_file: SleepFile = "data/sleep.json",
+    workouts_json_file: WorkoutsFile = "data/workouts.json",
+    local_time_zone: LocalTimeZone = "America/Los_Angeles",
+    append: Annotated[bool, typer.Option("--append", help="Add the records to an existing store")] = False,
+    user: User = 'default',
+    workers: Workers = 1,
+    chunk_size: ChunkSize = 50_000,
+):
+    """Convert sleep and workout JSON into a memory-mapped columnar store or a SQLite database."""
+    from rollup import load_rollups, update_rollups
+    from sqlite_store import ingest as ingest_sqlite, is_sqlite_store
+    from store import ingest as ingest_store
+    
+    _check_user(store_dir, user)
+    norm_sleep, norm_workouts = _normalize_sources(
+        [(sleep_json_file, 'UTC', 'sleep'), (workouts_json_file, local_time_zone, 'workouts')],
+        None, workers, chunk_size,
+    )
+    if is_sqlite_store(store_dir):
+        # One bulk insert per table, in a single transaction
+        try:
+            ingest_sqlite(store_dir, norm_sleep, norm_workouts, local_time_zone, user, append)
+        except ValueError as e:
+            print(f"Error: {e}")
+            raise typer.Exit(code=1)
+        print(f"Stored {len(norm_sleep)} sleep and {len(norm_workouts)} workout record(s) for {user} in {store_dir}")
+        return
+    
+    # Rollups that match the store before an append only need the
+    # appended days' periods rebuilt
+    rollups = load_rollups(store_dir, local_time_zone) if append else None
+    try:
+        ingest_store(store_dir, norm_sleep, norm_workouts, local_time_zone, append)
+    except ValueError as e:
+        print(f"Error: {e}")
+        raise typer.Exit(code=1)
+    ordinals = [*norm_sleep.local_ordinal, *norm_workouts.local_ordinal]
+    if ordinals:
+        update_rollups(store_dir, local_time_zone, rollups,
+                       date.fromordinal(min(ordinals)), date.fromordinal(max(ordinals)))
+    print(f"Stored {len(norm_sleep)} sleep and {len(norm_workouts)} workout record(s) in {store_dir}")
+
+
+@app.command()
+def watch(
+    sleep_json_file: Annotated[str, typer.Option(help="Path to an append-only sleep NDJSON file")] = "data/sleep.ndjson",
+    workouts_json_file: Annotated[str, typer.Option(help="Path to an append-only workouts NDJSON file")] = "data/workouts.ndjson",
+    local_time_zone: LocalTimeZone = "America/Los_Angeles",
+    interval: Annotated[float, typer.Option(help="Seconds between checks for new records")] = 2.0,
+    low_sleep_threshold: Annotated[float, typer.Option(help="Sleep hours below which a day is low sleep")] = 6.0,
+    output: Annotated[str, typer.Option(help="Also write each refreshed summary to this JSON file")] = None,
+    polls: Annotated[int, typer.Option(help="Stop after this many checks (0 = run until interrupted)")] = 0,
+):
+    """Follow NDJSON files as they grow and print the summary whenever days change."""
+    import json
+    import os
+    import time
+    from tabulate import tabulate
+    from watch import HealthWatcher
+    
+    def publish(results, changed):
+        print(f"Updated {len(changed)} day(s), {changed[0]} to {changed[-1]}")
+        print(tabulate(list(results.items()), headers=["Metric", "Value"], tablefmt="grid"), flush=True)
+        if output:
+            # Replace the file in one step so readers never see half of it
+            with open(output + '.tmp', 'w') as f:
+                json.dump({'updated': changed, 'summary': results}, f)
+            os.replace(output + '.tmp', output)
+    
+    watcher = HealthWatcher(sleep_json_file, workouts_json_file, local_time_zone, low_sleep_threshold, [publish])
+    count = 0
+    try:
+        while True:
+            watcher.poll()
+            count += 1
+            if polls and count >= polls:
+                break
+            time.sleep(interval)
+    except ValueError as e:
+        print(f"Error: {e}")
+        raise typer.Exit(code=1)
+    except KeyboardInterrupt:
+        pass
+
+
+@app.command()
+def serve(
+    sleep_json_file: SleepFile = "data/sleep.json",
+    workouts_json_file: WorkoutsFile = "data/workouts.json",
+    local_time_zone: LocalTimeZone = "America/Los_Angeles",
+    manifest: Annotated[str, typer.Option(help="Serve every user in a batch manifest instead of one pair of files")] = None,
+    host: Annotated[str, typer.Option(help="Address to listen on")] = "127.0.0.1",
+    port: Annotated[int, typer.Option(help="Port to listen on")] = 8080,
+    cache_mb: Annotated[int, typer.Option(help="Memory for cached merged datasets, in MiB")] = 256,
+):
+    """Answer /days and /summary queries over HTTP from an in-memory cache."""
+    import asyncio
+    from batch import read_manifest
+    from server import DEFAULT_USER, DatasetCache, HealthServer
+    
+    if manifest:
+        try:
+            users = {entry['user_id']: entry for entry in read_manifest(manifest)}
+        except (OSError, ValueError) as e:
+            print(f"Error: {e}")
+            raise typer.Exit(code=1)
+    else:
+        users = {DEFAULT_USER: {'user_id': DEFAULT_USER, 'sleep_file': sleep_json_file,
+                                'workouts_file': workouts_json_file, 'timezone': local_time_zone}}
+    
+    server = HealthServer(users, DatasetCache(cache_mb * 1024 * 1024))
+    try:
+        asyncio.run(server.serve_forever(host, port))
+    except KeyboardInterrupt:
+        pass
+
+
+@cache_app.command("clear")
+def cache_clear():
+    """Delete all cached results."""
+    from cache import ResultCache
+    
+    cache = ResultCache()
+    removed = cache.clear()
+    print(f"Removed {removed} cached result(s) from {cache.directory}")
 
 
 if __name__ == '__main__':
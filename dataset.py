@@ -0,0 +1,395 @@
+import math
+from array import array
+from bisect import bisect_left, bisect_right
+from collections.abc import Mapping
+from datetime import date, datetime, timedelta
+from itertools import repeat
+
+import pytz
+
+
+# Fields kept from the raw records, by storage kind
+NUMERIC_FIELDS = ('hours', 'calories', 'duration')
+CATEGORICAL_FIELDS = ('quality', 'type')
+
+_UNIX_EPOCH = datetime(1970, 1, 1, tzinfo=pytz.UTC)
+_MISSING = math.nan
+
+# Categorical codes are uint16, and code 0 means missing
+MAX_CATEGORIES = 1 << 16
+
+
+class NormalizedDataset:
+    """
+    Column-oriented store of normalized health records.
+
+    normalize_to_utc() returns one dict per record plus a datetime and a
+    date object each, which is several hundred bytes per record. This
+    class keeps the same information in typed arrays instead:
+
+        utc_epoch      int64    UTC seconds since 1970-01-01
+        local_ordinal  int32    local calendar day as date.toordinal()
+        hours, calories, duration
+                       float64  NaN when the record doesn't have the field
+        quality, type  uint16   codes into a per-column category list
+
+    That is about 40 bytes per record. Numeric columns that only ever
+    held ints give ints back, so sums match the dict-based pipeline.
+
+    Datasets read from a column store (store.ColumnStore.read) may hold
+    read-only memoryviews into the file instead of arrays; they are
+    copied into arrays the first time rows are added.
+
+    Indexing or iterating yields RecordView objects, which behave like the
+    dicts normalize_to_utc() produces, so merge_datasets() can take a
+    NormalizedDataset directly.
+
+    Once sorted with sorted_by_date(), the local_ordinal column doubles
+    as a date index: date_range() finds a range of days by binary search
+    and copies only those rows.
+    """
+
+    def __init__(self, numeric_fields=NUMERIC_FIELDS, categorical_fields=CATEGORICAL_FIELDS):
+        self.utc_epoch = array('q')
+        self.local_ordinal = array('i')
+        self.numeric = {name: array('d') for name in numeric_fields}
+        # A numeric column stays integral while every value seen is an int
+        self.integral = {name: True for name in numeric_fields}
+        self.codes = {name: array('H') for name in categorical_fields}
+        # Code 0 is reserved for a missing value
+        self.categories = {name: [None] for name in categorical_fields}
+        self._category_index = {name: {None: 0} for name in categorical_fields}
+        # Whether rows are in local date order; None means not checked yet
+        self._date_sorted = None
+
+    def __len__(self):
+        return len(self.utc_epoch)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('dataset index out of range')
+        return RecordView(self, index)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield RecordView(self, index)
+
+    def append(self, utc_epoch, local_ordinal, record):
+        """
+        Add one record.
+
+        Args:
+            utc_epoch (int): UTC seconds since 1970-01-01
+            local_ordinal (int): Local calendar day as date.toordinal()
+            record (dict): The raw record the other fields are taken from
+        """
+        self._own_columns()
+        self.utc_epoch.append(utc_epoch)
+        self.local_ordinal.append(local_ordinal)
+        self._date_sorted = None
+
+        for name, column in self.numeric.items():
+            value = record.get(name)
+            if value is None:
+                column.append(_MISSING)
+            else:
+                if self.integral[name] and not isinstance(value, int):
+                    self.integral[name] = False
+                column.append(value)
+
+        for name, column in self.codes.items():
+            column.append(self._encode(name, record.get(name)))
+
+    def extend(self, other):
+        """
+        Append every row of another dataset with the same fields.
+
+        Category codes are translated into this dataset's code lists, so
+        datasets built separately (e.g. by normalize_parallel() workers)
+        can be concatenated.
+        """
+        self._own_columns()
+        self.utc_epoch.extend(other.utc_epoch)
+        self.local_ordinal.extend(other.local_ordinal)
+        self._date_sorted = None
+
+        for name, column in self.numeric.items():
+            column.extend(other.numeric[name])
+            self.integral[name] = self.integral[name] and other.integral[name]
+
+        for name, column in self.codes.items():
+            mapping = [self._encode(name, value) for value in other.categories[name]]
+            if mapping == list(range(len(mapping))):
+                column.extend(other.codes[name])
+            else:
+                column.extend(array('H', map(mapping.__getitem__, other.codes[name])))
+
+    def extend_columns(self, utc_epoch, local_ordinal, values):
+        """
+        Append rows given column by column, e.g. as read from a database.
+        
+        Args:
+            utc_epoch (iterable): UTC seconds since 1970-01-01, per row
+            local_ordinal (iterable): Local calendar days, per row
+            values (dict): Field name -> sequence of that field's values,
+                None where a row doesn't have it. Fields left out are
+                missing in every row.
+        """
+        self._own_columns()
+        start = len(self)
+        self.utc_epoch.extend(utc_epoch)
+        self.local_ordinal.extend(local_ordinal)
+        count = len(self) - start
+        self._date_sorted = None
+        
+        for name, column in self.numeric.items():
+            field_values = values.get(name)
+            if field_values is None:
+                column.extend(repeat(_MISSING, count))
+                continue
+            column.extend(_MISSING if value is None else value for value in field_values)
+            if self.integral[name]:
+                self.integral[name] = all(isinstance(value, int) for value in field_values if value is not None)
+        
+        for name, column in self.codes.items():
+            field_values = values.get(name)
+            if field_values is None:
+                column.extend(repeat(0, count))
+            else:
+                column.extend(self._encode(name, value) for value in field_values)
+    
+    def _encode(self, name, value):
+        index = self._category_index[name]
+        code = index.get(value)
+        if code is None:
+            code = len(self.categories[name])
+            if code >= MAX_CATEGORIES:
+                raise ValueError(f"Too many distinct {name!r} values; at most {MAX_CATEGORIES - 1} are supported")
+            index[value] = code
+            self.categories[name].append(value)
+        return code
+
+    def value(self, name, index):
+        """Return one field of one record, or None if it is missing."""
+        if name in self.numeric:
+            value = self.numeric[name][index]
+            if value != value:  # NaN
+                return None
+            return int(value) if self.integral[name] else value
+        return self.categories[name][self.codes[name][index]]
+
+    def column_values(self, name):
+        """
+        Lazy iterator over one field's values in row order, as value()
+        gives them; a field the dataset doesn't have is None throughout.
+        """
+        if name in self.numeric:
+            as_number = int if self.integral[name] else float
+            return (None if value != value else as_number(value) for value in self.numeric[name])
+        if name in self.codes:
+            return map(self.categories[name].__getitem__, self.codes[name])
+        return repeat(None, len(self))
+    
+    def is_date_sorted(self):
+        """Whether rows are in local date order (checked once, then remembered)."""
+        if self._date_sorted is None:
+            self._date_sorted = self.local_ordinal == array('i', sorted(self.local_ordinal))
+        return self._date_sorted
+
+    def sorted_by_date(self):
+        """
+        Return the rows in local date order, as a new dataset.
+
+        The sort is stable, so records of the same day keep their input
+        order. Returns self when the rows are already in order.
+        """
+        if self.is_date_sorted():
+            return self
+        order = sorted(range(len(self)), key=self.local_ordinal.__getitem__)
+        dataset = self._copy_with(lambda column: array(_typecode(column), map(column.__getitem__, order)))
+        dataset._date_sorted = True
+        return dataset
+
+    def date_range(self, start=None, end=None):
+        """
+        Return the rows whose local date is in [start, end], as a new dataset.
+
+        Uses binary search on the date-sorted local_ordinal column, so the
+        cost depends on the number of matching rows, not the dataset size.
+
+        Args:
+            start (date): First day to include, or None for no lower bound
+            end (date): Last day to include, or None for no upper bound
+
+        Raises:
+            ValueError: If the dataset is not sorted by date
+        """
+        if not self.is_date_sorted():
+            raise ValueError("date_range() needs a date-sorted dataset; call sorted_by_date() first")
+        low = 0 if start is None else bisect_left(self.local_ordinal, start.toordinal())
+        high = len(self) if end is None else bisect_right(self.local_ordinal, end.toordinal())
+        high = max(low, high)
+        dataset = self._copy_with(lambda column: column[low:high])
+        dataset._date_sorted = True
+        return dataset
+
+    def _own_columns(self):
+        """Replace memoryview columns (see ColumnStore.read) with arrays that can grow."""
+        if not isinstance(self.utc_epoch, memoryview):
+            return
+        self.utc_epoch = _to_array(self.utc_epoch)
+        self.local_ordinal = _to_array(self.local_ordinal)
+        self.numeric = {name: _to_array(column) for name, column in self.numeric.items()}
+        self.codes = {name: _to_array(column) for name, column in self.codes.items()}
+
+    def _copy_with(self, transform):
+        """New dataset with transform() applied to every column array."""
+        dataset = NormalizedDataset(tuple(self.numeric), tuple(self.codes))
+        dataset.utc_epoch = transform(self.utc_epoch)
+        dataset.local_ordinal = transform(self.local_ordinal)
+        dataset.numeric = {name: transform(column) for name, column in self.numeric.items()}
+        dataset.integral = dict(self.integral)
+        dataset.codes = {name: transform(column) for name, column in self.codes.items()}
+        dataset.categories = {name: list(values) for name, values in self.categories.items()}
+        dataset._category_index = {name: dict(index) for name, index in self._category_index.items()}
+        return dataset
+
+    def nbytes(self):
+        """Approximate memory used by the column arrays, in bytes."""
+        columns = [self.utc_epoch, self.local_ordinal, *self.numeric.values(), *self.codes.values()]
+        return sum(column.itemsize * len(column) for column in columns)
+
+
+def _typecode(column):
+    """Array typecode of a column, which may be an array or a memoryview."""
+    return column.format if isinstance(column, memoryview) else column.typecode
+
+
+def _to_array(column):
+    """The column as an array, copying it if it is a memoryview."""
+    if isinstance(column, memoryview):
+        column = array(column.format, column.tobytes())
+    return column
+
+
+class RecordView(Mapping):
+    """
+    Read-only dict-like view of one row of a NormalizedDataset.
+
+    Has the same keys a normalize_to_utc() record would have for the
+    stored fields, plus 'utc_datetime' and 'local_date'. Missing fields
+    are absent, so view.get('calories', 0) works as it does on a dict.
+    """
+
+    __slots__ = ('_dataset', '_index')
+
+    def __init__(self, dataset, index):
+        self._dataset = dataset
+        self._index = index
+
+    def __getitem__(self, key):
+        dataset, index = self._dataset, self._index
+        if key == 'utc_datetime':
+            return _UNIX_EPOCH + timedelta(seconds=dataset.utc_epoch[index])
+        if key == 'local_date':
+            return date.fromordinal(dataset.local_ordinal[index])
+        if key in dataset.numeric or key in dataset.codes:
+            value = dataset.value(key, index)
+            if value is not None:
+                return value
+        raise KeyError(key)
+
+    def __iter__(self):
+        yield 'utc_datetime'
+        yield 'local_date'
+        for name in (*self._dataset.numeric, *self._dataset.codes):
+            if self._dataset.value(name, self._index) is not None:
+                yield name
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return f'RecordView({dict(self)!r})'
+
+
+class ProjectedRecord(Mapping):
+    """
+    Compact normalized record holding only the fields a consumer needs.
+
+    normalize_to_utc(..., fields=...) yields these instead of dict copies.
+    Each one has a slot for the UTC epoch seconds, one for the local date
+    ordinal and one per projected field, with no per-record dict, so it
+    takes a fraction of the memory of a copied record with its datetime
+    and date objects. Fields missing from the raw record are left unset.
+
+    Like RecordView it reads like a normalize_to_utc() dict ('local_date',
+    'utc_datetime' at whole-second precision, and the fields), so
+    merge_datasets() and merge_streams() take it as is. Use record_type()
+    to get the class for a set of fields.
+    """
+
+    __slots__ = ('utc_epoch', 'local_ordinal')
+    fields = ()
+
+    def __init__(self, utc_epoch, local_ordinal, record):
+        self.utc_epoch = utc_epoch
+        self.local_ordinal = local_ordinal
+        for name in self.fields:
+            value = record.get(name)
+            if value is not None:
+                setattr(self, '_' + name, value)
+
+    def __getitem__(self, key):
+        if key == 'local_date':
+            return date.fromordinal(self.local_ordinal)
+        if key == 'utc_datetime':
+            return _UNIX_EPOCH + timedelta(seconds=self.utc_epoch)
+        if key in self.fields:
+            try:
+                return getattr(self, '_' + key)
+            except AttributeError:
+                pass
+        raise KeyError(key)
+
+    def __iter__(self):
+        yield 'utc_datetime'
+        yield 'local_date'
+        for name in self.fields:
+            if hasattr(self, '_' + name):
+                yield name
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return f'{type(self).__name__}({dict(self)!r})'
+
+
+_record_types = {}
+
+
+def record_type(fields):
+    """
+    Return the ProjectedRecord subclass with a slot for each of fields.
+
+    Classes are cached, so every call with the same fields gives the same
+    class.
+
+    Raises:
+        ValueError: If a field name isn't a valid identifier
+    """
+    fields = tuple(fields)
+    cls = _record_types.get(fields)
+    if cls is None:
+        for name in fields:
+            if not name.isidentifier():
+                raise ValueError(f"Field name {name!r} is not a valid identifier")
+        name = 'Record_' + '_'.join(fields) if fields else 'Record'
+        cls = _record_types[fields] = type(name, (ProjectedRecord,), {
+            '__slots__': tuple('_' + field for field in fields),
+            'fields': fields,
+        })
+    return cls
@@ -0,0 +1,191 @@
+"""
+Single-pass hash aggregation over normalized records.
+
+merge_datasets() answers one fixed question (per-day totals). group_by()
+answers the others, e.g. "calories by workout type per ISO week on
+low-sleep days":
+
+    group_by(workouts, ['week', 'type'],
+             [Aggregation('calories', 'sum', 'calories'), Aggregation('workouts', 'count')],
+             sleep=sleep, low_sleep_threshold=6.0)
+
+Every record is looked at once: its group key is built, and each
+aggregation's running state for that key is updated in a dict, so time
+is linear in the number of records and memory in the number of groups.
+Calendar keys are worked out once per day, not per record, and a
+NormalizedDataset is read column by column without building records.
+"""
+
+from datetime import date
+
+from dataset import NormalizedDataset
+from merger import AGGREGATORS, Aggregation
+
+
+# Grouping keys: calendar keys of the record's local date, the workout
+# type, and the sleep quality (of the record, or of its day with sleep=)
+GROUP_KEYS = ('date', 'week', 'month', 'type', 'quality')
+CALENDAR_KEYS = ('date', 'week', 'month')
+
+AGGREGATION_OPS = ('sum', 'count', 'mean', 'min', 'max')
+
+
+def group_by(records, keys, aggregations, sleep=None, low_sleep_threshold=None):
+    """
+    Group normalized records and aggregate each group in one pass.
+
+    Args:
+        records (iterable): Normalized records (a NormalizedDataset, or any
+            normalize_to_utc() style records, including streams)
+        keys (list): Names from GROUP_KEYS, in output order
+        aggregations (list): Aggregation specs with an op from
+            AGGREGATION_OPS. 'count' without a field counts records; with
+            a field, the records that have it. Missing values are skipped.
+        sleep (iterable): Optional normalized sleep records to join on
+            local date (last sleep of a day wins, as in merge_datasets());
+            then 'quality' is the day's sleep quality
+        low_sleep_threshold (float): If given, only records on days that
+            slept fewer hours than this are counted (days without sleep
+            data are left out). Uses the sleep records, or the records'
+            own 'hours' without them.
+
+    Returns:
+        list: One dict per group, sorted by key: the key values (e.g.
+            'week': '2023-W40', 'type': 'run'), then one entry per
+            aggregation output (its default for empty results)
+
+    Raises:
+        ValueError: If a key or op is unknown
+    """
+    for key in keys:
+        if key not in GROUP_KEYS:
+            raise ValueError(f"Unknown group key {key!r}; use one of: {', '.join(GROUP_KEYS)}")
+    for aggregation in aggregations:
+        if aggregation.op not in AGGREGATION_OPS:
+            raise ValueError(f"Unknown aggregation op {aggregation.op!r}; use one of: {', '.join(AGGREGATION_OPS)}")
+
+    sleep_by_day = None if sleep is None else _sleep_by_day(sleep)
+
+    # Fields read from each record: the per-record keys, the aggregated
+    # fields and, for the filter without sleep data, the hours
+    fields = []
+    for key in keys:
+        if key == 'type' or (key == 'quality' and sleep_by_day is None):
+            fields.append(key)
+    if low_sleep_threshold is not None and sleep_by_day is None:
+        fields.append('hours')
+    fields += [a.field for a in aggregations if a.field is not None]
+    fields = list(dict.fromkeys(fields))
+    position = {name: index for index, name in enumerate(fields, start=1)}
+
+    # Where each key part comes from: ('day', calendar index), ('field',
+    # row index) or ('sleep', None) for the day's sleep quality
+    key_plan = []
+    for key in keys:
+        if key in CALENDAR_KEYS:
+            key_plan.append(('day', CALENDAR_KEYS.index(key)))
+        elif key in position:
+            key_plan.append(('field', position[key]))
+        else:
+            key_plan.append(('sleep', None))
+    value_plan = [(a.op, None if a.field is None else position[a.field]) for a in aggregations]
+    hours_index = position.get('hours')
+
+    calendar = {}  # ordinal -> (date, week, month) strings
+    groups = {}
+    for row in _field_rows(records, fields):
+        ordinal = row[0]
+        if low_sleep_threshold is not None:
+            if sleep_by_day is None:
+                hours = row[hours_index]
+            else:
+                hours = sleep_by_day.get(ordinal, (None, None))[0]
+            if hours is None or hours >= low_sleep_threshold:
+                continue
+
+        day = calendar.get(ordinal)
+        if day is None:
+            day = calendar[ordinal] = _calendar_keys(ordinal)
+        key = tuple(day[index] if source == 'day'
+                    else row[index] if source == 'field'
+                    else sleep_by_day.get(ordinal, (None, None))[1]
+                    for source, index in key_plan)
+
+        states = groups.get(key)
+        if states is None:
+            states = groups[key] = [AGGREGATORS[op][0]() for op, _ in value_plan]
+        for state, (op, index) in zip(states, value_plan):
+            if index is None:
+                AGGREGATORS[op][1](state, None)  # 'count' of records
+                continue
+            # Missing values are skipped, so a 'count' of a field counts
+            # the records that have it
+            value = row[index]
+            if value is not None:
+                AGGREGATORS[op][1](state, value)
+
+    results = []
+    for key in sorted(groups, key=_sort_key):
+        row = dict(zip(keys, key))
+        for aggregation, state in zip(aggregations, groups[key]):
+            value = AGGREGATORS[aggregation.op][2](state)
+            row[aggregation.output] = aggregation.default if value is None else value
+        results.append(row)
+    return results
+
+
+def parse_aggregations(text):
+    """
+    Parse 'field:op' items, e.g. 'calories:sum,duration:mean,count'.
+
+    A bare 'count' counts records. Outputs are named 'field_op' (or
+    'count').
+
+    Returns:
+        list: Aggregation specs
+
+    Raises:
+        ValueError: If an item has an unknown op
+    """
+    aggregations = []
+    for item in text.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        if item == 'count':
+            aggregations.append(Aggregation('count', 'count'))
+            continue
+        field, _, op = item.partition(':')
+        if op not in AGGREGATION_OPS:
+            raise ValueError(f"Invalid aggregation {item!r}; use field:op with op one of: {', '.join(AGGREGATION_OPS)}")
+        aggregations.append(Aggregation(f'{field}_{op}', op, field))
+    return aggregations
+
+
+def _calendar_keys(ordinal):
+    """(ISO date, ISO week like '2023-W40', month like '2023-10') of a day."""
+    day = date.fromordinal(ordinal)
+    year, week, _ = day.isocalendar()
+    return day.isoformat(), f'{year}-W{week:02d}', f'{day.year}-{day.month:02d}'
+
+
+def _sort_key(key):
+    # None sorts after every value
+    return [(value is None, '' if value is None else value) for value in key]
+
+
+def _sleep_by_day(sleep):
+    """Local date ordinal -> (hours, quality) of the day's last sleep record."""
+    return {ordinal: (hours, quality) for ordinal, hours, quality in _field_rows(sleep, ['hours', 'quality'])}
+
+
+def _field_rows(records, fields):
+    """
+    Yield (local date ordinal, *field values) for each record.
+
+    A NormalizedDataset is read straight from its columns, so no record
+    objects are made; missing values come back as None either way.
+    """
+    if isinstance(records, NormalizedDataset):
+        return zip(records.local_ordinal, *(records.column_values(name) for name in fields))
+    return ((record['local_date'].toordinal(), *(record.get(name) for name in fields)) for record in records)
@@ -1,5 +1,6 @@
 import json
 import sys
+from itertools import chain
 
 
 def load_json_data(filepath):
@@ -27,3 +28,126 @@ def load_json_data(filepath):
         print(f"Error: Invalid JSON in file {filepath}")
         raise
 
+
+def iter_json_records(filepath, chunk_size=1 << 16):
+    """
+    Stream records one at a time from a JSON array or NDJSON file.
+    
+    The format is detected from the first non-whitespace character: a
+    top-level '[' is read as a JSON array, anything else as NDJSON (one
+    JSON record per line). Only one chunk of the file plus the current
+    record is held in memory, so memory stays flat as the file grows.
+    
+    Args:
+        filepath: Path to the JSON or NDJSON file
+        chunk_size: Number of characters to read from the file at a time
+        
+    Yields:
+        Each parsed record in file order
+        
+    Raises:
+        FileNotFoundError: If the file doesn't exist
+        json.JSONDecodeError: If the file contains invalid JSON
+    """
+    try:
+        with open(filepath, 'r') as f:
+            prefix = _skip_whitespace(f, chunk_size)
+            if prefix.startswith('['):
+                yield from _iter_json_array(f, chunk_size, prefix)
+            elif prefix:
+                yield from _iter_ndjson(f, prefix)
+    except FileNotFoundError:
+        print(f"Error: File not found: {filepath}")
+        raise
+    except json.JSONDecodeError as e:
+        print(f"Error: Invalid JSON in file {filepath}")
+        raise
+
+
+def _skip_whitespace(f, chunk_size):
+    """
+    Read past leading whitespace in chunks of chunk_size characters.
+    
+    Returns the text read from the first non-whitespace character on
+    ('' for a blank file); the caller parses it before the rest of f.
+    Reading by lines instead would load a minified one-line export
+    whole.
+    """
+    while True:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            return ''
+        stripped = chunk.lstrip()
+        if stripped:
+            return stripped
+
+
+def _iter_json_array(f, chunk_size, prefix):
+    """
+    Incrementally decode the elements of a top-level JSON array, starting at prefix.
+    
+    Raises:
+        json.JSONDecodeError: If the array is malformed, including a
+            missing, doubled or trailing comma
+    """
+    decoder = json.JSONDecoder()
+    buf = prefix[1:]  # drop the opening '['
+    pos = 0
+    eof = False
+    # Whether the last thing read was an element, so a ',' or ']' is due
+    after_element = False
+    first = True
+    
+    while True:
+        while pos < len(buf) and buf[pos] in ' \t\r\n':
+            pos += 1
+        if pos < len(buf):
+            char = buf[pos]
+            if after_element:
+                if char == ']':
+                    return
+                if char != ',':
+                    raise json.JSONDecodeError("Expecting ',' delimiter", buf, pos)
+                pos += 1
+                after_element = False
+                continue
+            if char == ']' and first:
+                return
+            if char in ',]':
+                raise json.JSONDecodeError('Expecting value', buf, pos)
+            
+            try:
+                record, end = decoder.raw_decode(buf, pos)
+                # A value ending exactly at the buffer edge may continue in
+                # the next chunk (e.g. a number), so only trust it at EOF
+                complete = end < len(buf) or eof
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                complete = False
+            
+            if complete:
+                yield record
+                pos = end
+                after_element = True
+                first = False
+                continue
+        elif eof:
+            raise json.JSONDecodeError('Unterminated array', buf, pos)
+        
+        # The current token is split across chunks: read more and retry
+        more = f.read(chunk_size)
+        buf = buf[pos:] + more
+        pos = 0
+        eof = not more
+
+
+def _iter_ndjson(f, prefix=''):
+    """Decode one JSON record per non-blank line, starting at prefix."""
+    # Complete the prefix's last, partial line from the file
+    *lines, partial = prefix.split('\n')
+    lines.append(partial + f.readline())
+    for line in chain(lines, f):
+        line = line.strip()
+        if line:
+            yield json.loads(line)
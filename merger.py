@@ -1,53 +1,404 @@
-from collections import defaultdict
+import heapq
+from array import array
+from bisect import bisect_right
+from datetime import date
+from itertools import groupby
+from typing import Any, NamedTuple, Optional
+
+from dataset import NormalizedDataset
+
+
+class Aggregation(NamedTuple):
+    """
+    How one output column of a merged day is computed from a source.
+    
+    op is one of 'sum', 'mean', 'max', 'min', 'last' or 'count'. field
+    is the record key to read (unused for 'count'). default is the value
+    for days with no records from the source, or no usable values.
+    """
+    output: str
+    op: str
+    field: Optional[str] = None
+    default: Any = None
+
+
+# The sleep + workout merge of merge_datasets(), declared as specs
+SLEEP_AGGREGATIONS = (
+    Aggregation('sleep_hours', 'last', 'hours'),
+    Aggregation('sleep_quality', 'last', 'quality'),
+)
+WORKOUT_AGGREGATIONS = (
+    Aggregation('total_calories', 'sum', 'calories', 0),
+    Aggregation('workout_count', 'count', default=0),
+    Aggregation('workout_time', 'sum', 'duration', 0),
+)
+
+
+def required_fields(aggregations):
+    """
+    The record fields a set of Aggregation specs reads, in first-use order.
+    
+    This is what a source needs to keep when it is normalized with
+    projection (normalize_to_utc(..., fields=...)); everything else in
+    the raw records, such as free-text comments, can be dropped.
+    """
+    return tuple(dict.fromkeys(a.field for a in aggregations if a.field is not None))
+
+
+# Fields merge_datasets() and merge_streams() read from each source
+SLEEP_FIELDS = required_fields(SLEEP_AGGREGATIONS)
+WORKOUT_FIELDS = required_fields(WORKOUT_AGGREGATIONS)
+
 
 def merge_datasets(sleep_data, workout_data):
     """
     Merge sleep and workout data by local date.
+    
+    Both inputs are consumed in a single pass and may be lists or streams
+    (e.g. normalizer.iter_normalize_to_utc()). Only per-day totals are
+    kept, so memory grows with the number of days, not records.
+    
+    When both inputs are NormalizedDataset objects the vectorized
+    merge_columns() is used instead; the output is the same.
     """
-    # Group sleep by date
-    sleep_by_date = defaultdict(list)
+    if isinstance(sleep_data, NormalizedDataset) and isinstance(workout_data, NormalizedDataset):
+        return merge_columns(sleep_data, workout_data)
+    
+    index = DayIndex()
+    # Group sleep by date; assume one sleep per day (the last one wins)
     for record in sleep_data:
-        date_key = record['local_date'].isoformat()
-        sleep_by_date[date_key] = record
+        index.add_sleep(record)
     
-    # Group workouts by date
-    workouts_by_date = defaultdict(list)
+    # Group workouts by date; multiple workouts per day are summed up
     for record in workout_data:
+        index.add_workout(record)
+    
+    return index.rows()
+
+
+class DayIndex:
+    """
+    Merged days kept up to date record by record.
+    
+    The per-date groups of merge_datasets(): the last sleep record of
+    each day, and running workout [calories, count, duration] totals.
+    merge_datasets() fills one from whole streams; watch.py keeps one
+    and reads back single days as they change.
+    """
+    
+    def __init__(self):
+        self.sleep_by_date = {}
+        self.workouts_by_date = {}
+    
+    def __len__(self):
+        return len(self.sleep_by_date.keys() | self.workouts_by_date.keys())
+    
+    def __contains__(self, date_key):
+        return date_key in self.sleep_by_date or date_key in self.workouts_by_date
+    
+    def add_sleep(self, record):
+        """Apply one normalized sleep record. Returns its date key."""
+        date_key = record['local_date'].isoformat()
+        self.sleep_by_date[date_key] = (record.get('hours'), record.get('quality'))
+        return date_key
+    
+    def add_workout(self, record):
+        """Apply one normalized workout record. Returns its date key."""
         date_key = record['local_date'].isoformat()
-        # workouts_by_date[date_key] = workouts_by_date[date_key] + record['duration']
+        totals = self.workouts_by_date.get(date_key)
+        if totals is None:
+            totals = self.workouts_by_date[date_key] = [0, 0, 0]
+        totals[0] += record.get('calories', 0)
+        totals[1] += 1
+        totals[2] += record.get('duration', 0)
+        return date_key
+    
+    def row(self, date_key):
+        """The merged row for one day."""
+        sleep_hours, sleep_quality = self.sleep_by_date.get(date_key, (None, None))
+        calories, count, duration = self.workouts_by_date.get(date_key, (0, 0, 0))
+        return {
+            'date': date_key,
+            'sleep_hours': sleep_hours,
+            'sleep_quality': sleep_quality,
+            'total_calories': calories,
+            'workout_count': count,
+            'workout_time': duration,
+        }
+    
+    def rows(self):
+        """Every merged row, sorted by date."""
+        return [self.row(date_key) for date_key in sorted(self.sleep_by_date.keys() | self.workouts_by_date.keys())]
 
-        workouts_by_date[date_key].append(record)
+
+def merge_columns(sleep_data, workout_data):
+    """
+    Merge two NormalizedDatasets on their integer local-date ordinals.
+    
+    Produces exactly what merge_datasets() produces for the same records,
+    but works on whole columns: workouts are stably sorted by day, each
+    day's rows become one contiguous slice, and calories and duration are
+    reduced with sum() over array slices. Python-level work is per day,
+    not per record.
     
-    # Get all dates
-    all_dates = set(sleep_by_date.keys()).union(set(workouts_by_date.keys())) 
+    Args:
+        sleep_data (NormalizedDataset): Normalized sleep records
+        workout_data (NormalizedDataset): Normalized workout records
     
-    # Merge
+    Returns:
+        list: One merged dict per day, sorted by date
+    """
+    # Last sleep record of each day wins, as in merge_datasets()
+    sleep_rows = dict(zip(sleep_data.local_ordinal, range(len(sleep_data))))
+    
+    # Group-by: with workouts sorted by day, each day is the slice
+    # [start, end) of the columns. Exports are usually already in order;
+    # otherwise sort stably, so each day keeps its input order
+    ordinals = workout_data.local_ordinal
+    calories = _zero_missing(workout_data.numeric['calories'])
+    durations = _zero_missing(workout_data.numeric['duration'])
+    workout_days = _day_slices(ordinals)
+    if workout_days is None:
+        order = sorted(range(len(ordinals)), key=ordinals.__getitem__)
+        ordinals = array('i', map(ordinals.__getitem__, order))
+        calories = array('d', map(calories.__getitem__, order))
+        durations = array('d', map(durations.__getitem__, order))
+        workout_days = _day_slices(ordinals)
+    
+    as_calories = int if workout_data.integral['calories'] else float
+    as_duration = int if workout_data.integral['duration'] else float
+    
+    # Outer join with sleep
     merged = []
-    for date_str in sorted(all_dates):
-        daily = {'date': date_str}
+    for day in sorted(sleep_rows.keys() | workout_days.keys()):
+        daily = {'date': date.fromordinal(day).isoformat()}
+        
+        row = sleep_rows.get(day)
+        daily['sleep_hours'] = None if row is None else sleep_data.value('hours', row)
+        daily['sleep_quality'] = None if row is None else sleep_data.value('quality', row)
+        
+        if day in workout_days:
+            start, end = workout_days[day]
+            daily['total_calories'] = as_calories(sum(calories[start:end]))
+            daily['workout_count'] = end - start
+            daily['workout_time'] = as_duration(sum(durations[start:end]))
+        else:
+            daily['total_calories'] = 0
+            daily['workout_count'] = 0
+            daily['workout_time'] = 0
+        
+        merged.append(daily)
+    
+    return merged
+
+
+def iter_merge_columns(sleep_data, workout_data):
+    """
+    Yield the rows of merge_columns() one day at a time.
+    
+    For date-sorted datasets (see NormalizedDataset.sorted_by_date())
+    both are walked in step, each day being a bisect into the next run of
+    rows, so the first row is produced after a constant amount of work
+    and nothing is buffered. Unsorted datasets are merged up front with
+    merge_columns() and then yielded.
+    
+    Args:
+        sleep_data (NormalizedDataset): Normalized sleep records
+        workout_data (NormalizedDataset): Normalized workout records
+    
+    Yields:
+        dict: The same rows merge_columns() returns, in date order
+    """
+    if not (sleep_data.is_date_sorted() and workout_data.is_date_sorted()):
+        yield from merge_columns(sleep_data, workout_data)
+        return
+    
+    sleep_ordinals = sleep_data.local_ordinal
+    workout_ordinals = workout_data.local_ordinal
+    calories = workout_data.numeric['calories']
+    durations = workout_data.numeric['duration']
+    as_calories = int if workout_data.integral['calories'] else float
+    as_duration = int if workout_data.integral['duration'] else float
+    
+    sleep_count, workout_count = len(sleep_ordinals), len(workout_ordinals)
+    i = j = 0  # next unmerged sleep and workout rows
+    while i < sleep_count or j < workout_count:
+        if j == workout_count or (i < sleep_count and sleep_ordinals[i] <= workout_ordinals[j]):
+            day = sleep_ordinals[i]
+        else:
+            day = workout_ordinals[j]
+        daily = {'date': date.fromordinal(day).isoformat()}
         
-        # Add sleep data; assume one sleep per day
-        if date_str in sleep_by_date:
-            sleep = sleep_by_date[date_str]
-            daily['sleep_hours'] = sleep.get('hours')
-            daily['sleep_quality'] = sleep.get('quality')
+        if i < sleep_count and sleep_ordinals[i] == day:
+            end = bisect_right(sleep_ordinals, day, i)
+            # Last sleep record of the day wins
+            daily['sleep_hours'] = sleep_data.value('hours', end - 1)
+            daily['sleep_quality'] = sleep_data.value('quality', end - 1)
+            i = end
         else:
             daily['sleep_hours'] = None
             daily['sleep_quality'] = None
         
-        # Add workout data
-        if date_str in workouts_by_date:
-            workouts = workouts_by_date[date_str]
-           # Assume multiple workout per day and sum up the calories and the duration.
-            daily['total_calories'] = sum(w.get('calories', 0) for w in workouts)
-            daily['workout_count'] = len(workouts)
-            daily['workout_time'] = sum(w.get('duration', 0) for w in workouts)
+        if j < workout_count and workout_ordinals[j] == day:
+            end = bisect_right(workout_ordinals, day, j)
+            daily['total_calories'] = as_calories(_sum_present(calories[j:end]))
+            daily['workout_count'] = end - j
+            daily['workout_time'] = as_duration(_sum_present(durations[j:end]))
+            j = end
         else:
-            # daily['workouts'] = []
             daily['total_calories'] = 0
             daily['workout_count'] = 0
             daily['workout_time'] = 0
         
-        merged.append(daily)
+        yield daily
+
+
+def _sum_present(values):
+    """Sum of a column slice, treating NaN (missing) as 0."""
+    total = sum(values)
+    if total == total:
+        return total
+    return sum(value for value in values if value == value)
+
+
+def _day_slices(ordinals):
+    """
+    Map each day to its (start, end) slice of a day-sorted ordinal array.
+    
+    Returns None if the array isn't sorted. The per-day work is a bisect
+    and a C-level slice comparison, so this is fast for millions of rows.
+    """
+    slices = {}
+    start = 0
+    previous = None
+    for day in dict.fromkeys(ordinals):
+        if previous is not None and day < previous:
+            return None
+        end = bisect_right(ordinals, day, start)
+        # bisect assumes sorted input, so check the slice really is one run
+        if end <= start or ordinals[start:end] != array('i', [day]) * (end - start):
+            return None
+        slices[day] = (start, end)
+        start = end
+        previous = day
+    if start != len(ordinals):
+        return None
+    return slices
+
+
+def _zero_missing(column):
+    """Replace NaN (missing) values with 0, like record.get(field, 0)."""
+    total = sum(column)
+    if total == total:  # no NaN anywhere
+        return column
+    return array('d', (0.0 if value != value else value for value in column))
+
+
+def merge_streams(sources):
+    """
+    K-way merge of any number of date-sorted record streams into daily rows.
+    
+    Each source is a (records, aggregations) pair: records is an iterable
+    of normalized records sorted by 'local_date' (e.g. normalizer output
+    for a chronological export), and aggregations is a sequence of
+    Aggregation specs. A heap merges the streams on local date, and only
+    the current day's running values are kept, so memory is constant no
+    matter how long the streams are.
     
-    return merged
\ No newline at end of file
+    With (sleep, SLEEP_AGGREGATIONS) and (workouts, WORKOUT_AGGREGATIONS)
+    the rows are the same as merge_datasets() gives. Other sources plug
+    in the same way, e.g.
+    
+        (heart_rate, [Aggregation('resting_hr', 'min', 'bpm'),
+                      Aggregation('max_hr', 'max', 'bpm')])
+    
+    Args:
+        sources (list): (records, aggregations) pairs
+    
+    Yields:
+        dict: One row per date present in any source, in date order, with
+            'date' and one key per aggregation output
+    
+    Raises:
+        ValueError: If a stream is not sorted by local date, or an
+            aggregation has an unknown op
+    """
+    for _, aggregations in sources:
+        for aggregation in aggregations:
+            if aggregation.op not in AGGREGATORS:
+                raise ValueError(f"Unknown aggregation op: {aggregation.op!r}")
+    
+    streams = [_check_sorted(records, index) for index, (records, _) in enumerate(sources)]
+    merged = heapq.merge(*streams, key=lambda item: item[0])
+    
+    for day, items in groupby(merged, key=lambda item: item[0]):
+        # Running state per (source, aggregation) for this day only
+        states = [None] * len(sources)
+        for _, index, record in items:
+            if states[index] is None:
+                states[index] = [AGGREGATORS[a.op][0]() for a in sources[index][1]]
+            for state, aggregation in zip(states[index], sources[index][1]):
+                value = None if aggregation.field is None else record.get(aggregation.field)
+                AGGREGATORS[aggregation.op][1](state, value)
+        
+        row = {'date': day.isoformat()}
+        for index, (_, aggregations) in enumerate(sources):
+            for position, aggregation in enumerate(aggregations):
+                value = None
+                if states[index] is not None:
+                    value = AGGREGATORS[aggregation.op][2](states[index][position])
+                row[aggregation.output] = aggregation.default if value is None else value
+        yield row
+
+
+def _check_sorted(records, index):
+    """Tag each record with (local_date, source index), checking date order."""
+    previous = None
+    for record in records:
+        day = record['local_date']
+        if previous is not None and day < previous:
+            raise ValueError(f"Source {index} is not sorted by local date ({day} after {previous})")
+        previous = day
+        yield day, index, record
+
+
+def _add_sum(state, value):
+    if value is not None:
+        state[0] += value
+
+
+def _add_mean(state, value):
+    if value is not None:
+        state[0] += value
+        state[1] += 1
+
+
+def _add_max(state, value):
+    if value is not None and (state[0] is None or value > state[0]):
+        state[0] = value
+
+
+def _add_min(state, value):
+    if value is not None and (state[0] is None or value < state[0]):
+        state[0] = value
+
+
+def _add_last(state, value):
+    state[0] = value
+
+
+def _add_count(state, value):
+    state[0] += 1
+
+
+# op -> (new state, add one record's value (None if it doesn't have the
+# field), final value or None for the default). Shared with groupby.py.
+AGGREGATORS = {
+    # A day with records always has a sum, even if no record had the field
+    'sum': (lambda: [0], _add_sum, lambda state: state[0]),
+    'mean': (lambda: [0, 0], _add_mean, lambda state: state[0] / state[1] if state[1] else None),
+    'max': (lambda: [None], _add_max, lambda state: state[0]),
+    'min': (lambda: [None], _add_min, lambda state: state[0]),
+    'last': (lambda: [None], _add_last, lambda state: state[0]),
+    'count': (lambda: [0], _add_count, lambda state: state[0]),
+}
@@ -1,9 +1,25 @@
-from datetime import datetime
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from itertools import islice
 import pytz
-from dateutil import parser
+from dataset import NormalizedDataset, record_type
+from timestamps import TimestampParser
+from tzcache import SECONDS_PER_DAY, UNIX_EPOCH_SECONDS, from_seconds, get_offset_table, to_seconds
 
+# Marks the end of the record stream in the timed normalization loop
+_END = object()
 
-def normalize_to_utc(data, source_tz):
+# Records per chunk sent to a worker by normalize_parallel()
+DEFAULT_CHUNK_SIZE = 50_000
+
+# Per-process state set up by _init_worker()
+_worker = {}
+
+
+def normalize_to_utc(data, source_tz, timestamp_parser=None, fields=None, in_place=False):
     """
     Convert all timestamps to UTC and store the local date.
     
@@ -12,71 +28,280 @@ def normalize_to_utc(data, source_tz):
     user's local timezone, while also storing UTC time for consistency.
     
     Args:
-        data (list): List of health records (sleep or workout data)
+        data (iterable): Health records (sleep or workout data), either a
+            list or a stream such as loader.iter_json_records()
         source_tz (str): IANA timezone name (e.g., 'UTC', 'America/Los_Angeles')
+        timestamp_parser (TimestampParser): Optional parser to use, e.g. to
+            read its hit/miss counts afterwards; a new one is used if omitted
+        fields (tuple): If given, return compact ProjectedRecord objects
+            with only these fields (see merger.SLEEP_FIELDS and
+            WORKOUT_FIELDS) instead of full copies of each record
+        in_place (bool): Add the two fields to the input dicts themselves
+            instead of copying them; the input records are changed
     
     Returns:
         list: Records with added 'utc_datetime' and 'local_date' fields
     
+    Raises:
+        ValueError: If both fields and in_place are given
+    
     Example:
         Input record:  {'timestamp': '2024-12-07T23:30:00', ...}
         With timezone: 'America/Los_Angeles'
         Output adds:   {'utc_datetime': <2024-12-08 07:30 UTC>,
                        'local_date': <2024-12-07>, ...}
     """
-    # Get the timezone object for the source data
-    # UTC is a special case - use the pytz.UTC constant
-    if source_tz == 'UTC':
-        tz = pytz.UTC
-    else:
-        # Convert IANA timezone string to pytz timezone object
-        tz = pytz.timezone(source_tz)
+    return list(iter_normalize_to_utc(data, source_tz, timestamp_parser, fields, in_place))
+
+
+def iter_normalize_to_utc(data, source_tz, timestamp_parser=None, fields=None, in_place=False):
+    """
+    Lazily normalize a stream of records, one record at a time.
+    
+    Same conversion as normalize_to_utc(), but yields each normalized
+    record instead of building a list, so a streamed file can flow into
+    merge_datasets() without ever being held in memory.
+    
+    Args:
+        data (iterable): Health records (sleep or workout data)
+        source_tz (str): IANA timezone name (e.g., 'UTC', 'America/Los_Angeles')
+        timestamp_parser (TimestampParser): Optional parser to use
+        fields (tuple): Project each record onto these fields (a
+            ProjectedRecord) instead of copying it
+        in_place (bool): Update the input dicts instead of copying them
+    
+    Yields:
+        dict: Each record with added 'utc_datetime' and 'local_date' fields
+    
+    Raises:
+        ValueError: If both fields and in_place are given
+    """
+    if fields is not None and in_place:
+        raise ValueError("fields and in_place can't be combined; a projected record is always new")
+    
+    # Get the cached UTC-offset table for the source timezone
+    # (built once per zone from pytz's transition list)
+    table = get_offset_table(source_tz)
+    
+    # One parser per file, so it learns this file's timestamp format
+    if timestamp_parser is None:
+        timestamp_parser = TimestampParser()
     
-    normalized = []
+    # Compact record class holding just the requested fields
+    project = None if fields is None else record_type(fields)
     
     # Process each health record
     for record in data:
-        # Create a copy to avoid modifying the original data
-        new_record = record.copy()
-        
-        # Extract timestamp field
-        # Different data sources may use 'date' or 'timestamp' as the field name
-        if 'date' in record:
-            timestamp_str = record['date']
-        else:
-            timestamp_str = record['timestamp']
-        
         # Parse the timestamp string into a datetime object
-        # dateutil.parser can handle many date/time formats automatically
-        dt = parser.parse(timestamp_str)
+        # The fast path handles the file's usual format, and anything
+        # else falls back to dateutil.parser
+        dt = timestamp_parser.parse(_timestamp_str(record))
         
-        # Make the datetime timezone-aware
-        # Two cases to handle:
+        # Convert to UTC and find the local calendar day
+        utc_seconds, local_ordinal = _convert(dt, table)
         
-        # Case 1: Naive datetime (no timezone info)
-        # Localize it to the source timezone
-        if dt.tzinfo is None:
-            dt_local = tz.localize(dt)
+        # Projection: keep only the needed fields, as plain ints and
+        # slots, without building datetime and date objects
+        if project is not None:
+            yield project(utc_seconds - UNIX_EPOCH_SECONDS, local_ordinal, record)
+            continue
         
-        # Case 2: Timezone-aware datetime
-        # Convert it to the source timezone
-        else:
-            dt_local = dt.astimezone(tz)
+        # Create a copy to avoid modifying the original data, unless
+        # the caller asked for the input records to be updated
+        new_record = record if in_place else record.copy()
         
-        # Convert to UTC for standardized storage
+        # Store UTC for standardized storage
         # All times stored in UTC for easy comparison across timezones
-        dt_utc = dt_local.astimezone(pytz.UTC)
+        dt_utc = from_seconds(utc_seconds, dt.microsecond, pytz.UTC)
         
         # THE KEY PART: Store the LOCAL date
         # This ensures activities are counted on the correct calendar day
         # in the user's timezone, not in UTC
         # Example: 11 PM Dec 7 in LA = 7 AM Dec 8 UTC, but should count as Dec 7
-        local_date = dt_local.date()
+        local_date = date.fromordinal(local_ordinal)
         
         # Add the normalized timestamp and local date to the record
         new_record['utc_datetime'] = dt_utc
         new_record['local_date'] = local_date
         
-        normalized.append(new_record)
+        yield new_record
+
+
+def normalize_to_columns(data, source_tz, timestamp_parser=None, timings=None):
+    """
+    Normalize records into a columnar NormalizedDataset.
+    
+    Same conversion as normalize_to_utc(), but instead of copying each
+    record and attaching datetime/date objects, it appends the UTC epoch,
+    local date ordinal and the known fields to typed arrays (see
+    dataset.py). Use this for large inputs; merge_datasets() accepts the
+    result directly.
+    
+    Args:
+        data (iterable): Health records (sleep or workout data)
+        source_tz (str): IANA timezone name (e.g., 'UTC', 'America/Los_Angeles')
+        timestamp_parser (TimestampParser): Optional parser to use
+        timings (dict): If given, seconds spent reading records ('read'),
+            parsing timestamps ('parse') and converting timezones and
+            storing ('convert') are added to it. Timing every record has
+            a small cost, so only pass this when profiling.
+    
+    Returns:
+        NormalizedDataset: One row per input record, in input order
+    """
+    table = get_offset_table(source_tz)
+    if timestamp_parser is None:
+        timestamp_parser = TimestampParser()
+    
+    if timings is not None:
+        return _normalize_to_columns_timed(data, table, timestamp_parser, timings)
+    
+    dataset = NormalizedDataset()
+    for record in data:
+        dt = timestamp_parser.parse(_timestamp_str(record))
+        utc_seconds, local_ordinal = _convert(dt, table)
+        dataset.append(utc_seconds - UNIX_EPOCH_SECONDS, local_ordinal, record)
+    
+    return dataset
+
+
+def normalize_parallel(data, source_tz, workers=None, chunk_size=DEFAULT_CHUNK_SIZE, timestamp_parser=None):
+    """
+    Normalize records into a NormalizedDataset using a process pool.
+    
+    The record stream is cut into chunks of chunk_size records; each
+    chunk is normalized by normalize_to_columns() in a worker and the
+    pieces are concatenated in input order, so the result is identical
+    to normalize_to_columns() on the whole stream.
+    
+    Workers never receive pytz objects or parser state. The timestamp
+    format is learned here from the first records, and each worker gets
+    only the timezone name and the format name once, at start-up. It
+    then builds its own OffsetTable and TimestampParser from those and
+    reuses them for every chunk it processes.
+    
+    At most two chunks per worker are in flight at a time, so memory
+    stays bounded however long the stream is.
+    
+    Args:
+        data (iterable): Health records (sleep or workout data)
+        source_tz (str): IANA timezone name (e.g., 'UTC', 'America/Los_Angeles')
+        workers (int): Number of worker processes; defaults to the CPU
+            count, and 1 normalizes everything in this process
+        chunk_size (int): Records per chunk
+        timestamp_parser (TimestampParser): Optional parser; it learns
+            the format and its hits/misses are the totals over all chunks
+    
+    Returns:
+        NormalizedDataset: One row per input record, in input order
+    
+    Raises:
+        ValueError: If workers is negative or chunk_size is below 1
+    """
+    if workers is not None and workers < 0:
+        raise ValueError(f"workers must be 0 (one per CPU) or more, not {workers}")
+    if chunk_size < 1:
+        raise ValueError(f"chunk_size must be at least 1, not {chunk_size}")
+    if timestamp_parser is None:
+        timestamp_parser = TimestampParser()
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        return normalize_to_columns(data, source_tz, timestamp_parser)
+    
+    records = iter(data)
+    first = list(islice(records, chunk_size))
+    # Learn the format here, from the same records a serial run would use
+    format_name = timestamp_parser.learn(map(_timestamp_str, first))
+    
+    dataset = NormalizedDataset()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(source_tz, format_name)) as executor:
+        pending = deque()
+        chunk = first
+        while chunk or pending:
+            if chunk and len(pending) < 2 * workers:
+                pending.append(executor.submit(_normalize_chunk, chunk))
+                chunk = list(islice(records, chunk_size))
+                continue
+            part, hits, misses = pending.popleft().result()
+            dataset.extend(part)
+            timestamp_parser.hits += hits
+            timestamp_parser.misses += misses
+    
+    return dataset
+
+
+def _init_worker(source_tz, format_name):
+    """Build the worker's offset table and parser once, from plain names."""
+    get_offset_table(source_tz)
+    _worker['source_tz'] = source_tz
+    # If no format was learned, a serial run parses everything with
+    # dateutil, so the workers mustn't try learning one either
+    _worker['parser'] = TimestampParser(learn_limit=0, format_name=format_name)
+
+
+def _normalize_chunk(records):
+    """Normalize one chunk in a worker; returns (dataset, hits, misses)."""
+    parser = _worker['parser']
+    hits, misses = parser.hits, parser.misses
+    dataset = normalize_to_columns(records, _worker['source_tz'], parser)
+    return dataset, parser.hits - hits, parser.misses - misses
+
+
+def _normalize_to_columns_timed(data, table, timestamp_parser, timings):
+    """normalize_to_columns() with per-step timing, for profiling."""
+    clock = time.perf_counter
+    dataset = NormalizedDataset()
+    read = parse = convert = 0.0
+    records = iter(data)
+    
+    while True:
+        started = clock()
+        record = next(records, _END)
+        loaded = clock()
+        if record is _END:
+            read += loaded - started
+            break
+        dt = timestamp_parser.parse(_timestamp_str(record))
+        parsed = clock()
+        utc_seconds, local_ordinal = _convert(dt, table)
+        dataset.append(utc_seconds - UNIX_EPOCH_SECONDS, local_ordinal, record)
+        converted = clock()
+        
+        read += loaded - started
+        parse += parsed - loaded
+        convert += converted - parsed
+    
+    for step, seconds in (('read', read), ('parse', parse), ('convert', convert)):
+        timings[step] = timings.get(step, 0.0) + seconds
+    return dataset
+
+
+def _timestamp_str(record):
+    """Extract the timestamp field of a record."""
+    # Different data sources may use 'date' or 'timestamp' as the field name
+    if 'date' in record:
+        return record['date']
+    return record['timestamp']
+
+
+def _convert(dt, table):
+    """
+    Convert a parsed timestamp to (UTC seconds, local date ordinal).
+    
+    Gives the same answer as pytz's localize()/astimezone(), using an
+    OffsetTable lookup instead (see tzcache.py).
+    """
+    # Case 1: Naive datetime (no timezone info)
+    # It is a wall time in the source timezone, so its date is the
+    # local date and only the UTC instant needs the offset lookup
+    if dt.tzinfo is None:
+        utc_seconds = table.local_to_utc(to_seconds(dt))
+        return utc_seconds, dt.toordinal()
     
-    return normalized
\ No newline at end of file
+    # Case 2: Timezone-aware datetime
+    # The UTC instant is fixed, and the local date comes from the
+    # source timezone's offset at that instant
+    utc_seconds = to_seconds(dt.replace(tzinfo=None) - dt.utcoffset())
+    local_seconds = utc_seconds + table.utc_offset(utc_seconds)
+    return utc_seconds, local_seconds // SECONDS_PER_DAY
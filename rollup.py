@@ -0,0 +1,345 @@
+"""
+Precomputed week/month/year rollups of a store's merged days.
+
+A RollupCube holds one SummaryAccumulator per ISO week, calendar month
+and year that has data, saved as rollups.json in the store directory.
+Because the accumulators are mergeable, a summary over any date range is
+the merge of the few largest cells that fit inside it plus the days at
+its edges (see plan_range()), so a ten-year summary merges about ten
+year cells instead of scanning 3,650 days:
+
+    2023-09-27 .. 2025-02-10
+      days   2023-09-27 .. 2023-09-30
+      months 2023-10, 2023-11, 2023-12
+      year   2024
+      month  2025-01
+      days   2025-02-01 .. 2025-02-02
+      week   2025-W06 (2025-02-03 .. 2025-02-09)
+      day    2025-02-10
+
+Only the edge days are read from the store. `ingest --append` rebuilds
+just the cells whose periods the new records fall in. The file records
+the store files' sizes, so if the store was changed without updating it
+the rollups are ignored and summaries scan the days instead.
+"""
+
+import json
+import os
+from datetime import date, timedelta
+
+from analyzer import SummaryAccumulator
+from merger import iter_merge_columns
+from store import SLEEP_FILE, WORKOUTS_FILE, load_store
+
+
+ROLLUP_FILE = 'rollups.json'
+ROLLUP_VERSION = 1
+
+# Rollup levels, largest first
+LEVELS = ('year', 'month', 'week')
+
+_ONE_DAY = timedelta(days=1)
+_ONE_WEEK = timedelta(days=7)
+
+
+def period_key(level, day):
+    """The key of the level's period containing day, e.g. '2023', '2023-10' or '2023-W40'."""
+    if level == 'year':
+        return f'{day.year}'
+    if level == 'month':
+        return f'{day.year}-{day.month:02d}'
+    year, week, _ = day.isocalendar()
+    return f'{year}-W{week:02d}'
+
+
+def period_range(level, key):
+    """First and last day of a period, from its period_key()."""
+    if level == 'year':
+        year = int(key)
+        return date(year, 1, 1), date(year, 12, 31)
+    if level == 'month':
+        year, month = map(int, key.split('-'))
+        first = date(year, month, 1)
+        return first, _next_month(first) - _ONE_DAY
+    year, week = key.split('-W')
+    first = date.fromisocalendar(int(year), int(week), 1)
+    return first, first + timedelta(days=6)
+
+
+def plan_range(start, end):
+    """
+    Split [start, end] into whole rollup periods and leftover day ranges.
+
+    Whole months (grouped into years where a year fits) cover the middle;
+    the parts before the first and after the last whole month are covered
+    by whole ISO weeks and then single days. Together they cover every
+    day of the range exactly once.
+
+    Returns:
+        tuple: ([(level, key), ...] cells, [(first, last), ...] day ranges)
+    """
+    cells, edges = [], []
+    first_month = start if start.day == 1 else _next_month(start)
+    # The day after the last whole month in the range
+    after_last_month = end + _ONE_DAY if (end + _ONE_DAY).day == 1 else date(end.year, end.month, 1)
+    if first_month >= after_last_month:
+        _plan_weeks(start, end, cells, edges)
+        return cells, edges
+
+    _plan_weeks(start, first_month - _ONE_DAY, cells, edges)
+    day = first_month
+    while day < after_last_month:
+        if day.month == 1 and date(day.year + 1, 1, 1) <= after_last_month:
+            cells.append(('year', period_key('year', day)))
+            day = date(day.year + 1, 1, 1)
+        else:
+            cells.append(('month', period_key('month', day)))
+            day = _next_month(day)
+    _plan_weeks(after_last_month, end, cells, edges)
+    return cells, edges
+
+
+def _plan_weeks(start, end, cells, edges):
+    """Cover [start, end] with whole Monday-Sunday weeks and day ranges."""
+    if start > end:
+        return
+    monday = start + timedelta(days=-start.weekday() % 7)
+    if monday + timedelta(days=6) > end:
+        edges.append((start, end))
+        return
+    if monday > start:
+        edges.append((start, monday - _ONE_DAY))
+    day = monday
+    while day + timedelta(days=6) <= end:
+        cells.append(('week', period_key('week', day)))
+        day += _ONE_WEEK
+    if day <= end:
+        edges.append((day, end))
+
+
+def _next_month(day):
+    return date(day.year + 1, 1, 1) if day.month == 12 else date(day.year, day.month + 1, 1)
+
+
+class RollupCube:
+    """
+    One SummaryAccumulator per week, month and year of merged days.
+
+    Attributes:
+        cells (dict): level -> {period key: SummaryAccumulator, or its
+            to_dict() state until the cell is first used}
+        first_day, last_day (date): Range of days added, or None
+    """
+
+    def __init__(self, low_sleep_threshold=6.0):
+        self.low_sleep_threshold = low_sleep_threshold
+        self.cells = {level: {} for level in LEVELS}
+        self.first_day = self.last_day = None
+
+    def add(self, day, levels=LEVELS):
+        """Add one merged day to its cell at each of levels."""
+        local_date = date.fromisoformat(day['date'])
+        for level in levels:
+            key = period_key(level, local_date)
+            cell = self.cell(level, key)
+            if cell is None:
+                cell = self.cells[level][key] = SummaryAccumulator(self.low_sleep_threshold)
+            cell.add(day)
+        if self.first_day is None or local_date < self.first_day:
+            self.first_day = local_date
+        if self.last_day is None or local_date > self.last_day:
+            self.last_day = local_date
+
+    def cell(self, level, key):
+        """The SummaryAccumulator of one period, or None if it has no days."""
+        cell = self.cells[level].get(key)
+        if isinstance(cell, dict):
+            # Loaded cells are rebuilt when first used, so a query pays
+            # only for the few cells it merges
+            cell = self.cells[level][key] = SummaryAccumulator.from_dict(cell)
+        return cell
+
+    def update(self, days):
+        """Add every merged day from an iterable. Returns self."""
+        for day in days:
+            self.add(day)
+        return self
+
+    def refresh(self, directory, local_time_zone, start, end):
+        """
+        Rebuild every cell whose period overlaps [start, end] from the store.
+
+        Used after appending records for those days. The store is read
+        for the union of the affected periods, which is at most the
+        appended range widened to whole years (and the weeks at their
+        edges), however long the history is.
+        """
+        low = min(period_range(level, period_key(level, start))[0] for level in LEVELS)
+        high = max(period_range(level, period_key(level, end))[1] for level in LEVELS)
+
+        # Only cells lying wholly in [low, high] are rebuilt; that
+        # includes every period overlapping [start, end]
+        rebuilt = {}
+        for level in LEVELS:
+            for key in list(self.cells[level]):
+                first, last = period_range(level, key)
+                if low <= first and last <= high:
+                    del self.cells[level][key]
+
+        sleep, workouts = load_store(directory, local_time_zone, low, high)
+        for day in iter_merge_columns(sleep, workouts):
+            local_date = date.fromisoformat(day['date'])
+            levels = []
+            for level in LEVELS:
+                key = period_key(level, local_date)
+                inside = rebuilt.get((level, key))
+                if inside is None:
+                    first, last = period_range(level, key)
+                    inside = rebuilt[level, key] = low <= first and last <= high
+                if inside:
+                    levels.append(level)
+            self.add(day, levels)
+        return self
+
+    def summarize(self, start, end, read_days):
+        """
+        Summary of the merged days in [start, end].
+
+        Args:
+            start, end (date): Range of days; None for the cube's first or
+                last day
+            read_days (callable): read_days(first, last) returns the merged
+                days in [first, last]; used for the edges of the range
+
+        Returns:
+            SummaryAccumulator: The same as one fed every day in the range
+                (quantiles within the sketch's error bound)
+        """
+        summary = SummaryAccumulator(self.low_sleep_threshold)
+        start = start or self.first_day
+        end = end or self.last_day
+        if start is None or end is None or start > end:
+            return summary
+
+        cells, edges = plan_range(start, end)
+        for level, key in cells:
+            cell = self.cell(level, key)
+            if cell is not None:
+                summary.merge(cell)
+        for first, last in edges:
+            summary.update(read_days(first, last))
+        return summary
+
+    def to_dict(self):
+        """The cube as a JSON-serializable dict."""
+        return {
+            'low_sleep_threshold': self.low_sleep_threshold,
+            'first_day': None if self.first_day is None else self.first_day.isoformat(),
+            'last_day': None if self.last_day is None else self.last_day.isoformat(),
+            'cells': {level: {key: cell if isinstance(cell, dict) else cell.to_dict()
+                              for key, cell in sorted(cells.items())}
+                      for level, cells in self.cells.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, state):
+        """Rebuild a cube saved with to_dict()."""
+        cube = cls(state['low_sleep_threshold'])
+        cube.first_day = None if state['first_day'] is None else date.fromisoformat(state['first_day'])
+        cube.last_day = None if state['last_day'] is None else date.fromisoformat(state['last_day'])
+        cube.cells = {level: dict(cells) for level, cells in state['cells'].items()}
+        return cube
+
+
+def build_rollups(directory, local_time_zone, low_sleep_threshold=6.0):
+    """Build a RollupCube from every day in a store directory."""
+    sleep, workouts = load_store(directory, local_time_zone)
+    return RollupCube(low_sleep_threshold).update(iter_merge_columns(sleep, workouts))
+
+
+def save_rollups(cube, directory, local_time_zone):
+    """Write a cube to the store directory, tagged with the store's current file sizes."""
+    state = {
+        'version': ROLLUP_VERSION,
+        'timezone': local_time_zone,
+        'store_sizes': _store_sizes(directory),
+        'cube': cube.to_dict(),
+    }
+    path = os.path.join(directory, ROLLUP_FILE)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f)
+    os.replace(tmp_path, path)
+
+
+def load_rollups(directory, local_time_zone):
+    """
+    Read the store's RollupCube.
+
+    Returns:
+        RollupCube: The cube, or None if there is none, it was built for
+            another timezone or version, or the store changed since
+    """
+    try:
+        with open(os.path.join(directory, ROLLUP_FILE)) as f:
+            state = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+    if (state.get('version') != ROLLUP_VERSION or state.get('timezone') != local_time_zone
+            or state.get('store_sizes') != _store_sizes(directory)):
+        return None
+    return RollupCube.from_dict(state['cube'])
+
+
+def update_rollups(directory, local_time_zone, cube=None, start=None, end=None):
+    """
+    Bring the store's rollups up to date after an ingest, and save them.
+
+    Args:
+        cube (RollupCube): The rollups from before an append, if they
+            were current; None rebuilds from every day
+        start, end (date): Range of the appended records' local dates
+
+    Returns:
+        RollupCube: The saved cube
+    """
+    if cube is None or start is None or end is None:
+        cube = build_rollups(directory, local_time_zone)
+    else:
+        cube.refresh(directory, local_time_zone, start, end)
+    save_rollups(cube, directory, local_time_zone)
+    return cube
+
+
+def summarize_store(directory, local_time_zone, start=None, end=None, low_sleep_threshold=6.0):
+    """
+    Summary of a store's merged days in [start, end], from its rollups.
+
+    Falls back to scanning the range if the rollups are missing, stale,
+    or were built with another low-sleep threshold.
+
+    Returns:
+        SummaryAccumulator: The summary of the range
+
+    Raises:
+        FileNotFoundError: If the store hasn't been ingested
+        ValueError: If the workouts were ingested for another timezone
+    """
+    def read_days(first, last):
+        sleep, workouts = load_store(directory, local_time_zone, first, last)
+        return iter_merge_columns(sleep, workouts)
+
+    cube = load_rollups(directory, local_time_zone)
+    if cube is None or cube.low_sleep_threshold != low_sleep_threshold:
+        return SummaryAccumulator(low_sleep_threshold).update(read_days(start, end))
+    return cube.summarize(start, end, read_days)
+
+
+def _store_sizes(directory):
+    sizes = {}
+    for name in (SLEEP_FILE, WORKOUTS_FILE):
+        try:
+            sizes[name] = os.path.getsize(os.path.join(directory, name))
+        except FileNotFoundError:
+            sizes[name] = None
+    return sizes
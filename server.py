@@ -0,0 +1,325 @@
+"""
+Local HTTP query service.
+
+Answers /days and /summary over HTTP from a long-running process, so
+callers don't pay interpreter startup and a full reparse per query:
+
+    GET /days?user=alice&from=2023-10-01&to=2023-10-07
+    GET /summary?user=alice
+
+Merged days are kept in an in-memory LRU cache (DatasetCache) keyed by
+each user's files and timezone and checked against the files' mtimes,
+so a warm request is a dictionary lookup, a binary search for the date
+range and JSON encoding. Concurrent requests for a user who isn't
+loaded yet share one load instead of each parsing the files.
+
+The server is plain asyncio (HTTP/1.1 with keep-alive, GET only); loads
+run in a thread so the event loop keeps answering warm requests.
+"""
+
+import asyncio
+import json
+import os
+import sys
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from datetime import date
+from urllib.parse import parse_qs, urlsplit
+
+from analyzer import SummaryAccumulator
+from loader import iter_json_records
+from merger import merge_datasets
+from normalizer import normalize_to_columns
+
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# User id when the server is started for a single pair of files
+DEFAULT_USER = 'default'
+
+# Largest request body read past to keep a connection open; the bodies
+# themselves are never used, and bigger ones close the connection
+_MAX_DISCARD_BYTES = 64 * 1024
+
+_REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+            500: 'Internal Server Error'}
+
+
+class UserData:
+    """One user's merged days, with the whole-range summary worked out once."""
+
+    def __init__(self, merged):
+        self.merged = merged
+        self.dates = [day['date'] for day in merged]
+        self.summary = SummaryAccumulator().update(merged).results()
+        # A merged day dict with its values is roughly 500 bytes
+        self.nbytes = 600 * len(merged)
+
+    def days(self, date_from=None, date_to=None):
+        """Merged days in [date_from, date_to] (ISO strings, None for open ends)."""
+        low = 0 if date_from is None else bisect_left(self.dates, date_from)
+        high = len(self.dates) if date_to is None else bisect_right(self.dates, date_to)
+        return self.merged[low:high]
+
+
+async def _read_head(reader):
+    """
+    Read a request line and its headers.
+
+    Returns:
+        tuple: (request line, headers dict); the request line is empty
+            when the client closed the connection
+
+    Raises:
+        ValueError: If a line is longer than the reader's limit (64 KiB)
+    """
+    request_line = await reader.readline()
+    headers = {}
+    if not request_line:
+        return request_line, headers
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    return request_line, headers
+
+
+async def _respond(writer, status, body, keep_alive):
+    """Write a JSON response and wait until it can be sent."""
+    payload = json.dumps(body).encode()
+    writer.write(
+        f'HTTP/1.1 {status} {_REASONS[status]}\r\n'
+        f'Content-Type: application/json\r\n'
+        f'Content-Length: {len(payload)}\r\n'
+        f'Connection: {"keep-alive" if keep_alive else "close"}\r\n\r\n'.encode('latin-1') + payload
+    )
+    await writer.drain()
+
+
+async def _skip_body(reader, headers):
+    """
+    Read past a request's body, which no route uses.
+
+    Returns:
+        bool: Whether the connection can carry another request; False
+            for chunked or large bodies, which are left unread
+
+    Raises:
+        ValueError: If Content-Length isn't a non-negative integer
+    """
+    if 'transfer-encoding' in headers:
+        return False
+    if 'content-length' not in headers:
+        return True
+    length = int(headers['content-length'])
+    if length < 0:
+        raise ValueError(f"Negative Content-Length {length}")
+    if length > _MAX_DISCARD_BYTES:
+        return False
+    await reader.readexactly(length)
+    return True
+
+
+def load_user(entry):
+    """
+    Load, normalize and merge one user's files (a batch manifest entry).
+
+    Returns:
+        UserData: The user's merged days
+    """
+    sleep = normalize_to_columns(iter_json_records(entry['sleep_file']), 'UTC')
+    workouts = normalize_to_columns(iter_json_records(entry['workouts_file']), entry['timezone'])
+    return UserData(merge_datasets(sleep, workouts))
+
+
+class DatasetCache:
+    """
+    In-memory LRU cache of UserData, with request coalescing.
+
+    Entries are keyed by the absolute file paths and the timezone, and
+    remember the files' sizes and mtimes; if either file has changed
+    since, the entry is reloaded. Memory is bounded by max_bytes (from
+    UserData.nbytes): the least recently used users are dropped when a
+    load pushes the total over the limit.
+
+    While a user is loading, other requests for the same key wait for
+    that load rather than starting their own.
+
+    Example:
+        cache = DatasetCache()
+        data = await cache.get({'sleep_file': ..., 'workouts_file': ..., 'timezone': ...})
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, loader=load_user):
+        self.max_bytes = max_bytes
+        self.loader = loader
+        self.entries = OrderedDict()  # key -> (version, UserData)
+        self.nbytes = 0
+        self.loads = 0
+        self._pending = {}
+
+    @staticmethod
+    def key(entry):
+        """(sleep path, workouts path, timezone) for a manifest entry."""
+        return (os.path.abspath(entry['sleep_file']), os.path.abspath(entry['workouts_file']), entry['timezone'])
+
+    @staticmethod
+    def version(key):
+        """
+        Sizes and mtimes of the key's files.
+
+        Raises:
+            FileNotFoundError: If one of the files doesn't exist
+        """
+        stats = [os.stat(path) for path in key[:2]]
+        return tuple((stat.st_size, stat.st_mtime_ns) for stat in stats)
+
+    async def get(self, entry):
+        """
+        Return the user's data, loading it if it isn't cached or is stale.
+
+        Raises:
+            Whatever the loader raises (e.g. FileNotFoundError)
+        """
+        key = self.key(entry)
+        version = self.version(key)
+        cached = self.entries.get(key)
+        if cached is not None and cached[0] == version:
+            self.entries.move_to_end(key)
+            return cached[1]
+
+        pending = self._pending.get((key, version))
+        if pending is None:
+            loop = asyncio.get_running_loop()
+            pending = self._pending[key, version] = loop.run_in_executor(None, self.loader, entry)
+            pending.add_done_callback(lambda future: self._finish_load(key, version, future))
+            self.loads += 1
+        # shield(): a client hanging up mustn't cancel a load others wait on
+        return await asyncio.shield(pending)
+
+    def _finish_load(self, key, version, future):
+        del self._pending[key, version]
+        if future.cancelled() or future.exception() is not None:
+            return
+        self._evict(key)
+        data = future.result()
+        self.entries[key] = (version, data)
+        self.nbytes += data.nbytes
+        while self.nbytes > self.max_bytes and len(self.entries) > 1:
+            self._evict(next(iter(self.entries)))
+
+    def _evict(self, key):
+        cached = self.entries.pop(key, None)
+        if cached is not None:
+            self.nbytes -= cached[1].nbytes
+
+
+class HealthServer:
+    """
+    HTTP front end answering /days and /summary from a DatasetCache.
+
+    Args:
+        users (dict): user_id -> batch manifest entry (see batch.read_manifest())
+        cache (DatasetCache): Cache to use; a new one by default
+    """
+
+    def __init__(self, users, cache=None):
+        self.users = users
+        self.cache = cache or DatasetCache()
+
+    async def handle_request(self, method, target):
+        """
+        Answer one request.
+
+        Returns:
+            tuple: (HTTP status, JSON-serializable body)
+        """
+        if method != 'GET':
+            return 405, {'error': f'{method} is not supported; use GET'}
+        url = urlsplit(target)
+        if url.path not in ('/days', '/summary'):
+            return 404, {'error': f'Unknown path {url.path}; use /days or /summary'}
+
+        params = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        user = params.get('user')
+        if user is None and len(self.users) == 1:
+            user = next(iter(self.users))
+        if user not in self.users:
+            return 404, {'error': f'Unknown user {user!r}'}
+        try:
+            date_from, date_to = (_parse_date(params.get(name)) for name in ('from', 'to'))
+        except ValueError as e:
+            return 400, {'error': str(e)}
+
+        try:
+            data = await self.cache.get(self.users[user])
+        except Exception as e:
+            return 500, {'error': f'Could not load data for {user!r}: {type(e).__name__}: {e}'}
+
+        days = data.days(date_from, date_to)
+        if url.path == '/days':
+            return 200, {'user': user, 'days': days}
+        if date_from is None and date_to is None:
+            summary = data.summary
+        else:
+            summary = SummaryAccumulator().update(days).results()
+        return 200, {'user': user, 'day_count': len(days), 'summary': summary}
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request_line, headers = await _read_head(reader)
+                except ValueError:
+                    await _respond(writer, 400, {'error': 'Request line or header too long'}, keep_alive=False)
+                    break
+                if not request_line:
+                    break
+
+                parts = request_line.decode('latin-1').split()
+                try:
+                    reusable = await _skip_body(reader, headers)
+                except ValueError:
+                    status, body = 400, {'error': 'Invalid Content-Length'}
+                    keep_alive = False
+                else:
+                    if len(parts) != 3:
+                        status, body = 400, {'error': 'Malformed request line'}
+                        keep_alive = False
+                    else:
+                        method, target, version = parts
+                        status, body = await self.handle_request(method, target)
+                        keep_alive = (reusable and version == 'HTTP/1.1'
+                                      and headers.get('connection', '').lower() != 'close')
+
+                await _respond(writer, status, body, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host='127.0.0.1', port=8080):
+        """Start listening; returns the asyncio Server (port 0 picks a free one)."""
+        return await asyncio.start_server(self._handle_connection, host, port)
+
+    async def serve_forever(self, host='127.0.0.1', port=8080):
+        """Listen and answer requests until cancelled."""
+        server = await self.start(host, port)
+        address = server.sockets[0].getsockname()
+        print(f"Serving on http://{address[0]}:{address[1]} (/days, /summary)", file=sys.stderr)
+        async with server:
+            await server.serve_forever()
+
+
+def _parse_date(value):
+    """Validate an optional YYYY-MM-DD query parameter; returns it as an ISO string."""
+    if value is None:
+        return None
+    try:
+        return date.fromisoformat(value).isoformat()
+    except ValueError:
+        raise ValueError(f'Invalid date {value!r}; use YYYY-MM-DD')
@@ -0,0 +1,315 @@
+"""
+Optional SQLite store for normalized health records.
+
+An alternative to the columnar store directory (store.py) for data that
+several users or tools share: one database file holds every user's
+sleep and workout records, and `--store path.db` selects it on the
+command line. Records are bulk-loaded with executemany() inside one
+transaction, the database runs in WAL mode so readers aren't blocked by
+an ingest, and both tables are indexed on (user, local_date).
+
+The day merge and the calculate_correlations() aggregates run as SQL
+GROUP BY queries, so only one row per day (or per sleep group) leaves
+the database:
+
+    sleep     last record of each day wins (the highest rowid, i.e. the
+              last one ingested), as in merge_datasets()
+    workouts  SUM of calories and duration and COUNT per day
+    days      the union of both, outer-joined
+
+Values are stored as the records had them (the numeric columns have no
+declared type), so integer calories sum to integers and every row equals
+what merge_datasets() gives for the same records.
+"""
+
+import os
+import sqlite3
+from datetime import date
+from itertools import repeat
+
+from analyzer import correlation_results
+from dataset import NormalizedDataset
+
+
+SCHEMA_VERSION = 1
+DEFAULT_USER = 'default'
+
+# Suffixes that make --store name a SQLite database instead of a directory
+SQLITE_SUFFIXES = ('.db', '.sqlite', '.sqlite3')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    user TEXT PRIMARY KEY,
+    timezone TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sleep (
+    id INTEGER PRIMARY KEY,
+    user TEXT NOT NULL,
+    utc_epoch INTEGER NOT NULL,
+    local_date TEXT NOT NULL,
+    hours,
+    quality TEXT
+);
+CREATE TABLE IF NOT EXISTS workouts (
+    id INTEGER PRIMARY KEY,
+    user TEXT NOT NULL,
+    utc_epoch INTEGER NOT NULL,
+    local_date TEXT NOT NULL,
+    type TEXT,
+    calories,
+    duration
+);
+CREATE INDEX IF NOT EXISTS sleep_user_date ON sleep (user, local_date);
+CREATE INDEX IF NOT EXISTS workouts_user_date ON workouts (user, local_date);
+"""
+
+# Per-day sleep and workout groups of one user in [:start, :end]. SQLite
+# takes the bare hours/quality columns from the row with MAX(id), which
+# is the last sleep record of the day.
+_DAYS = """
+WITH day_sleep AS (
+    SELECT local_date, MAX(id), hours, quality
+    FROM sleep
+    WHERE user = :user AND local_date BETWEEN :start AND :end
+    GROUP BY local_date
+),
+day_workouts AS (
+    SELECT local_date, SUM(COALESCE(calories, 0)) AS calories, COUNT(*) AS count,
+           SUM(COALESCE(duration, 0)) AS duration
+    FROM workouts
+    WHERE user = :user AND local_date BETWEEN :start AND :end
+    GROUP BY local_date
+),
+days AS (
+    SELECT local_date FROM day_sleep UNION SELECT local_date FROM day_workouts
+),
+merged AS (
+    SELECT days.local_date AS date, day_sleep.hours AS sleep_hours, day_sleep.quality AS sleep_quality,
+           COALESCE(day_workouts.calories, 0) AS total_calories,
+           COALESCE(day_workouts.count, 0) AS workout_count,
+           COALESCE(day_workouts.duration, 0) AS workout_time
+    FROM days
+    LEFT JOIN day_sleep ON day_sleep.local_date = days.local_date
+    LEFT JOIN day_workouts ON day_workouts.local_date = days.local_date
+)
+"""
+
+_MERGE = _DAYS + "SELECT * FROM merged ORDER BY date"
+
+# The calculate_correlations() numbers: days with sleep and calories,
+# split at the threshold
+_SUMMARY = _DAYS + """
+SELECT sleep_hours < :threshold AS low_sleep, COUNT(*), SUM(total_calories)
+FROM merged
+WHERE sleep_hours IS NOT NULL AND total_calories > 0
+GROUP BY low_sleep
+"""
+
+# Rows read into a dataset per fetch
+_FETCH_SIZE = 50_000
+
+_MERGED_COLUMNS = ('date', 'sleep_hours', 'sleep_quality', 'total_calories', 'workout_count', 'workout_time')
+
+# Far enough out that ISO date strings compare inside them
+_FIRST_DATE = '0001-01-01'
+_LAST_DATE = '9999-12-31'
+
+
+def is_sqlite_store(path):
+    """Whether a --store path names a SQLite database (by its suffix)."""
+    return path.lower().endswith(SQLITE_SUFFIXES)
+
+
+def connect(path, create=False):
+    """
+    Open a SQLite store in WAL mode.
+
+    Args:
+        path (str): Database file
+        create (bool): Create the file and its tables if they don't exist
+
+    Raises:
+        FileNotFoundError: If the file doesn't exist and create is False
+        ValueError: If the file isn't a SQLite database
+    """
+    if not create and not os.path.exists(path):
+        raise FileNotFoundError(f"No SQLite store at {path}; run ingest first")
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute('PRAGMA journal_mode = WAL')
+    except sqlite3.DatabaseError as e:
+        conn.close()
+        raise ValueError(f"{path} is not a SQLite database ({e})") from e
+    # Safe from corruption in WAL mode, and skips an fsync per commit
+    conn.execute('PRAGMA synchronous = NORMAL')
+    if create:
+        conn.executescript(_SCHEMA)
+        conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+    return conn
+
+
+def ingest(path, sleep_dataset, workouts_dataset, local_time_zone, user=DEFAULT_USER, append=False):
+    """
+    Write one user's normalized sleep and workout datasets into a SQLite store.
+
+    Everything is inserted with executemany() in a single transaction, so
+    readers see the user's old records or the new ones, never a mix.
+
+    Args:
+        path (str): Database file (created if needed)
+        sleep_dataset (NormalizedDataset): Sleep records, normalized in UTC
+        workouts_dataset (NormalizedDataset): Workout records
+        local_time_zone (str): Timezone the workouts were normalized in
+        user (str): Whose records these are
+        append (bool): Add to the user's records instead of replacing them
+
+    Raises:
+        ValueError: If appending to records ingested for another timezone
+    """
+    conn = connect(path, create=True)
+    try:
+        with conn:
+            row = conn.execute('SELECT timezone FROM users WHERE user = ?', (user,)).fetchone()
+            if append and row is not None and row[0] != local_time_zone:
+                raise ValueError(
+                    f"Store {path} has {user}'s records for {row[0]}, not {local_time_zone}; "
+                    "ingest without --append to replace them"
+                )
+            if not append:
+                conn.execute('DELETE FROM sleep WHERE user = ?', (user,))
+                conn.execute('DELETE FROM workouts WHERE user = ?', (user,))
+            conn.execute('INSERT OR REPLACE INTO users (user, timezone) VALUES (?, ?)', (user, local_time_zone))
+            conn.executemany(
+                'INSERT INTO sleep (user, utc_epoch, local_date, hours, quality) VALUES (?, ?, ?, ?, ?)',
+                _rows(sleep_dataset, user, ('hours', 'quality')),
+            )
+            conn.executemany(
+                'INSERT INTO workouts (user, utc_epoch, local_date, type, calories, duration) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                _rows(workouts_dataset, user, ('type', 'calories', 'duration')),
+            )
+    finally:
+        conn.close()
+
+
+def _rows(dataset, user, fields):
+    """Yield (user, utc_epoch, ISO local date, *fields) insert rows from a dataset."""
+    iso_dates = {ordinal: date.fromordinal(ordinal).isoformat() for ordinal in set(dataset.local_ordinal)}
+    return zip(repeat(user), dataset.utc_epoch, map(iso_dates.__getitem__, dataset.local_ordinal),
+               *(dataset.column_values(name) for name in fields))
+
+
+def merge_days(path, local_time_zone, user=DEFAULT_USER, start=None, end=None):
+    """
+    Merged days of one user in [start, end], computed by SQL.
+
+    Yields the rows merge_datasets() produces, sorted by date, as the
+    query returns them.
+
+    Raises:
+        FileNotFoundError: If the store doesn't exist
+        ValueError: If the user's records were ingested for another timezone
+    """
+    conn = _open_user(path, local_time_zone, user)
+    return _iter_merged(conn, _params(user, start, end))
+
+
+def _iter_merged(conn, params):
+    try:
+        for row in conn.execute(_MERGE, params):
+            yield dict(zip(_MERGED_COLUMNS, row))
+    finally:
+        conn.close()
+
+
+def summarize(path, local_time_zone, user=DEFAULT_USER, start=None, end=None, low_sleep_threshold=6.0):
+    """
+    calculate_correlations() results for one user's days in [start, end].
+
+    The counts and calorie totals of low- and normal-sleep days come from
+    one GROUP BY query; only two rows are read back.
+
+    Raises:
+        FileNotFoundError: If the store doesn't exist
+        ValueError: If the user's records were ingested for another timezone
+    """
+    conn = _open_user(path, local_time_zone, user)
+    try:
+        groups = {bool(low): (count, total) for low, count, total in
+                  conn.execute(_SUMMARY, {**_params(user, start, end), 'threshold': low_sleep_threshold})}
+    finally:
+        conn.close()
+    low_count, low_total = groups.get(True, (0, 0))
+    normal_count, normal_total = groups.get(False, (0, 0))
+    return correlation_results(low_count, low_total / low_count if low_count else None,
+                               normal_count, normal_total / normal_count if normal_count else None,
+                               low_sleep_threshold)
+
+
+def load_datasets(path, local_time_zone, user=DEFAULT_USER, start=None, end=None):
+    """
+    Read one user's sleep and workouts in [start, end] back into datasets.
+
+    Rows come back in local date order (ingest order within a day), as
+    store.load_store() returns them.
+
+    Returns:
+        tuple: (sleep, workouts) NormalizedDatasets
+
+    Raises:
+        FileNotFoundError: If the store doesn't exist
+        ValueError: If the user's records were ingested for another timezone
+    """
+    conn = _open_user(path, local_time_zone, user)
+    params = _params(user, start, end)
+    try:
+        sleep = _read_dataset(conn, 'SELECT utc_epoch, local_date, hours, quality FROM sleep '
+                                    'WHERE user = :user AND local_date BETWEEN :start AND :end '
+                                    'ORDER BY local_date, id', params, ('hours', 'quality'))
+        workouts = _read_dataset(conn, 'SELECT utc_epoch, local_date, type, calories, duration FROM workouts '
+                                       'WHERE user = :user AND local_date BETWEEN :start AND :end '
+                                       'ORDER BY local_date, id', params, ('type', 'calories', 'duration'))
+    finally:
+        conn.close()
+    return sleep, workouts
+
+
+def _read_dataset(conn, query, params, fields):
+    """Build a dataset from (utc_epoch, local_date, *fields) rows, column by column."""
+    dataset = NormalizedDataset()
+    ordinals = {}
+    cursor = conn.execute(query, params)
+    while True:
+        rows = cursor.fetchmany(_FETCH_SIZE)
+        if not rows:
+            break
+        utc_epochs, local_dates, *columns = zip(*rows)
+        for local_date in set(local_dates).difference(ordinals):
+            ordinals[local_date] = date.fromisoformat(local_date).toordinal()
+        dataset.extend_columns(utc_epochs, map(ordinals.__getitem__, local_dates), dict(zip(fields, columns)))
+    return dataset
+
+
+def _open_user(path, local_time_zone, user):
+    """Connect and check the user's records were ingested for local_time_zone."""
+    conn = connect(path)
+    try:
+        row = conn.execute('SELECT timezone FROM users WHERE user = ?', (user,)).fetchone()
+    except sqlite3.OperationalError as e:
+        conn.close()
+        raise ValueError(f"{path} is not a health data store ({e}); run ingest first") from e
+    if row is None:
+        conn.close()
+        raise ValueError(f"Store {path} has no records for user {user!r}; run ingest --user {user}")
+    if row[0] != local_time_zone:
+        conn.close()
+        raise ValueError(f"Store {path} has {user}'s records for {row[0]}, not {local_time_zone}; re-run ingest")
+    return conn
+
+
+def _params(user, start, end):
+    return {
+        'user': user,
+        'start': _FIRST_DATE if start is None else start.isoformat(),
+        'end': _LAST_DATE if end is None else end.isoformat(),
+    }
@@ -0,0 +1,339 @@
+"""
+Compact memory-mapped columnar store for normalized health records.
+
+Reparsing JSON is the most expensive part of every run, so the `ingest`
+command converts each source once into a binary file of fixed-width
+columns that later runs open with mmap and read without copying.
+
+File layout (native byte order, recorded in the header):
+
+    file header   magic 'HTCOLS01', schema version, metadata length,
+                  then JSON metadata (timezone, field names, byte order)
+    block         magic 'HTBLOCK1', row count, metadata length,
+                  min/max local ordinal, then JSON metadata (categories
+                  first seen in this block, which numeric columns are
+                  integral), then the columns:
+                      utc_epoch      int64   x rows
+                      local_ordinal  int32   x rows
+                      <numeric>      float64 x rows (one per field)
+                      <categorical>  uint16  x rows (one per field)
+    block ...
+
+Every section is padded to 8 bytes. Categorical codes are global across
+the file: each block only lists the new strings it adds to the
+dictionary. Rows inside a block are sorted by local date, so a date range
+is found by checking each block's min/max and binary searching inside it.
+Appending new records writes one more block at the end of the file;
+nothing already written changes.
+"""
+
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+
+from dataset import MAX_CATEGORIES, NormalizedDataset
+
+
+SCHEMA_VERSION = 1
+FILE_MAGIC = b'HTCOLS01'
+BLOCK_MAGIC = b'HTBLOCK1'
+
+# magic, schema version, metadata length
+_FILE_HEADER = struct.Struct('<8sII')
+# magic, row count, metadata length, min ordinal, max ordinal
+_BLOCK_HEADER = struct.Struct('<8sQIii4x')
+
+SLEEP_FILE = 'sleep.htcol'
+WORKOUTS_FILE = 'workouts.htcol'
+
+
+def _padded(length):
+    return (length + 7) & ~7
+
+
+def _pad(f, length):
+    f.write(b'\0' * (_padded(length) - length))
+
+
+class ColumnStore:
+    """
+    Read-only, memory-mapped view of one store file.
+
+    Opening a store maps the file and reads only the file header and the
+    block headers. Column data is exposed as memoryviews into the map, so
+    nothing is copied until rows are actually selected.
+
+    Example:
+        store = ColumnStore('store/workouts.htcol')
+        week = store.read(date(2023, 10, 1), date(2023, 10, 7))
+    """
+
+    def __init__(self, path):
+        """
+        Raises:
+            FileNotFoundError: If the file doesn't exist
+            ValueError: If the file isn't a store or has another schema version
+        """
+        self.path = path
+        with open(path, 'rb') as f:
+            # The map keeps its own handle, so the file can be closed now
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._map)
+
+        magic, version, meta_length = _FILE_HEADER.unpack_from(self._map, 0)
+        if magic != FILE_MAGIC:
+            raise ValueError(f"{path} is not a health tracker store")
+        if version != SCHEMA_VERSION:
+            raise ValueError(f"{path} has schema version {version}, expected {SCHEMA_VERSION}")
+        meta = json.loads(bytes(self._view[_FILE_HEADER.size:_FILE_HEADER.size + meta_length]))
+        if meta['byteorder'] != sys.byteorder:
+            raise ValueError(f"{path} was written on a {meta['byteorder']}-endian machine")
+
+        self.timezone = meta['timezone']
+        self.numeric_fields = tuple(meta['numeric_fields'])
+        self.categorical_fields = tuple(meta['categorical_fields'])
+        self.categories = {name: [None] for name in self.categorical_fields}
+        self.integral = {name: True for name in self.numeric_fields}
+        self.blocks = []
+        self._scan_blocks(_padded(_FILE_HEADER.size + meta_length))
+
+    def _scan_blocks(self, offset):
+        size = len(self._map)
+        # End of the last complete block; anything after it is the torn
+        # tail of an append that never finished
+        self.end = offset
+        while offset + _BLOCK_HEADER.size <= size:
+            magic, rows, meta_length, min_ordinal, max_ordinal = _BLOCK_HEADER.unpack_from(self._map, offset)
+            if magic != BLOCK_MAGIC:
+                raise ValueError(f"{self.path} is corrupt at byte {offset}")
+            start = offset + _BLOCK_HEADER.size
+            meta_end = start + meta_length
+
+            columns = {}
+            position = _padded(meta_end)
+            for name, typecode in self._layout():
+                length = rows * array(typecode).itemsize
+                columns[name] = (position, length, typecode)
+                position = _padded(position + length)
+            if position > size:
+                break  # an append that never finished; ignore it
+
+            meta = json.loads(bytes(self._view[start:meta_end]))
+            for name, values in meta['new_categories'].items():
+                self.categories[name].extend(values)
+            for name, integral in meta['integral'].items():
+                self.integral[name] = self.integral[name] and integral
+
+            self.blocks.append({'rows': rows, 'min': min_ordinal, 'max': max_ordinal, 'columns': columns})
+            offset = self.end = position
+
+    def _layout(self):
+        """(column name, array typecode) in on-disk order."""
+        return [('utc_epoch', 'q'), ('local_ordinal', 'i'),
+                *((name, 'd') for name in self.numeric_fields),
+                *((name, 'H') for name in self.categorical_fields)]
+
+    def __len__(self):
+        return sum(block['rows'] for block in self.blocks)
+
+    def column(self, block, name):
+        """Zero-copy memoryview of one column of one block."""
+        offset, length, typecode = block['columns'][name]
+        return self._view[offset:offset + length].cast(typecode)
+
+    def read(self, start=None, end=None):
+        """
+        Read the rows with local date in [start, end] as a NormalizedDataset.
+
+        Blocks outside the range are skipped using their min/max dates,
+        and each overlapping block is binary searched, so only matching
+        rows are touched. If they all come from one block the dataset's
+        columns are memoryviews straight into the file (no copy; the
+        dataset copies them into arrays if rows are added); otherwise
+        the slices are copied into arrays.
+
+        Args:
+            start (date): First day to include, or None for no lower bound
+            end (date): Last day to include, or None for no upper bound
+        """
+        low_ordinal = None if start is None else start.toordinal()
+        high_ordinal = None if end is None else end.toordinal()
+
+        slices = []
+        for block in self.blocks:
+            if low_ordinal is not None and block['max'] < low_ordinal:
+                continue
+            if high_ordinal is not None and block['min'] > high_ordinal:
+                continue
+            ordinals = self.column(block, 'local_ordinal')
+            low = 0 if low_ordinal is None else bisect_left(ordinals, low_ordinal)
+            high = block['rows'] if high_ordinal is None else bisect_right(ordinals, high_ordinal)
+            if high > low:
+                slices.append((block, low, high))
+
+        dataset = NormalizedDataset(self.numeric_fields, self.categorical_fields)
+        dataset.integral = dict(self.integral)
+        dataset.categories = {name: list(values) for name, values in self.categories.items()}
+        dataset._category_index = {name: {value: code for code, value in enumerate(values)}
+                                   for name, values in self.categories.items()}
+
+        for name, typecode in self._layout():
+            if len(slices) == 1:
+                block, low, high = slices[0]
+                column = self.column(block, name)[low:high]
+            else:
+                column = array(typecode)
+                for block, low, high in slices:
+                    column.frombytes(self.column(block, name)[low:high].cast('B'))
+            if name in ('utc_epoch', 'local_ordinal'):
+                setattr(dataset, name, column)
+            elif name in dataset.numeric:
+                dataset.numeric[name] = column
+            else:
+                dataset.codes[name] = column
+
+        # Every block is sorted, but blocks appended later may repeat
+        # earlier days
+        if len(slices) <= 1:
+            dataset._date_sorted = True
+        elif not dataset.is_date_sorted():
+            dataset = dataset.sorted_by_date()
+        return dataset
+
+
+def write_store(path, dataset, timezone):
+    """
+    Create (or replace) a store file holding one dataset.
+
+    Args:
+        path (str): Store file to write
+        dataset (NormalizedDataset): Normalized records
+        timezone (str): The timezone the local dates were computed in
+    """
+    meta = json.dumps({
+        'timezone': timezone,
+        'numeric_fields': list(dataset.numeric),
+        'categorical_fields': list(dataset.codes),
+        'byteorder': sys.byteorder,
+    }).encode()
+
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(_FILE_HEADER.pack(FILE_MAGIC, SCHEMA_VERSION, len(meta)))
+        f.write(meta)
+        _pad(f, _FILE_HEADER.size + len(meta))
+        _write_block(f, dataset, {name: [None] for name in dataset.codes})
+    os.replace(tmp_path, path)
+
+
+def append_store(path, dataset, timezone):
+    """
+    Append a dataset to an existing store file as a new block.
+
+    A torn block left by an interrupted append is cut off first, so the
+    new block follows the last complete one and can be read.
+
+    Raises:
+        ValueError: If the timezone or fields don't match the store
+    """
+    store = ColumnStore(path)
+    if store.timezone != timezone:
+        raise ValueError(f"{path} holds local dates for {store.timezone}, not {timezone}")
+    if (store.numeric_fields, store.categorical_fields) != (tuple(dataset.numeric), tuple(dataset.codes)):
+        raise ValueError(f"{path} has different fields than the data being appended")
+    categories = store.categories
+    end = store.end
+    del store  # release the map before writing
+
+    with open(path, 'r+b') as f:
+        f.truncate(end)
+        f.seek(end)
+        _write_block(f, dataset, categories)
+
+
+def _write_block(f, dataset, categories):
+    """
+    Write one block for dataset, extending categories (the file's global
+    dictionary so far) with any strings it hasn't seen yet.
+
+    Raises:
+        ValueError: If the dictionary would outgrow the uint16 codes
+    """
+    dataset = dataset.sorted_by_date()
+    rows = len(dataset)
+
+    # Re-code categoricals against the file's global dictionary
+    new_categories = {}
+    codes = {}
+    for name, column in dataset.codes.items():
+        known = {value: code for code, value in enumerate(categories[name])}
+        added = []
+        mapping = []
+        for value in dataset.categories[name]:
+            if value not in known:
+                known[value] = len(categories[name]) + len(added)
+                added.append(value)
+            mapping.append(known[value])
+        if len(categories[name]) + len(added) > MAX_CATEGORIES:
+            raise ValueError(f"Too many distinct {name!r} values for one store; "
+                             f"at most {MAX_CATEGORIES - 1} are supported")
+        new_categories[name] = added
+        codes[name] = array('H', map(mapping.__getitem__, column))
+
+    meta = json.dumps({'new_categories': new_categories, 'integral': dataset.integral}).encode()
+    min_ordinal = min(dataset.local_ordinal) if rows else 0
+    max_ordinal = max(dataset.local_ordinal) if rows else 0
+    f.write(_BLOCK_HEADER.pack(BLOCK_MAGIC, rows, len(meta), min_ordinal, max_ordinal))
+    f.write(meta)
+    _pad(f, _BLOCK_HEADER.size + len(meta))
+
+    columns = [dataset.utc_epoch, dataset.local_ordinal, *dataset.numeric.values(), *codes.values()]
+    for column in columns:
+        data = bytes(column) if isinstance(column, memoryview) else column.tobytes()
+        f.write(data)
+        _pad(f, len(data))
+
+
+def ingest(directory, sleep_dataset, workouts_dataset, local_time_zone, append=False):
+    """
+    Write normalized sleep and workout datasets into a store directory.
+
+    Args:
+        directory (str): Store directory (created if needed)
+        sleep_dataset (NormalizedDataset): Sleep records, normalized in UTC
+        workouts_dataset (NormalizedDataset): Workout records
+        local_time_zone (str): Timezone the workouts were normalized in
+        append (bool): Add to existing store files instead of replacing them
+    """
+    os.makedirs(directory, exist_ok=True)
+    for name, dataset, timezone in ((SLEEP_FILE, sleep_dataset, 'UTC'),
+                                    (WORKOUTS_FILE, workouts_dataset, local_time_zone)):
+        path = os.path.join(directory, name)
+        if append and os.path.exists(path):
+            append_store(path, dataset, timezone)
+        else:
+            write_store(path, dataset, timezone)
+
+
+def load_store(directory, local_time_zone, start=None, end=None):
+    """
+    Open a store directory and read sleep and workouts for a date range.
+
+    Returns:
+        tuple: (sleep, workouts) NormalizedDatasets
+
+    Raises:
+        FileNotFoundError: If the store hasn't been ingested
+        ValueError: If the workouts were ingested for another timezone
+    """
+    sleep = ColumnStore(os.path.join(directory, SLEEP_FILE))
+    workouts = ColumnStore(os.path.join(directory, WORKOUTS_FILE))
+    if workouts.timezone != local_time_zone:
+        raise ValueError(
+            f"Store {directory} was ingested for {workouts.timezone}, not {local_time_zone}; re-run ingest"
+        )
+    return sleep.read(start, end), workouts.read(start, end)
@@ -1,12 +1,37 @@
 # import sys
 # import os
 # sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import os
+import json
+import statistics
 import pytest
-from loader import load_json_data
-from datetime import date
-from normalizer import normalize_to_utc
-from merger import merge_datasets
-from analyzer import calculate_correlations
+import cli
+import loader
+from cache import ResultCache
+from batch import read_manifest, run_batch, write_results
+from profiling import StageProfiler
+from store import ColumnStore, append_store, ingest, load_store, write_store
+from rollup import build_rollups, load_rollups, plan_range, period_range, summarize_store
+import sqlite_store
+from writers import write_rows
+from watch import HealthWatcher, NDJSONTail
+from server import DatasetCache, HealthServer, UserData
+from groupby import group_by, parse_aggregations
+from benchmark import (generate_workouts, write_export, run_benchmark, compare_to_baseline,
+                       LAZY_MODULES)
+from loader import load_json_data, iter_json_records
+import pytz
+from datetime import date, datetime, timedelta
+from normalizer import normalize_to_utc, iter_normalize_to_utc, normalize_to_columns, normalize_parallel
+from merger import (merge_datasets, merge_columns, iter_merge_columns, merge_streams, Aggregation,
+                    SLEEP_AGGREGATIONS, WORKOUT_AGGREGATIONS, SLEEP_FIELDS, WORKOUT_FIELDS)
+from analyzer import (calculate_correlations, sleep_calorie_arrays, threshold_sweep,
+                      pearson_correlation, spearman_correlation, sleep_calorie_analysis,
+                      rolling_averages, low_sleep_streaks, SummaryAccumulator, DEFAULT_THRESHOLDS)
+from accumulators import RunningStats, RunningCovariance, QuantileSketch
+from dataset import NormalizedDataset
+from timestamps import TimestampParser
+from tzcache import get_offset_table, to_seconds, from_seconds
 
 
 
@@ -190,6 +215,35 @@ def test_empty_data():
     # Should only count Oct 3
     assert results['low_sleep_day_count'] == 0
     assert results['normal_sleep_day_count'] == 0
+def test_threshold_sweep_matches_single_cutoffs():
+    merged_data = [
+        {'date': '2023-10-01', 'sleep_hours': 5.0, 'total_calories': 300, 'workout_count': 1},
+        {'date': '2023-10-02', 'sleep_hours': 7.5, 'total_calories': 350, 'workout_count': 1},
+        {'date': '2023-10-03', 'sleep_hours': 6.0, 'total_calories': 400, 'workout_count': 1},
+        {'date': '2023-10-04', 'sleep_hours': None, 'total_calories': 500, 'workout_count': 1},
+    ]
+    sleep_hours, calories = sleep_calorie_arrays(merged_data)
+    sweep = threshold_sweep(sleep_hours, calories, [4.0, 6.0, 6.25, 9.0])
+    
+    assert [s['low_sleep_day_count'] for s in sweep] == [0, 1, 2, 3]
+    assert [s['avg_calories_on_low_sleep_days'] for s in sweep] == [None, 300, 350, 350]
+    assert [s['avg_calories_on_normal_sleep_days'] for s in sweep] == [350, 375, 350, None]
+    # The string summary is the same computation at one cutoff
+    assert calculate_correlations(merged_data, low_sleep_threshold=6.25)['avg_calories_on_low_sleep_days'] == '350.00 calories'
+
+def test_sleep_calorie_correlations():
+    # Perfectly linear -> Pearson 1; monotonic with ties -> Spearman 1
+    assert pearson_correlation([5, 6, 7], [300, 400, 500]) == pytest.approx(1.0)
+    assert spearman_correlation([5, 6, 6, 8], [1, 10, 10, 1000]) == pytest.approx(1.0)
+    assert spearman_correlation([5, 6, 7], [3, 2, 1]) == pytest.approx(-1.0)
+    # Undefined with fewer than two days or no variation
+    assert pearson_correlation([5], [300]) is None
+    assert pearson_correlation([5, 5], [300, 400]) is None
+    
+    analysis = sleep_calorie_analysis([5, 6, 7], [300, 400, 500])
+    assert analysis['day_count'] == 3
+    assert len(analysis['sweep']) == len(DEFAULT_THRESHOLDS)
+
 
 
 
@@ -199,6 +253,101 @@ def test_empty_data():
 
 
 
+def test_calculate_correlations_accepts_generator():
+    merged_data = [
+        {'date': '2023-10-01', 'sleep_hours': 5.0, 'total_calories': 300, 'workout_count': 1},
+        {'date': '2023-10-02', 'sleep_hours': 5.5, 'total_calories': 350, 'workout_count': 1},
+        {'date': '2023-10-03', 'sleep_hours': 7.0, 'total_calories': 400, 'workout_count': 1}
+    ]
+    assert calculate_correlations(day for day in merged_data) == calculate_correlations(merged_data)
+
+def test_online_accumulators_match_batch_statistics():
+    import random
+    import statistics
+    rng = random.Random(7)
+    hours = [round(rng.uniform(3, 10), 2) for _ in range(5000)]
+    calories = [rng.randint(0, 800) + int(20 * h) for h in hours]
+    
+    # Four chunks accumulated separately, then merged
+    chunks = [(RunningStats(), RunningCovariance(), QuantileSketch()) for _ in range(4)]
+    for i, (h, c) in enumerate(zip(hours, calories)):
+        stats, covariance, sketch = chunks[i % 4]
+        stats.add(c)
+        covariance.add(h, c)
+        sketch.add(c)
+    stats, covariance, sketch = chunks[0]
+    for other in chunks[1:]:
+        stats.merge(other[0])
+        covariance.merge(other[1])
+        sketch.merge(other[2])
+    
+    assert stats.count == 5000 and stats.total == sum(calories)
+    assert stats.stdev == pytest.approx(statistics.stdev(calories))
+    assert covariance.correlation == pytest.approx(pearson_correlation(hours, calories))
+    # Within the sketch's rank error of the exact median and p90
+    ordered = sorted(calories)
+    for q in (0.5, 0.9):
+        rank = ordered.index(sketch.quantile(q))
+        assert abs(rank - q * len(ordered)) < 0.02 * len(ordered)
+
+def test_quantile_sketch_exact_when_small():
+    sketch = QuantileSketch()
+    for value in [50, 10, 40, 20, 30]:
+        sketch.add(value)
+    assert (sketch.quantile(0.5), sketch.quantile(0.9), sketch.quantile(0)) == (30, 50, 10)
+
+def test_summary_accumulators_merge():
+    merged = cli.load_and_merge_data('data/sleep1month.json', 'data/workouts1month.json', 'America/Los_Angeles')
+    whole = SummaryAccumulator().update(merged)
+    halves = SummaryAccumulator().update(merged[:15]).merge(SummaryAccumulator().update(merged[15:]))
+    
+    assert halves.results() == whole.results() == calculate_correlations(merged)
+    assert halves.statistics() == pytest.approx(whole.statistics())
+    with pytest.raises(ValueError):
+        whole.merge(SummaryAccumulator(low_sleep_threshold=7.0))
+
+def test_rolling_averages_skip_missing_days():
+    merged_data = [
+        {'date': '2023-10-01', 'sleep_hours': 6.0, 'total_calories': 100, 'workout_time': 10},
+        {'date': '2023-10-02', 'sleep_hours': None, 'total_calories': 200, 'workout_time': 20},
+        # 2023-10-03 to 2023-10-05 missing
+        {'date': '2023-10-06', 'sleep_hours': 8.0, 'total_calories': 300, 'workout_time': 30},
+        {'date': '2023-10-09', 'sleep_hours': 4.0, 'total_calories': 0, 'workout_time': 0},
+    ]
+    rolling = rolling_averages(merged_data, windows=[3, 7])
+    
+    assert rolling[1]['sleep_hours_3d'] == 6.0  # the None day isn't averaged in
+    assert rolling[1]['total_calories_3d'] == 150
+    assert rolling[2]['days_3d'] == 1 and rolling[2]['total_calories_3d'] == 300
+    assert rolling[2]['days_7d'] == 3 and rolling[2]['sleep_hours_7d'] == 7.0
+    # 2023-10-03..09 leaves out the first two days
+    assert rolling[3]['days_7d'] == 2 and rolling[3]['total_calories_7d'] == 150
+    with pytest.raises(ValueError):
+        rolling_averages(merged_data, windows=[7, 0])
+    
+    # Rounding error from past days doesn't outlive an empty window
+    merged_data = [{'date': f'2023-10-0{day}', 'sleep_hours': hours, 'total_calories': 0, 'workout_time': 0}
+                   for day, hours in enumerate([0.1, 0.2, None, None, 0.1], 1)]
+    assert rolling_averages(merged_data, windows=[2])[-1]['sleep_hours_2d'] == 0.1
+
+def test_low_sleep_streaks_break_on_gaps():
+    merged_data = [
+        {'date': '2023-10-01', 'sleep_hours': 5.0},
+        {'date': '2023-10-02', 'sleep_hours': 4.5},
+        {'date': '2023-10-03', 'sleep_hours': 5.5},
+        # 2023-10-04 missing
+        {'date': '2023-10-05', 'sleep_hours': 5.0},
+        {'date': '2023-10-06', 'sleep_hours': 7.0},
+        {'date': '2023-10-07', 'sleep_hours': None},
+        {'date': '2023-10-08', 'sleep_hours': 5.9},
+    ]
+    assert low_sleep_streaks(merged_data) == [
+        {'start': '2023-10-01', 'end': '2023-10-03', 'length': 3},
+        {'start': '2023-10-05', 'end': '2023-10-05', 'length': 1},
+        {'start': '2023-10-08', 'end': '2023-10-08', 'length': 1},
+    ]
+
+
 #testing merger
 def test_merge_multiple_workouts_same_day():
     sleep_data = [
@@ -278,6 +427,47 @@ def test_merge_no_data():
     merged = merge_datasets(sleep_data, workout_data)
 
     assert len(merged) == 0
+def test_iter_merge_columns_matches_merge_columns():
+    sleep = normalize_to_columns(load_json_data('data/sleep1month.json'), 'UTC').sorted_by_date()
+    workouts = normalize_to_columns(load_json_data('data/workouts1month.json') +
+                                    [{"timestamp": "2023-11-05 10:00:00", "type": "swim"}],
+                                    'America/Los_Angeles').sorted_by_date()
+    expected = merge_columns(sleep, workouts)
+    rows = iter_merge_columns(sleep, workouts)
+    assert next(rows) == expected[0]
+    assert list(rows) == expected[1:]
+
+def test_merge_streams_matches_merge_datasets():
+    sleep = normalize_to_utc(load_json_data('data/sleep1month.json'), 'UTC')
+    workouts = normalize_to_utc(load_json_data('data/workouts1month.json'), 'America/Los_Angeles')
+    
+    rows = list(merge_streams([(sleep, SLEEP_AGGREGATIONS), (workouts, WORKOUT_AGGREGATIONS)]))
+    assert rows == merge_datasets(sleep, workouts)
+
+def test_merge_streams_three_sources():
+    sleep = [{'local_date': date(2023, 10, 2), 'hours': 7.5, 'quality': 'good'}]
+    workouts = [{'local_date': date(2023, 10, 1), 'calories': 300, 'duration': 30}]
+    heart_rate = [
+        {'local_date': date(2023, 10, 1), 'bpm': 60},
+        {'local_date': date(2023, 10, 1), 'bpm': 150},
+        {'local_date': date(2023, 10, 3), 'bpm': 70},
+    ]
+    heart_rate_spec = [Aggregation('avg_hr', 'mean', 'bpm'), Aggregation('max_hr', 'max', 'bpm')]
+    
+    rows = list(merge_streams([
+        (sleep, SLEEP_AGGREGATIONS), (workouts, WORKOUT_AGGREGATIONS), (heart_rate, heart_rate_spec)
+    ]))
+    
+    assert [row['date'] for row in rows] == ['2023-10-01', '2023-10-02', '2023-10-03']
+    assert rows[0]['avg_hr'] == 105 and rows[0]['max_hr'] == 150
+    assert rows[0]['sleep_hours'] is None and rows[0]['total_calories'] == 300
+    assert rows[1]['avg_hr'] is None and rows[1]['workout_count'] == 0
+
+def test_merge_streams_requires_sorted_input():
+    workouts = [{'local_date': date(2023, 10, 2), 'calories': 300}, {'local_date': date(2023, 10, 1), 'calories': 250}]
+    with pytest.raises(ValueError, match='not sorted'):
+        list(merge_streams([(workouts, WORKOUT_AGGREGATIONS)]))
+
 
 
 
@@ -319,6 +509,203 @@ def test_pst_normalization_daylight_savings():
 
 
 
+def test_timestamp_parser_fast_path():
+    # One uniform file: every record after learning is a fast-path hit
+    data = load_json_data('data/workouts1month.json')
+    parser = TimestampParser()
+    normalized = normalize_to_utc(data, 'America/Los_Angeles', timestamp_parser=parser)
+    
+    assert parser.stats() == {'format': 'iso', 'hits': len(data), 'misses': 0}
+    # The trailing tz abbreviation is ignored, just like dateutil does
+    assert normalized[0]['utc_datetime'].hour == 6
+    assert normalized[0]['local_date'] == date(2023, 9, 30)
+
+def test_timestamp_parser_fallback():
+    # Records that don't match the learned format go through dateutil
+    parser = TimestampParser()
+    assert parser.parse("2023-10-01T06:00:00Z").tzinfo is not None
+    assert parser.parse("12/7/2025 11pm PST").hour == 23
+    assert parser.parse("13/7/2025 23:00:00").month == 7
+    assert parser.stats() == {'format': 'iso', 'hits': 1, 'misses': 2}
+
+def test_offset_table_matches_pytz_around_dst():
+    # Every 10 minutes across the spring-forward (non-existent 2 AM) and
+    # fall-back (ambiguous 1 AM) days must match pytz.localize exactly
+    tz = pytz.timezone('America/Los_Angeles')
+    table = get_offset_table('America/Los_Angeles')
+    for start in (datetime(2024, 3, 10), datetime(2024, 11, 3)):
+        for minutes in range(0, 24 * 60, 10):
+            wall = start + timedelta(minutes=minutes)
+            expected = tz.localize(wall).astimezone(pytz.UTC).replace(tzinfo=None)
+            assert from_seconds(table.local_to_utc(to_seconds(wall))) == expected
+
+def test_normalization_ambiguous_hour():
+    # 1:30 AM on Nov 3 2024 happens twice in LA; like pytz, use standard time
+    data = [{"timestamp": "2024-11-03 01:30:00", "type": "run", "calories": 100}]
+    
+    normalized = normalize_to_utc(data, 'America/Los_Angeles')
+    assert normalized[0]['utc_datetime'].hour == 9
+    assert normalized[0]['local_date'] == date(2024, 11, 3)
+
+def test_normalization_aware_timestamp_local_date():
+    # A UTC timestamp gets its local date from the source timezone
+    data = [{"timestamp": "2024-03-10T06:30:00Z", "type": "run", "calories": 100}]
+    
+    normalized = normalize_to_utc(data, 'America/Los_Angeles')
+    assert normalized[0]['utc_datetime'].hour == 6
+    assert normalized[0]['local_date'] == date(2024, 3, 9)
+
+def test_normalize_to_columns_row_view():
+    data = [
+        {"timestamp": "2025-12-07 23:00:00 PST", "type": "gym", "calories": 250, "duration": 45, "comment": "late"}
+    ]
+    dataset = normalize_to_columns(data, 'America/Los_Angeles')
+    row = dataset[0]
+    
+    assert len(dataset) == 1
+    assert row['utc_datetime'].day == 8
+    assert row['local_date'] == date(2025, 12, 7)
+    assert row['calories'] == 250 and isinstance(row['calories'], int)
+    assert row['type'] == 'gym'
+    # Fields the record doesn't have (or that aren't stored) are absent
+    assert row.get('hours') is None
+    assert 'comment' not in row
+    assert dataset.nbytes() == 40
+
+def test_projected_records_merge_like_copies():
+    workouts = load_json_data('data/workouts1month.json')
+    sleep = load_json_data('data/sleep1month.json')
+    copies = merge_datasets(normalize_to_utc(sleep, 'UTC'), normalize_to_utc(workouts, 'America/Los_Angeles'))
+    
+    projected = normalize_to_utc(workouts, 'America/Los_Angeles', fields=WORKOUT_FIELDS)
+    # The free-text comment isn't kept, and there's no per-record dict
+    assert 'comment' in workouts[0] and 'comment' not in projected[0]
+    assert not hasattr(projected[0], '__dict__')
+    assert projected[0]['local_date'] == date(2023, 9, 30) and projected[0].get('calories') == 350
+    assert projected[0]['utc_datetime'] == datetime(2023, 10, 1, 6, 0, tzinfo=pytz.UTC)
+    assert merge_datasets(normalize_to_utc(sleep, 'UTC', fields=SLEEP_FIELDS), projected) == copies
+    assert list(merge_streams([(normalize_to_utc(sleep, 'UTC', fields=SLEEP_FIELDS), SLEEP_AGGREGATIONS),
+                               (projected, WORKOUT_AGGREGATIONS)])) == copies
+
+def test_normalize_in_place_reuses_records():
+    data = [{"date": "2023-10-01T06:00:00Z", "hours": 7.5}]
+    normalized = normalize_to_utc(data, 'UTC', in_place=True)
+    assert normalized[0] is data[0] and data[0]['local_date'] == date(2023, 10, 1)
+    with pytest.raises(ValueError):
+        normalize_to_utc(data, 'UTC', fields=SLEEP_FIELDS, in_place=True)
+
+def test_normalize_parallel_matches_serial():
+    records = list(generate_workouts(3000, mixed_fraction=0.2))
+    serial = normalize_to_columns(records, 'America/Los_Angeles')
+    parser = TimestampParser()
+    parallel = normalize_parallel(records, 'America/Los_Angeles', workers=2, chunk_size=700,
+                                  timestamp_parser=parser)
+    
+    assert parallel.utc_epoch == serial.utc_epoch
+    assert parallel.local_ordinal == serial.local_ordinal
+    assert parallel.codes == serial.codes and parallel.categories == serial.categories
+    assert all(parallel.numeric[name].tobytes() == serial.numeric[name].tobytes() for name in serial.numeric)
+    assert parallel.integral == serial.integral
+    assert parser.hits + parser.misses == 3000 and parser.format_name == 'iso'
+    for workers, chunk_size in ((2, 0), (2, -5), (-1, 700)):
+        with pytest.raises(ValueError):
+            normalize_parallel(records, 'America/Los_Angeles', workers=workers, chunk_size=chunk_size)
+
+def test_parallel_load_matches_serial():
+    args = ('data/sleep1month.json', 'data/workouts1month.json', 'America/Los_Angeles')
+    assert cli.load_and_merge_data(*args, workers=2, chunk_size=5) == cli.load_and_merge_data(*args)
+
+def test_process_pools_start_from_the_main_thread(monkeypatch):
+    # Forking for a pool from a helper thread can deadlock the workers
+    import threading
+    threads = []
+    def fake_normalize(*args):
+        threads.append(threading.current_thread())
+        return normalize_to_columns([], 'UTC')
+    monkeypatch.setattr(cli, '_normalize_file', fake_normalize)
+    sources = [('a.json', 'UTC', 'sleep'), ('b.json', 'UTC', 'workouts')]
+    cli._normalize_sources(sources, workers=2)
+    assert threads == [threading.main_thread()] * 2
+
+def test_dataset_columns_round_trip():
+    dataset = normalize_to_columns([{"timestamp": "2023-10-01 07:00:00", "type": "run", "calories": 300},
+                                    {"timestamp": "2023-10-02 07:00:00", "duration": 2.5}], 'UTC')
+    assert list(dataset.column_values('calories')) == [300, None]
+    assert list(dataset.column_values('type')) == ['run', None]
+    assert list(dataset.column_values('comment')) == [None, None]
+    
+    copy = NormalizedDataset()
+    copy.extend_columns(dataset.utc_epoch, dataset.local_ordinal,
+                        {name: list(dataset.column_values(name)) for name in ('calories', 'duration', 'type')})
+    assert [dict(row) for row in copy] == [dict(row) for row in dataset]
+    assert copy.integral == dataset.integral
+
+def test_dataset_rejects_too_many_categories(tmp_path):
+    def with_types(names):
+        dataset = NormalizedDataset()
+        for name in names:
+            dataset.append(0, 738794, {'type': name})
+        return dataset
+    dataset = with_types(f'type {i}' for i in range(65535))
+    with pytest.raises(ValueError, match="Too many distinct 'type' values"):
+        dataset.append(0, 738794, {'type': 'one more'})
+    
+    # Across the blocks of a store too
+    path = str(tmp_path / 'workouts.htcol')
+    write_store(path, with_types(f'a{i}' for i in range(40_000)), 'UTC')
+    with pytest.raises(ValueError):
+        append_store(path, with_types(f'b{i}' for i in range(40_000)), 'UTC')
+    assert len(ColumnStore(path)) == 40_000
+
+def test_dataset_extend_recodes_categories():
+    first = normalize_to_columns([{"timestamp": "2023-10-01 07:00:00", "type": "run"}], 'UTC')
+    second = normalize_to_columns([{"timestamp": "2023-10-02 07:00:00", "type": "swim"},
+                                   {"timestamp": "2023-10-02 08:00:00", "type": "run", "calories": 1.5}], 'UTC')
+    first.extend(second)
+    assert [row['type'] for row in first] == ['run', 'swim', 'run']
+    assert first.integral['calories'] is False
+
+def test_merge_columnar_matches_dicts():
+    sleep = load_json_data('data/sleep1month.json')
+    workouts = load_json_data('data/workouts1month.json')
+    
+    expected = merge_datasets(normalize_to_utc(sleep, 'UTC'), normalize_to_utc(workouts, 'America/Los_Angeles'))
+    merged = merge_datasets(normalize_to_columns(sleep, 'UTC'), normalize_to_columns(workouts, 'America/Los_Angeles'))
+    assert merged == expected
+
+def test_dataset_sorted_date_range():
+    data = [
+        {"timestamp": "2023-10-03 10:00:00", "calories": 3},
+        {"timestamp": "2023-10-01 10:00:00", "calories": 1},
+        {"timestamp": "2023-10-02 10:00:00", "calories": 2},
+        {"timestamp": "2023-10-02 18:00:00", "calories": 4},
+    ]
+    dataset = normalize_to_columns(data, 'UTC')
+    assert not dataset.is_date_sorted()
+    with pytest.raises(ValueError):
+        dataset.date_range(date(2023, 10, 2), date(2023, 10, 2))
+    
+    ordered = dataset.sorted_by_date()
+    assert [row['calories'] for row in ordered] == [1, 2, 4, 3]
+    assert [row['calories'] for row in ordered.date_range(date(2023, 10, 2), date(2023, 10, 2))] == [2, 4]
+    assert [row['calories'] for row in ordered.date_range(start=date(2023, 10, 3))] == [3]
+    assert len(ordered.date_range(date(2023, 10, 4), date(2023, 10, 9))) == 0
+
+def test_merge_columns_unsorted_workouts():
+    # Out-of-order workouts are grouped by day just like merge_datasets()
+    workouts = [
+        {"timestamp": "2023-10-02 10:00:00", "type": "run", "calories": 300, "duration": 30},
+        {"timestamp": "2023-10-01 10:00:00", "type": "gym", "calories": 250, "duration": 45},
+        {"timestamp": "2023-10-02 18:00:00", "type": "swim", "calories": 200},
+    ]
+    sleep = [{"date": "2023-10-03T06:00:00Z", "hours": 7.5, "quality": "good"}]
+    
+    merged = merge_columns(normalize_to_columns(sleep, 'UTC'), normalize_to_columns(workouts, 'UTC'))
+    assert merged == merge_datasets(normalize_to_utc(sleep, 'UTC'), normalize_to_utc(workouts, 'UTC'))
+    assert [day['date'] for day in merged] == ['2023-10-01', '2023-10-02', '2023-10-03']
+    assert merged[1]['total_calories'] == 500
+    assert merged[1]['workout_time'] == 30
+
 
 
 
@@ -350,4 +737,683 @@ def test_load_workout_data():
     assert 'timestamp' in data[0]
     assert 'date' not in data[0]
     assert 'calories' in data[0]
-    assert 'duration' in data[0]
\ No newline at end of file
+    assert 'duration' in data[0]
+
+def test_iter_json_records_array():
+    # Streaming a JSON array should give the same records as json.load,
+    # even when records are split across small read chunks
+    expected = load_json_data('data/workouts1month.json')
+    assert list(iter_json_records('data/workouts1month.json', chunk_size=7)) == expected
+
+def test_iter_json_records_minified_array_streams(tmp_path):
+    # A whole export on one line must not be read in one go
+    import tracemalloc
+    records = [{"timestamp": "2023-10-01 07:00:00", "type": "run", "calories": i} for i in range(50_000)]
+    path = tmp_path / 'workouts.json'
+    path.write_text('\n ' + json.dumps(records))
+    tracemalloc.start()
+    try:
+        count = sum(1 for _ in iter_json_records(str(path)))
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    assert count == len(records)
+    assert peak < path.stat().st_size / 4
+
+def test_iter_json_records_array_commas(tmp_path):
+    path = tmp_path / 'workouts.json'
+    for text, expected in (('[]', []), (' [ ] ', []), ('[1 , 2\n,3]', [1, 2, 3])):
+        path.write_text(text)
+        for chunk_size in (1, 3, 1 << 16):
+            assert list(iter_json_records(str(path), chunk_size=chunk_size)) == expected
+    # Elements need exactly one comma between them, and none before or after
+    for text in ('[1 2]', '[1,,2]', '[,1]', '[1,]', '[,]', '[1, 2'):
+        path.write_text(text)
+        for chunk_size in (1, 3, 1 << 16):
+            with pytest.raises(json.JSONDecodeError):
+                list(iter_json_records(str(path), chunk_size=chunk_size))
+
+def test_iter_json_records_ndjson(tmp_path):
+    path = tmp_path / 'sleep.ndjson'
+    path.write_text(
+        '{"date": "2023-10-01T06:00:00Z", "hours": 7.5, "quality": "good"}\n'
+        '\n'
+        '{"date": "2023-10-02T05:30:00Z", "hours": 5.5, "quality": "poor"}\n'
+    )
+    records = list(iter_json_records(str(path)))
+    
+    assert len(records) == 2
+    assert records[1]['hours'] == 5.5
+
+def test_stream_end_to_end():
+    # Streams from the loader flow through normalization into the merge
+    sleep = iter_normalize_to_utc(iter_json_records('data/sleep1month.json'), 'UTC')
+    workouts = iter_normalize_to_utc(iter_json_records('data/workouts1month.json'), 'America/Los_Angeles')
+    streamed = merge_datasets(sleep, workouts)
+    
+    expected = merge_datasets(
+        normalize_to_utc(load_json_data('data/sleep1month.json'), 'UTC'),
+        normalize_to_utc(load_json_data('data/workouts1month.json'), 'America/Los_Angeles'),
+    )
+    assert streamed == expected
+
+
+
+
+
+
+
+
+def test_sources_load_concurrently(monkeypatch):
+    import threading
+    real_iter = loader.iter_json_records
+    # Each source waits until the other has started too, which only
+    # happens if they are loaded at the same time
+    both_started = threading.Barrier(2, timeout=5)
+    
+    def waiting_iter(path):
+        both_started.wait()
+        yield from real_iter(path)
+    monkeypatch.setattr(loader, 'iter_json_records', waiting_iter)
+    
+    merged = cli.load_and_merge_data('data/sleep.json', 'data/workouts.json', 'America/Los_Angeles')
+    assert len(merged) == 3
+    assert not both_started.broken
+
+def test_source_errors_reported_for_every_source(tmp_path, capsys):
+    bad = tmp_path / 'bad.json'
+    bad.write_text('[{"timestamp": "not a date"}]')
+    with pytest.raises(FileNotFoundError):
+        cli.load_and_merge_data(str(tmp_path / 'missing.json'), str(bad), 'America/Los_Angeles')
+    
+    out = capsys.readouterr().out
+    assert 'File not found' in out
+    assert f'Could not load workouts data from {bad}' in out
+
+#testing cache
+def test_cache_warm_run_skips_parsing(tmp_path, monkeypatch):
+    cache = ResultCache(str(tmp_path / 'cache'))
+    cold = cli.load_and_merge_data('data/sleep.json', 'data/workouts.json', 'America/Los_Angeles', cache)
+    
+    # A warm run must not touch the JSON parser at all
+    def fail(*args, **kwargs):
+        raise AssertionError("parsed on a warm run")
+    monkeypatch.setattr(loader, 'iter_json_records', fail)
+    warm = cli.load_and_merge_data('data/sleep.json', 'data/workouts.json', 'America/Los_Angeles', cache)
+    
+    assert warm == cold
+    assert cache.clear() == 1
+
+def test_date_range_query_uses_cached_index(tmp_path):
+    cache = ResultCache(str(tmp_path / 'cache'))
+    args = ('data/sleep1month.json', 'data/workouts1month.json', 'America/Los_Angeles', cache)
+    full = cli.load_and_merge_data(*args)
+    
+    # Cold and warm range queries agree with filtering the full result
+    expected = [day for day in full if '2023-10-05' <= day['date'] <= '2023-10-07']
+    assert cli.load_and_merge_data(*args, date_from=date(2023, 10, 5), date_to=date(2023, 10, 7)) == expected
+    assert cli.load_and_merge_data(*args, date_from=date(2023, 10, 5), date_to=date(2023, 10, 7)) == expected
+    assert cli.load_and_merge_data(*args, date_from=date(2023, 10, 25)) == [day for day in full if day['date'] >= '2023-10-25']
+    assert cli.load_and_merge_data(*args, date_to=date(2020, 1, 1)) == []
+
+def test_cache_key_changes_with_inputs(tmp_path):
+    cache = ResultCache(str(tmp_path / 'cache'))
+    path = tmp_path / 'sleep.json'
+    path.write_text('[]')
+    key = cache.key([str(path)], 'UTC')
+    
+    assert cache.key([str(path)], 'America/Los_Angeles') != key
+    path.write_text('[ ]')
+    assert cache.key([str(path)], 'UTC') != key
+
+def test_cache_lru_eviction(tmp_path):
+    cache = ResultCache(str(tmp_path), max_bytes=2500)
+    cache.store('a', b'x' * 1000)
+    cache.store('b', b'x' * 1000)
+    cache.load('a')  # 'a' is now the most recently used
+    os.utime(tmp_path / 'b.pickle', ns=(0, 0))
+    cache.store('c', b'x' * 1000)
+    
+    assert cache.load('a') is not None
+    assert cache.load('b') is None
+    assert cache.load('c') is not None
+
+
+
+
+
+
+
+
+#testing store
+def test_store_round_trip_and_append(tmp_path):
+    sleep = normalize_to_columns(iter_json_records('data/sleep1month.json'), 'UTC')
+    workouts = normalize_to_columns(iter_json_records('data/workouts1month.json'), 'America/Los_Angeles')
+    expected = merge_datasets(sleep, workouts)
+    store_dir = str(tmp_path / 'store')
+    ingest(store_dir, sleep, workouts, 'America/Los_Angeles')
+    
+    # A single block is read without copying
+    stored_sleep, stored_workouts = load_store(store_dir, 'America/Los_Angeles')
+    assert isinstance(stored_workouts.local_ordinal, memoryview)
+    assert merge_datasets(stored_sleep, stored_workouts) == expected
+    
+    # Memoryview columns can still be re-sorted and grown
+    stored_workouts._date_sorted = None
+    assert stored_workouts.sorted_by_date() is stored_workouts
+    reversed_workouts = stored_workouts._copy_with(lambda column: column[::-1])
+    assert list(reversed_workouts.sorted_by_date().local_ordinal) == list(stored_workouts.local_ordinal)
+    stored_workouts.append(0, 1, {'type': 'rowing'})
+    assert len(stored_workouts) == len(workouts) + 1 and stored_workouts[-1]['type'] == 'rowing'
+    
+    # Appending adds a block; new categories extend the file's dictionary
+    extra = normalize_to_columns([{"timestamp": "2023-11-02 07:00:00", "type": "rowing", "calories": 90}],
+                                 'America/Los_Angeles')
+    empty = normalize_to_columns([], 'UTC')
+    ingest(store_dir, empty, extra, 'America/Los_Angeles', append=True)
+    assert len(ColumnStore(str(tmp_path / 'store' / 'workouts.htcol')).blocks) == 2
+    _, stored_workouts = load_store(store_dir, 'America/Los_Angeles')
+    assert len(stored_workouts) == len(workouts) + 1
+    assert stored_workouts[-1]['type'] == 'rowing'
+    assert stored_workouts[0]['type'] == workouts.sorted_by_date()[0]['type']
+
+def test_store_append_after_torn_block(tmp_path):
+    workouts = normalize_to_columns(iter_json_records('data/workouts1month.json'), 'America/Los_Angeles')
+    path = str(tmp_path / 'workouts.htcol')
+    write_store(path, workouts, 'America/Los_Angeles')
+    # An append that stopped part-way: a block header promising more rows than follow
+    from store import _BLOCK_HEADER, BLOCK_MAGIC
+    with open(path, 'ab') as f:
+        f.write(_BLOCK_HEADER.pack(BLOCK_MAGIC, 1000, 2, 0, 0) + b'{}' + b'\0' * 100)
+    assert len(ColumnStore(path)) == len(workouts)
+    
+    extra = normalize_to_columns([{"timestamp": "2023-11-02 07:00:00", "type": "rowing", "calories": 90}],
+                                 'America/Los_Angeles')
+    append_store(path, extra, 'America/Los_Angeles')
+    append_store(path, extra, 'America/Los_Angeles')
+    store = ColumnStore(path)
+    assert len(store) == len(workouts) + 2 and store.end == os.path.getsize(path)
+    assert [row['type'] for row in store.read(date(2023, 11, 2), date(2023, 11, 2))] == ['rowing', 'rowing']
+
+def test_store_date_range_and_timezone_check(tmp_path):
+    store_dir = str(tmp_path / 'store')
+    cli.ingest(store_dir, 'data/sleep1month.json', 'data/workouts1month.json', 'America/Los_Angeles')
+    full = cli.load_and_merge_data('data/sleep1month.json', 'data/workouts1month.json', 'America/Los_Angeles')
+    
+    expected = [day for day in full if '2023-10-05' <= day['date'] <= '2023-10-07']
+    assert cli.load_and_merge_store(store_dir, 'America/Los_Angeles', None,
+                                    date(2023, 10, 5), date(2023, 10, 7)) == expected
+    with pytest.raises(ValueError):
+        load_store(store_dir, 'Europe/London')
+
+def test_rollup_plan_covers_range_once():
+    import random
+    rng = random.Random(3)
+    for _ in range(500):
+        start = date(2019, 1, 1) + timedelta(days=rng.randint(0, 2000))
+        end = start + timedelta(days=rng.randint(0, rng.choice([6, 45, 800])))
+        cells, edges = plan_range(start, end)
+        days = []
+        for first, last in [period_range(level, key) for level, key in cells] + edges:
+            days += [first + timedelta(days=i) for i in range((last - first).days + 1)]
+        assert sorted(days) == [start + timedelta(days=i) for i in range((end - start).days + 1)]
+    assert plan_range(date(2023, 1, 1), date(2024, 2, 29))[0] == [('year', '2023'), ('month', '2024-01'),
+                                                                  ('month', '2024-02')]
+
+def test_rollup_summaries_match_scans_after_append(tmp_path):
+    sleep = load_json_data('data/sleep1month.json')
+    workouts = load_json_data('data/workouts1month.json')
+    # The second export starts part-way through a day the first one has
+    for name, first, second in (('sleep', sleep[:12], sleep[12:]), ('workouts', workouts[:15], workouts[15:])):
+        (tmp_path / f'{name}1.json').write_text(json.dumps(first))
+        (tmp_path / f'{name}2.json').write_text(json.dumps(second))
+    store_dir = str(tmp_path / 'store')
+    cli.ingest(store_dir, str(tmp_path / 'sleep1.json'), str(tmp_path / 'workouts1.json'), 'America/Los_Angeles')
+    cli.ingest(store_dir, str(tmp_path / 'sleep2.json'), str(tmp_path / 'workouts2.json'), 'America/Los_Angeles',
+               append=True)
+    
+    # Updated in place, the rollups are what a full rebuild gives
+    cube = load_rollups(store_dir, 'America/Los_Angeles')
+    assert cube.to_dict() == build_rollups(store_dir, 'America/Los_Angeles').to_dict()
+    
+    full = cli.load_and_merge_data('data/sleep1month.json', 'data/workouts1month.json', 'America/Los_Angeles')
+    for start, end in ((None, None), (date(2023, 10, 2), date(2023, 10, 31)), (date(2023, 10, 9), date(2023, 10, 22)),
+                       (date(2023, 10, 30), None)):
+        days = [day for day in full if (start is None or day['date'] >= start.isoformat())
+                and (end is None or day['date'] <= end.isoformat())]
+        summary = summarize_store(store_dir, 'America/Los_Angeles', start, end)
+        assert summary.results() == calculate_correlations(days)
+        assert summary.statistics() == pytest.approx(SummaryAccumulator().update(days).statistics())
+    
+    # A store changed behind the rollups' back isn't summarized from them
+    ingest(store_dir, normalize_to_columns(sleep[:3], 'UTC'), normalize_to_columns(workouts[:3], 'America/Los_Angeles'),
+           'America/Los_Angeles', append=True)
+    assert load_rollups(store_dir, 'America/Los_Angeles') is None
+
+def test_sqlite_store_merges_and_summarizes_in_sql(tmp_path):
+    sleep = normalize_to_columns(iter_json_records('data/sleep1month.json'), 'UTC')
+    workouts = normalize_to_columns(iter_json_records('data/workouts1month.json'), 'America/Los_Angeles')
+    expected = merge_datasets(sleep, workouts)
+    path = str(tmp_path / 'health.db')
+    sqlite_store.ingest(path, sleep, workouts, 'America/Los_Angeles')
+    sqlite_store.ingest(path, sleep, normalize_to_columns([], 'UTC'), 'UTC', user='other')
+    
+    assert list(sqlite_store.merge_days(path, 'America/Los_Angeles')) == expected
+    assert sqlite_store.summarize(path, 'America/Los_Angeles') == calculate_correlations(expected)
+    assert sqlite_store.summarize(path, 'America/Los_Angeles', low_sleep_threshold=7) == \
+        calculate_correlations(expected, 7)
+    stored_sleep, stored_workouts = sqlite_store.load_datasets(path, 'America/Los_Angeles')
+    assert merge_datasets(stored_sleep, stored_workouts) == expected
+    assert group_by(stored_workouts, ['week', 'type'], parse_aggregations('calories:sum,count'), stored_sleep) == \
+        group_by(workouts, ['week', 'type'], parse_aggregations('calories:sum,count'), sleep)
+    
+    # Users are kept apart; an append's sleep record wins its day
+    assert [day['workout_count'] for day in sqlite_store.merge_days(path, 'UTC', 'other')] == [0] * len(sleep)
+    late = normalize_to_columns([{"timestamp": "2023-10-05T23:00:00Z", "hours": 3.25, "quality": "poor"}], 'UTC')
+    sqlite_store.ingest(path, late, normalize_to_columns([], 'UTC'), 'America/Los_Angeles', append=True)
+    day = next(day for day in sqlite_store.merge_days(path, 'America/Los_Angeles') if day['date'] == '2023-10-05')
+    assert (day['sleep_hours'], day['sleep_quality']) == (3.25, 'poor')
+
+def test_sqlite_store_from_cli(tmp_path, capsys):
+    path = str(tmp_path / 'health.db')
+    cli.ingest(path, 'data/sleep1month.json', 'data/workouts1month.json', 'America/Los_Angeles')
+    full = cli.load_and_merge_data('data/sleep1month.json', 'data/workouts1month.json', 'America/Los_Angeles')
+    
+    expected = [day for day in full if '2023-10-05' <= day['date'] <= '2023-10-07']
+    assert cli.load_and_merge_store(path, 'America/Los_Angeles', None, date(2023, 10, 5), date(2023, 10, 7)) == expected
+    capsys.readouterr()
+    cli.showSummary(store_dir=path, date_from=datetime(2023, 10, 5), date_to=datetime(2023, 10, 7))
+    low_count = calculate_correlations(expected)['low_sleep_day_count']
+    assert f"low_sleep_day_count               | {low_count}" in capsys.readouterr().out
+    
+    with pytest.raises(ValueError):
+        cli.load_and_merge_store(path, 'Europe/London')
+    with pytest.raises(ValueError):
+        cli.load_and_merge_store(path, 'America/Los_Angeles', user='nobody')
+    with pytest.raises(FileNotFoundError):
+        cli.load_and_merge_store(str(tmp_path / 'missing.db'), 'America/Los_Angeles')
+    
+    # Only a SQLite store tells users apart
+    import typer
+    capsys.readouterr()
+    store_dir = str(tmp_path / 'store')
+    for command in (cli.showbyday, cli.showSummary, cli.showtrends, cli.groupby):
+        with pytest.raises(typer.Exit):
+            command(store_dir=store_dir, user='other')
+        assert capsys.readouterr().out.startswith('Error: --user other')
+    with pytest.raises(typer.Exit):
+        cli.ingest(store_dir, 'data/sleep1month.json', 'data/workouts1month.json', user='other')
+    assert not os.path.exists(store_dir)
+
+#testing writers
+def test_writers_stream_formats():
+    import io
+    rows = [{'date': '2023-10-01', 'sleep_hours': 7.5, 'total_calories': 300},
+            {'date': '2023-10-02', 'sleep_hours': None, 'total_calories': 0},
+            {'date': '2023-10-03', 'sleep_hours': 6.0, 'total_calories': 150}]
+    
+    out = io.StringIO()
+    assert write_rows(iter(rows), 'ndjson', out) == 3
+    assert out.getvalue().splitlines()[1] == '{"date": "2023-10-02", "sleep_hours": null, "total_calories": 0}'
+    
+    out = io.StringIO()
+    assert write_rows(iter(rows), 'csv', out) == 3
+    assert out.getvalue().splitlines()[:3] == ['date,sleep_hours,total_calories', '2023-10-01,7.5,300',
+                                               '2023-10-02,,0']
+    
+    # Paginated tables repeat the header on every page
+    out = io.StringIO()
+    assert write_rows(iter(rows), 'table', out, page_size=2) == 3
+    assert out.getvalue().count('| date ') == 2
+    
+    with pytest.raises(ValueError):
+        write_rows(rows, 'xml')
+
+def test_lazy_store_rows(tmp_path):
+    store_dir = str(tmp_path / 'store')
+    cli.ingest(store_dir, 'data/sleep1month.json', 'data/workouts1month.json', 'America/Los_Angeles')
+    rows = cli.load_and_merge_store(store_dir, 'America/Los_Angeles', lazy=True)
+    assert not isinstance(rows, list)
+    assert list(rows) == cli.load_and_merge_store(store_dir, 'America/Los_Angeles')
+
+#testing watch
+def _append_lines(path, records, partial=''):
+    with open(path, 'a') as f:
+        f.write(''.join(json.dumps(record) + '\n' for record in records) + partial)
+
+def test_watch_applies_appended_records(tmp_path):
+    sleep = load_json_data('data/sleep1month.json')
+    workouts = load_json_data('data/workouts1month.json')
+    sleep_file, workouts_file = str(tmp_path / 'sleep.ndjson'), str(tmp_path / 'workouts.ndjson')
+    published = []
+    watcher = HealthWatcher(sleep_file, workouts_file, 'America/Los_Angeles',
+                            listeners=[lambda results, changed: published.append(changed)])
+    assert watcher.poll() == [] and published == []
+    
+    # First half, with the next workout only partly written
+    half = len(workouts) // 2
+    _append_lines(sleep_file, sleep[:20])
+    _append_lines(workouts_file, workouts[:half], partial=json.dumps(workouts[half])[:10])
+    watcher.poll()
+    
+    # Finishing the line and appending the rest revises days already counted
+    with open(workouts_file, 'a') as f:
+        f.write(json.dumps(workouts[half])[10:] + '\n')
+    _append_lines(workouts_file, workouts[half + 1:])
+    _append_lines(sleep_file, sleep[20:])
+    changed = watcher.poll()
+    
+    expected = cli.load_and_merge_data('data/sleep1month.json', 'data/workouts1month.json', 'America/Los_Angeles')
+    assert watcher.index.rows() == expected
+    assert watcher.results() == calculate_correlations(expected)
+    assert published[-1] == changed and len(changed) < len(expected)
+    assert watcher.summary.statistics()['pearson'] == pytest.approx(
+        SummaryAccumulator().update(expected).statistics()['pearson'])
+
+def test_watch_bad_line_leaves_summary_intact(tmp_path):
+    sleep = load_json_data('data/sleep1month.json')
+    workouts = load_json_data('data/workouts1month.json')
+    sleep_file, workouts_file = str(tmp_path / 'sleep.ndjson'), str(tmp_path / 'workouts.ndjson')
+    watcher = HealthWatcher(sleep_file, workouts_file, 'America/Los_Angeles')
+    _append_lines(sleep_file, sleep)
+    _append_lines(workouts_file, workouts[:10])
+    watcher.poll()
+    before = (watcher.results(), watcher.index.rows())
+    
+    # A good sleep record for a day already counted, then a malformed
+    # workout line: nothing is applied
+    _append_lines(sleep_file, [{**sleep[2], 'hours': 1.0}])
+    with open(workouts_file, 'a') as f:
+        f.write(json.dumps(workouts[10]) + '\n{"timestamp": "2023-10-\n')
+    with pytest.raises(ValueError):
+        watcher.poll()
+    assert (watcher.results(), watcher.index.rows()) == before
+    with pytest.raises(ValueError):
+        watcher.poll()
+    
+    # A bad timestamp is rolled back the same way
+    watcher = HealthWatcher(sleep_file, str(tmp_path / 'bad.ndjson'), 'America/Los_Angeles')
+    _append_lines(str(tmp_path / 'bad.ndjson'), [{'timestamp': 'not a time', 'calories': 5}])
+    with pytest.raises(ValueError):
+        watcher.poll()
+    assert watcher.results() == calculate_correlations([]) and len(watcher.index) == 0
+
+def test_ndjson_tail_rejects_truncation(tmp_path):
+    path = tmp_path / 'sleep.ndjson'
+    tail = NDJSONTail(str(path))
+    assert tail.read_new() == []
+    path.write_text('{"hours": 7}\n{"hours": 8}\n')
+    assert tail.read_new() == [{'hours': 7}, {'hours': 8}]
+    path.write_text('{"hours": 7}\n')
+    with pytest.raises(ValueError):
+        tail.read_new()
+
+def test_running_stats_remove_restores_state():
+    stats, covariance = RunningStats(), RunningCovariance()
+    for x, y in [(5.0, 100), (7.5, 250), (6.0, 175), (8.0, 300)]:
+        stats.add(y)
+        covariance.add(x, y)
+    stats.remove(175)
+    covariance.remove(6.0, 175)
+    assert stats.count == 3 and stats.total == 650
+    assert stats.variance == pytest.approx(statistics.variance([100, 250, 300]))
+    assert covariance.correlation == pytest.approx(pearson_correlation([5.0, 7.5, 8.0], [100, 250, 300]))
+    with pytest.raises(ValueError):
+        SummaryAccumulator().remove({'sleep_hours': 7.0, 'total_calories': 100})
+
+#testing server
+_MONTH = {'user_id': 'u1', 'sleep_file': 'data/sleep1month.json', 'workouts_file': 'data/workouts1month.json',
+          'timezone': 'America/Los_Angeles'}
+
+def test_server_answers_days_and_summary():
+    import asyncio
+    server = HealthServer({'u1': _MONTH})
+    expected = cli.load_and_merge_data('data/sleep1month.json', 'data/workouts1month.json', 'America/Los_Angeles')
+    
+    async def requests():
+        return [await server.handle_request('GET', target) for target in (
+            '/days', '/summary?user=u1', '/days?from=2023-10-05&to=2023-10-07', '/summary?to=2023-10-10',
+            '/days?user=nobody', '/days?from=10/05/2023', '/nothing')]
+    days, summary, week, part, unknown, bad_date, bad_path = asyncio.run(requests())
+    
+    assert days == (200, {'user': 'u1', 'days': expected})
+    assert summary[1]['summary'] == calculate_correlations(expected)
+    assert week[1]['days'] == [day for day in expected if '2023-10-05' <= day['date'] <= '2023-10-07']
+    assert part[1]['summary'] == calculate_correlations([day for day in expected if day['date'] <= '2023-10-10'])
+    assert (unknown[0], bad_date[0], bad_path[0]) == (404, 400, 404)
+    assert server.cache.loads == 1
+
+def test_dataset_cache_coalesces_and_evicts(tmp_path):
+    import asyncio
+    import shutil
+    import time
+    calls = []
+    def slow_loader(entry):
+        calls.append(entry['user_id'])
+        time.sleep(0.05)
+        return UserData([{'date': '2023-10-01', 'sleep_hours': 7.0, 'total_calories': 100}])
+    
+    entries = {}
+    for user in ('a', 'b'):
+        entries[user] = {'user_id': user, 'timezone': 'UTC',
+                         'sleep_file': shutil.copy('data/sleep1month.json', tmp_path / f'{user}_sleep.json'),
+                         'workouts_file': shutil.copy('data/workouts1month.json', tmp_path / f'{user}_workouts.json')}
+    # Room for one user only
+    cache = DatasetCache(max_bytes=1000, loader=slow_loader)
+    
+    async def run():
+        results = await asyncio.gather(*(cache.get(entries['a']) for _ in range(5)))
+        assert all(result is results[0] for result in results)
+        await cache.get(entries['b'])
+        await cache.get(entries['b'])
+        os.utime(entries['b']['sleep_file'], ns=(0, 0))  # changed file -> reload
+        await cache.get(entries['b'])
+    asyncio.run(run())
+    
+    assert calls == ['a', 'b', 'b']
+    assert len(cache.entries) == 1 and cache.nbytes == 600
+
+def test_server_http_keep_alive():
+    import asyncio
+    server = HealthServer({'u1': _MONTH})
+    
+    async def run():
+        listener = await server.start(port=0)
+        port = listener.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        bodies = []
+        # A body on the first request is read past, not taken for the next request
+        for target, extra in (('/summary', 'Content-Length: 11\r\n\r\nhello world'),
+                              ('/days?from=2023-10-31', '\r\n')):
+            writer.write(f'GET {target} HTTP/1.1\r\nHost: localhost\r\n{extra}'.encode())
+            status = await reader.readline()
+            headers = {}
+            while (line := await reader.readline()) != b'\r\n':
+                name, _, value = line.decode().partition(':')
+                headers[name.lower()] = value.strip()
+            assert status.startswith(b'HTTP/1.1 200')
+            bodies.append(json.loads(await reader.readexactly(int(headers['content-length']))))
+        writer.close()
+        
+        # A header line over the reader's 64 KiB limit is answered, not dropped
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(b'GET /summary HTTP/1.1\r\nX-Padding: ' + b'a' * 70_000 + b'\r\n\r\n')
+        too_long = await reader.read()
+        writer.close()
+        listener.close()
+        await listener.wait_closed()
+        return bodies, too_long
+    (summary, days), too_long = asyncio.run(run())
+    
+    assert summary['day_count'] == 32
+    assert [day['date'] for day in days['days']] == ['2023-10-31']
+    assert too_long.startswith(b'HTTP/1.1 400') and b'Connection: close' in too_long
+
+#testing groupby
+def test_group_by_week_and_type_on_low_sleep_days():
+    sleep = normalize_to_utc(load_json_data('data/sleep1month.json'), 'UTC')
+    workouts = normalize_to_utc(load_json_data('data/workouts1month.json'), 'America/Los_Angeles')
+    aggregations = parse_aggregations('calories:sum,duration:mean,calories:max,count')
+    
+    rows = group_by(workouts, ['week', 'type'], aggregations, sleep=sleep, low_sleep_threshold=6.0)
+    
+    # Brute force over the same records
+    sleep_hours = {record['local_date']: record['hours'] for record in sleep}
+    expected = {}
+    for record in workouts:
+        if sleep_hours.get(record['local_date'], 99) >= 6.0:
+            continue
+        year, week, _ = record['local_date'].isocalendar()
+        expected.setdefault((f'{year}-W{week:02d}', record['type']), []).append(record)
+    assert [(row['week'], row['type']) for row in rows] == sorted(expected)
+    for row in rows:
+        group = expected[row['week'], row['type']]
+        assert row['calories_sum'] == sum(record['calories'] for record in group)
+        assert row['calories_max'] == max(record['calories'] for record in group)
+        assert row['duration_mean'] == pytest.approx(sum(record['duration'] for record in group) / len(group))
+        assert row['count'] == len(group)
+
+def test_group_by_columns_match_records():
+    sleep_records = load_json_data('data/sleep1month.json')
+    workout_records = load_json_data('data/workouts1month.json')
+    sleep = normalize_to_columns(sleep_records, 'UTC')
+    workouts = normalize_to_columns(workout_records, 'America/Los_Angeles')
+    aggregations = parse_aggregations('calories:sum,duration:min,count')
+    
+    for keys in (['month', 'quality'], ['date'], ['type']):
+        assert group_by(workouts, keys, aggregations, sleep=sleep) == group_by(
+            normalize_to_utc(workout_records, 'America/Los_Angeles'), keys, aggregations,
+            sleep=normalize_to_utc(sleep_records, 'UTC'))
+    # Sleep records group on their own quality
+    by_quality = group_by(sleep, ['quality'], parse_aggregations('hours:mean,count'))
+    assert sum(row['count'] for row in by_quality) == len(sleep)
+    
+    with pytest.raises(ValueError):
+        group_by(workouts, ['weekday'], aggregations)
+    with pytest.raises(ValueError):
+        parse_aggregations('calories:median')
+
+#testing batch
+def test_batch_isolates_failures(tmp_path):
+    manifest = tmp_path / 'manifest.csv'
+    manifest.write_text(
+        'user_id,sleep_file,workouts_file,timezone\n'
+        'u1,data/sleep.json,data/workouts.json,America/Los_Angeles\n'
+        'u2,data/missing.json,data/workouts.json,America/Los_Angeles\n'
+        'u3,data/sleep1month.json,data/workouts1month.json,America/New_York\n'
+    )
+    entries = read_manifest(str(manifest))
+    results = list(run_batch(entries, workers=2, chunk_size=1))
+    
+    # Results come back in manifest order, with the bad user isolated
+    assert [r['user_id'] for r in results] == ['u1', 'u2', 'u3']
+    assert [r['status'] for r in results] == ['ok', 'error', 'ok']
+    assert 'FileNotFoundError' in results[1]['error']
+    assert results[0]['low_sleep_day_count'] == 1
+    
+    output = tmp_path / 'results.csv'
+    assert write_results(results, str(output)) == (3, 1)
+    assert output.read_text().splitlines()[0].startswith('user_id,status,error')
+
+def test_batch_manifest_missing_field(tmp_path):
+    manifest = tmp_path / 'manifest.ndjson'
+    manifest.write_text('{"user_id": "u1", "sleep_file": "data/sleep.json", "workouts_file": "data/workouts.json"}\n')
+    with pytest.raises(ValueError, match='timezone'):
+        read_manifest(str(manifest))
+
+def test_batch_command_reports_bad_manifests(tmp_path, capsys):
+    import typer
+    manifest = tmp_path / 'manifest.csv'
+    manifest.write_text('user_id,sleep_file\nu1,data/sleep.json\n')
+    for path in (str(manifest), str(tmp_path / 'missing.csv')):
+        with pytest.raises(typer.Exit):
+            cli.batch(path, output=str(tmp_path / 'out.ndjson'))
+        assert capsys.readouterr().out.startswith('Error: ')
+
+
+
+
+
+
+
+
+#testing benchmark
+def test_generated_exports_parse(tmp_path):
+    path = tmp_path / 'workouts.ndjson'
+    assert write_export(generate_workouts(500, mixed_fraction=0.2), str(path), 'ndjson') == 500
+    
+    parser = TimestampParser()
+    normalized = normalize_to_utc(iter_json_records(str(path)), 'America/Los_Angeles', timestamp_parser=parser)
+    assert len(normalized) == 500
+    # Mostly the main format, with some records on the dateutil fallback
+    assert parser.hits > parser.misses > 0
+    # Some late-night workouts land on the next day in UTC
+    assert any(r['utc_datetime'].date() > r['local_date'] for r in normalized)
+
+def test_benchmark_reports_every_stage(tmp_path):
+    results = run_benchmark([100, 400], workdir=str(tmp_path))
+    
+    for stages in results['sizes'].values():
+        assert list(stages) == ['load_json_data', 'normalize_to_utc', 'merge_datasets', 'calculate_correlations']
+        assert all(stage['peak_bytes'] > 0 for stage in stages.values())
+    assert set(results['scaling']) == set(stages)
+    # Projected records hold less than full copies of the records
+    memory = results['normalize_memory']['400']
+    assert list(memory) == ['copy', 'in_place', 'projected', 'columns']
+    assert memory['projected']['retained_bytes'] < memory['copy']['retained_bytes']
+    
+    # Doubling every baseline timing makes nothing a regression; halving
+    # them flags every stage
+    slower = {'sizes': {size: {name: {'seconds': numbers['seconds'] * 2} for name, numbers in stages.items()}
+                        for size, stages in results['sizes'].items()}}
+    faster = {'sizes': {size: {name: {'seconds': numbers['seconds'] / 2} for name, numbers in stages.items()}
+                        for size, stages in results['sizes'].items()}}
+    assert not any(row['regressed'] for row in compare_to_baseline(results, slower))
+    assert all(row['regressed'] for row in compare_to_baseline(results, faster))
+
+def test_cli_startup_imports_stay_lazy():
+    import subprocess
+    import sys
+    # Heavy dependencies and pipeline modules load inside the commands; the
+    # time budget itself is checked by `python -m benchmark startup`
+    code = f"import sys, cli; print(','.join(name for name in {LAZY_MODULES!r} if name in sys.modules))"
+    process = subprocess.run([sys.executable, '-c', code], cwd=os.path.dirname(os.path.abspath(cli.__file__)),
+                             capture_output=True, text=True, check=True)
+    assert process.stdout.strip() == ''
+
+
+
+
+
+
+
+
+#testing profiling
+def test_profiler_records_pipeline_stages():
+    seen = []
+    profiler = StageProfiler(listeners=[seen.append])
+    merged = cli.load_and_merge_data('data/sleep.json', 'data/workouts.json', 'America/Los_Angeles',
+                                     profiler=profiler)
+    
+    names = [stage['name'] for stage in profiler.stages]
+    assert names == ['load sleep', 'parse sleep timestamps', 'convert sleep timezones',
+                     'load workouts', 'parse workouts timestamps', 'convert workouts timezones',
+                     'load sources', 'sort by date', 'merge']
+    # Listeners see every stage as it finishes
+    assert seen == profiler.stages
+    parse = profiler.stages[4]
+    assert parse['records'] == 3
+    assert parse['extra'] == {'fast_path': 3, 'fallback': 0}
+    assert merged == cli.load_and_merge_data('data/sleep.json', 'data/workouts.json', 'America/Los_Angeles')
+
+def test_profiler_stage_context():
+    profiler = StageProfiler()
+    with profiler.stage('work') as stage:
+        stage['records'] = 10
+        stage['extra']['note'] = 'x'
+    
+    [row] = profiler.table()
+    assert row[0] == 'work'
+    assert row[2] == 10
+    assert row[5] == 'note=x'
+
@@ -0,0 +1,182 @@
+import re
+import time
+from datetime import datetime, timedelta, timezone
+
+
+# Candidate layouts, tried in order on the first records of a file.
+# Every pattern captures year, month, day, hour, minute, second and
+# fraction groups by name, followed by the shared timezone suffix.
+_TZ_SUFFIX = r'(?:(?P<zulu>Z)|(?P<offset>[+-]\d{2}:?\d{2})|\s+(?P<abbrev>[A-Z]{1,5}))?$'
+
+CANDIDATE_FORMATS = [
+    # 2023-10-01T06:00:00Z, 2023-10-01 14:00:00 PST, 2000-2-28 23:00:00
+    ('iso', re.compile(
+        r'(?P<year>\d{4})-(?P<month>\d{1,2})-(?P<day>\d{1,2})[T ]'
+        r'(?P<hour>\d{1,2}):(?P<minute>\d{2})'
+        r'(?::(?P<second>\d{2})(?:\.(?P<fraction>\d{1,6}))?)?' + _TZ_SUFFIX
+    )),
+    # 12/7/2025 23:00:00 PST (month first, like dateutil's default)
+    ('us', re.compile(
+        r'(?P<month>\d{1,2})/(?P<day>\d{1,2})/(?P<year>\d{4}) '
+        r'(?P<hour>\d{1,2}):(?P<minute>\d{2})'
+        r'(?::(?P<second>\d{2})(?:\.(?P<fraction>\d{1,6}))?)?' + _TZ_SUFFIX
+    )),
+    # 2023-10-01
+    ('date', re.compile(
+        r'(?P<year>\d{4})-(?P<month>\d{1,2})-(?P<day>\d{1,2})$'
+    )),
+]
+
+# Abbreviations dateutil always resolves to UTC
+_UTC_NAMES = {'UTC', 'GMT', 'Z'}
+
+
+class TimestampParser:
+    """
+    Timestamp parser that learns the layout of a file from its first records.
+
+    dateutil re-guesses the format of every string, which dominates the
+    cost of normalization. Exports normally use one format throughout, so
+    this parser matches the first records against CANDIDATE_FORMATS, keeps
+    the first layout that agrees with dateutil, and parses later records
+    with that single precompiled regex. Strings that don't match (or that
+    the fast path can't reproduce exactly) fall back to dateutil.
+
+    Use one parser per file: `hits` and `misses` count the records parsed
+    on the fast path and by dateutil respectively.
+
+    Example:
+        parser = TimestampParser()
+        dt = parser.parse("2023-10-01 14:00:00 PST")  # naive 14:00, like dateutil
+        parser.stats()  # {'format': 'iso', 'hits': 1, 'misses': 0}
+    """
+
+    def __init__(self, learn_limit=10, format_name=None):
+        """
+        Args:
+            learn_limit (int): How many records to try learning a format
+                from before giving up and using dateutil for the whole file
+            format_name (str): Start with this CANDIDATE_FORMATS layout,
+                e.g. one learned by another parser, instead of learning
+        """
+        self.format_name = format_name
+        self.hits = 0
+        self.misses = 0
+        self._pattern = dict(CANDIDATE_FORMATS)[format_name] if format_name else None
+        self._learn_remaining = learn_limit
+        # Abbreviation -> 'utc', 'naive' or None (let dateutil decide)
+        self._abbrev_kinds = {}
+
+    def parse(self, text):
+        """Parse a timestamp string the same way dateutil.parser.parse() would."""
+        if self._pattern is None and self._learn_remaining > 0:
+            self._learn(text)
+
+        if self._pattern is not None:
+            match = self._pattern.match(text)
+            if match is not None:
+                dt = self._build(match)
+                if dt is not None:
+                    self.hits += 1
+                    return dt
+
+        self.misses += 1
+        # dateutil is slow to import, so it's only loaded once a file
+        # actually needs parsing (reading a --store never does)
+        from dateutil import parser as dateutil_parser
+        return dateutil_parser.parse(text)
+
+    def learn(self, texts):
+        """
+        Learn the format from sample strings, as parse() would on them,
+        without counting them as hits or misses.
+
+        Returns:
+            str: The learned format name, or None
+        """
+        for text in texts:
+            if self._pattern is not None or self._learn_remaining <= 0:
+                break
+            self._learn(text)
+        return self.format_name
+
+    def stats(self):
+        """Return the learned format name and hit/miss counts as a dict."""
+        return {'format': self.format_name, 'hits': self.hits, 'misses': self.misses}
+
+    def _learn(self, text):
+        # Adopt the first candidate whose result agrees with dateutil
+        self._learn_remaining -= 1
+        from dateutil import parser as dateutil_parser
+        try:
+            expected = dateutil_parser.parse(text)
+        except (ValueError, OverflowError):
+            return
+
+        for name, pattern in CANDIDATE_FORMATS:
+            match = pattern.match(text)
+            if match is None:
+                continue
+            dt = self._build(match)
+            if dt is not None and _same_moment(dt, expected):
+                self.format_name = name
+                self._pattern = pattern
+                return
+
+    def _build(self, match):
+        """Build a datetime from a regex match, or None to defer to dateutil."""
+        groups = match.groupdict()
+        tzinfo = None
+
+        if groups.get('zulu'):
+            tzinfo = timezone.utc
+        elif groups.get('offset'):
+            offset = groups['offset'].replace(':', '')
+            minutes = int(offset[1:3]) * 60 + int(offset[3:5])
+            if offset[0] == '-':
+                minutes = -minutes
+            tzinfo = timezone(timedelta(minutes=minutes))
+        elif groups.get('abbrev'):
+            kind = self._abbrev_kind(groups['abbrev'])
+            if kind is None:
+                return None
+            if kind == 'utc':
+                tzinfo = timezone.utc
+
+        fraction = groups.get('fraction')
+        try:
+            return datetime(
+                int(groups['year']), int(groups['month']), int(groups['day']),
+                int(groups.get('hour') or 0), int(groups.get('minute') or 0),
+                int(groups.get('second') or 0),
+                int(fraction.ljust(6, '0')) if fraction else 0,
+                tzinfo=tzinfo,
+            )
+        except ValueError:
+            # e.g. 13/7/2025, which dateutil reads day-first
+            return None
+
+    def _abbrev_kind(self, abbrev):
+        # dateutil ignores unknown tz abbreviations (returning a naive
+        # datetime), but treats month/weekday/AM-PM words and the machine's
+        # own zone names specially, so those always go through dateutil
+        if abbrev not in self._abbrev_kinds:
+            from dateutil import parser as dateutil_parser
+            info = dateutil_parser.parserinfo()
+            if abbrev in _UTC_NAMES:
+                kind = 'utc'
+            elif (abbrev in time.tzname or info.jump(abbrev) or info.ampm(abbrev) is not None
+                    or info.month(abbrev) is not None or info.weekday(abbrev) is not None
+                    or info.hms(abbrev) is not None or info.pertain(abbrev)):
+                kind = None
+            else:
+                kind = 'naive'
+            self._abbrev_kinds[abbrev] = kind
+        return self._abbrev_kinds[abbrev]
+
+
+def _same_moment(dt, expected):
+    """Compare two datetimes that are either both naive or both aware."""
+    if (dt.tzinfo is None) != (expected.tzinfo is None):
+        return False
+    return dt == expected
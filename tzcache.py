@@ -0,0 +1,111 @@
+from bisect import bisect_right
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+import pytz
+
+
+SECONDS_PER_DAY = 86400
+
+# to_seconds() of 1970-01-01, for converting to and from Unix epoch seconds
+UNIX_EPOCH_SECONDS = 719163 * SECONDS_PER_DAY
+
+# Wall-clock shift pytz uses to step out of a non-existent (skipped) hour
+_SKIP_SHIFT = 6 * 3600
+
+
+def to_seconds(dt):
+    """Seconds since 0001-01-01 for a naive datetime (microseconds dropped)."""
+    return dt.toordinal() * SECONDS_PER_DAY + dt.hour * 3600 + dt.minute * 60 + dt.second
+
+
+def from_seconds(seconds, microsecond=0, tzinfo=None):
+    """Inverse of to_seconds(), optionally attaching a tzinfo."""
+    days, rest = divmod(seconds, SECONDS_PER_DAY)
+    hour, rest = divmod(rest, 3600)
+    minute, second = divmod(rest, 60)
+    day = date.fromordinal(days)
+    return datetime(day.year, day.month, day.day, hour, minute, second, microsecond, tzinfo=tzinfo)
+
+
+class OffsetTable:
+    """
+    Integer UTC-offset lookup table for one pytz timezone.
+
+    pytz.localize() and astimezone() redo the same DST lookup for every
+    record and allocate several datetimes along the way. This table keeps
+    the zone's transition list as plain integers (seconds since 0001-01-01)
+    so converting a timestamp is a couple of bisects plus integer math.
+
+    local_to_utc() follows pytz's localize(dt) (is_dst=False) step by step,
+    so ambiguous and non-existent wall times around DST changes resolve to
+    exactly the same UTC instant pytz would give.
+    """
+
+    def __init__(self, tz):
+        """
+        Args:
+            tz: A pytz timezone (pytz.UTC, a StaticTzInfo or a DstTzInfo)
+        """
+        transitions = getattr(tz, '_utc_transition_times', None)
+        if transitions:
+            self._transitions = [to_seconds(t) for t in transitions]
+            self._offsets = [int(info[0].total_seconds()) for info in tz._transition_info]
+            self._dst = [bool(info[1]) for info in tz._transition_info]
+        else:
+            # Fixed-offset zone: one entry covering all of time
+            offset = tz.utcoffset(datetime(2000, 1, 1)) if tz is not pytz.UTC else timedelta(0)
+            self._transitions = [to_seconds(datetime.min)]
+            self._offsets = [int(offset.total_seconds())]
+            self._dst = [False]
+
+    def _index(self, utc_seconds):
+        # Same as pytz: max(0, bisect_right(_utc_transition_times, dt) - 1)
+        return max(0, bisect_right(self._transitions, utc_seconds) - 1)
+
+    def utc_offset(self, utc_seconds):
+        """UTC offset in seconds in effect at a UTC instant."""
+        return self._offsets[self._index(utc_seconds)]
+
+    def local_to_utc(self, wall_seconds):
+        """
+        Convert a naive local wall time to UTC, matching pytz.localize(dt).
+
+        Args:
+            wall_seconds (int): Local wall time as to_seconds(naive_dt)
+
+        Returns:
+            int: The UTC instant as seconds since 0001-01-01
+        """
+        if len(self._offsets) == 1:
+            return wall_seconds - self._offsets[0]
+
+        # Candidate offsets from one day either side, each kept only if
+        # converting back to local time gives the same wall time
+        candidates = {}  # utc -> is_dst
+        for delta in (-SECONDS_PER_DAY, SECONDS_PER_DAY):
+            utc = wall_seconds - self._offsets[self._index(wall_seconds + delta)]
+            idx = self._index(utc)
+            if utc + self._offsets[idx] == wall_seconds:
+                candidates[utc] = self._dst[idx]
+
+        if len(candidates) == 1:
+            return next(iter(candidates))
+
+        # Non-existent time (clocks jumped forward): pytz winds the clock
+        # back and uses the offset from before the transition
+        if not candidates:
+            return self.local_to_utc(wall_seconds - _SKIP_SHIFT) + _SKIP_SHIFT
+
+        # Ambiguous time (clocks wound back): prefer standard time, and
+        # otherwise take the latest UTC instant, as pytz does for is_dst=False
+        standard = [utc for utc, is_dst in candidates.items() if not is_dst]
+        if len(standard) == 1:
+            return standard[0]
+        return max(standard or candidates)
+
+
+@lru_cache(maxsize=None)
+def get_offset_table(tz_name):
+    """Return the cached OffsetTable for an IANA timezone name."""
+    tz = pytz.UTC if tz_name == 'UTC' else pytz.timezone(tz_name)
+    return OffsetTable(tz)
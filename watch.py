@@ -0,0 +1,150 @@
+"""
+Incremental analysis of append-only NDJSON sources.
+
+HealthWatcher keeps the merged days and the calculate_correlations()
+summary in memory and brings them up to date from whatever was appended
+to the sleep and workout files since the last poll:
+
+    1. NDJSONTail reads from the byte offset it stopped at, so only new
+       complete lines are read and decoded.
+    2. Only those records are normalized, into compact projected records
+       holding just the merged fields. Each file keeps its own
+       TimestampParser so the learned format carries over between polls.
+    3. merger.DayIndex, the per-date grouping merge_datasets() itself
+       uses (last sleep of a day wins, workouts are summed), applies them
+       and reports which days changed.
+    4. Each changed day's old row is removed from the summary and its new
+       row added, using SummaryAccumulator.remove()/add().
+
+So a poll costs time in proportion to the new records and the days they
+touch, not to the size of the history.
+"""
+
+import json
+import os
+
+from analyzer import SummaryAccumulator
+from merger import SLEEP_FIELDS, WORKOUT_FIELDS, DayIndex
+from normalizer import iter_normalize_to_utc
+from timestamps import TimestampParser
+
+
+class NDJSONTail:
+    """
+    Read records appended to an NDJSON file since the last read.
+
+    The file may not exist yet (it's read as empty until it does). A
+    trailing line without a newline is left for the next read, since the
+    writer may still be in the middle of it.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.offset = 0
+
+    def read_new(self):
+        """
+        Decode the complete lines appended since the last call.
+
+        Returns:
+            list: New records, in file order
+
+        Raises:
+            ValueError: If the file got shorter, i.e. it isn't append-only
+        """
+        try:
+            size = os.path.getsize(self.path)
+        except FileNotFoundError:
+            return []
+        if size < self.offset:
+            raise ValueError(f"{self.path} shrank from {self.offset} to {size} bytes; "
+                             "watched files must be append-only")
+        if size == self.offset:
+            return []
+
+        with open(self.path, 'rb') as f:
+            f.seek(self.offset)
+            data = f.read(size - self.offset)
+        end = data.rfind(b'\n') + 1
+        # Decode before moving on, so a bad line is read again next time
+        records = [json.loads(line) for line in data[:end].splitlines() if line.strip()]
+        self.offset += end
+        return records
+
+
+class HealthWatcher:
+    """
+    Follow a sleep and a workout NDJSON file and keep the summary current.
+
+    Listeners are called with (results, changed_dates) after every poll
+    that changed at least one day, where results is the
+    calculate_correlations() dict; that is the hook for publishing it.
+
+    Example:
+        watcher = HealthWatcher('sleep.ndjson', 'workouts.ndjson', 'America/Los_Angeles',
+                                listeners=[lambda results, changed: print(results)])
+        while True:
+            watcher.poll()
+            time.sleep(1)
+    """
+
+    def __init__(self, sleep_file, workouts_file, local_time_zone, low_sleep_threshold=6.0, listeners=()):
+        self.index = DayIndex()
+        self.summary = SummaryAccumulator(low_sleep_threshold, quantiles=False)
+        self.listeners = list(listeners)
+        # Sleep timestamps are read as UTC, as in load_and_merge_data()
+        self._sources = [
+            (NDJSONTail(sleep_file), 'UTC', SLEEP_FIELDS, TimestampParser(), self.index.add_sleep),
+            (NDJSONTail(workouts_file), local_time_zone, WORKOUT_FIELDS, TimestampParser(), self.index.add_workout),
+        ]
+
+    def add_listener(self, callback):
+        """Call callback(results, changed_dates) after each poll that changes something."""
+        self.listeners.append(callback)
+
+    def poll(self):
+        """
+        Apply everything appended since the last poll.
+
+        Every new line is decoded and normalized before anything is
+        applied. If one of them fails, the summary is left as it was and
+        the files are rewound, so the same lines are read again by the
+        next poll.
+
+        Returns:
+            list: The dates (ISO strings) whose rows changed, sorted
+        """
+        offsets = [tail.offset for tail, *_ in self._sources]
+        batches = []
+        try:
+            for tail, source_tz, fields, parser, apply in self._sources:
+                batches.append((list(iter_normalize_to_utc(tail.read_new(), source_tz, parser, fields)), apply))
+        except Exception:
+            for (tail, *_), offset in zip(self._sources, offsets):
+                tail.offset = offset
+            raise
+
+        changed = set()
+        for records, apply in batches:
+            for record in records:
+                date_key = record['local_date'].isoformat()
+                # Retract a day's old contribution once, before its first change
+                if date_key not in changed:
+                    if date_key in self.index:
+                        self.summary.remove(self.index.row(date_key))
+                    changed.add(date_key)
+                apply(record)
+
+        for date_key in changed:
+            self.summary.add(self.index.row(date_key))
+
+        changed = sorted(changed)
+        if changed:
+            results = self.results()
+            for listener in self.listeners:
+                listener(results, changed)
+        return changed
+
+    def results(self):
+        """The current calculate_correlations() results."""
+        return self.summary.results()
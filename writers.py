@@ -0,0 +1,107 @@
+"""
+Streaming output writers for merged daily rows.
+
+Each writer takes any iterable of row dicts (a list, or a generator such
+as merger.iter_merge_columns()) and writes every row as soon as it gets
+it, so the first line comes out before the last row even exists.
+"""
+
+import csv
+import json
+import sys
+from itertools import islice
+
+
+OUTPUT_FORMATS = ('table', 'ndjson', 'csv')
+
+
+def write_ndjson(rows, out=None):
+    """
+    Write one JSON object per line.
+
+    Returns:
+        int: Number of rows written
+    """
+    out = out or sys.stdout
+    count = 0
+    for row in rows:
+        out.write(json.dumps(row) + '\n')
+        count += 1
+    return count
+
+
+def write_csv(rows, out=None):
+    """
+    Write rows as CSV, with a header taken from the first row's keys.
+
+    None is written as an empty cell.
+
+    Returns:
+        int: Number of rows written
+    """
+    out = out or sys.stdout
+    rows = iter(rows)
+    first = next(rows, None)
+    if first is None:
+        return 0
+    writer = csv.DictWriter(out, fieldnames=list(first), lineterminator='\n')
+    writer.writeheader()
+    writer.writerow(first)
+    count = 1
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+    return count
+
+
+def write_table(rows, out=None, page_size=0):
+    """
+    Write rows as grid tables of page_size rows each.
+
+    tabulate has to see every cell of a table before it can size the
+    columns, so a single table buffers all rows. Each page is sized on
+    its own instead, which keeps memory and time to first output bounded
+    by the page size.
+
+    Args:
+        rows (iterable): Row dicts
+        out (file): Where to write; defaults to stdout
+        page_size (int): Rows per table; 0 puts everything in one table
+
+    Returns:
+        int: Number of rows written
+    """
+    from tabulate import tabulate
+
+    out = out or sys.stdout
+    rows = iter(rows)
+    count = 0
+    while True:
+        page = list(islice(rows, page_size)) if page_size > 0 else list(rows)
+        if not page and count:
+            break
+        out.write(tabulate(page, headers="keys", tablefmt="grid") + '\n')
+        out.flush()
+        count += len(page)
+        if page_size <= 0 or len(page) < page_size:
+            break
+    return count
+
+
+def write_rows(rows, output_format='table', out=None, page_size=0):
+    """
+    Write rows in one of OUTPUT_FORMATS.
+
+    Returns:
+        int: Number of rows written
+
+    Raises:
+        ValueError: If output_format isn't one of OUTPUT_FORMATS
+    """
+    if output_format == 'ndjson':
+        return write_ndjson(rows, out)
+    if output_format == 'csv':
+        return write_csv(rows, out)
+    if output_format == 'table':
+        return write_table(rows, out, page_size)
+    raise ValueError(f"Unknown output format {output_format!r}; use one of: {', '.join(OUTPUT_FORMATS)}")